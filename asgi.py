@@ -0,0 +1,274 @@
+# asgi.py
+"""
+Mode asynchrone (ASGI) du chat : même logique que server.py, mais l'attente
+de Tavily ne bloque aucun thread, donc un seul process peut garder des milliers
+de recherches lentes en parallèle.
+
+    pip install uvicorn aiohttp
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+L'appli Flask (server.py) reste disponible telle quelle.
+"""
+import asyncio
+import json
+import os
+import time
+
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import image_proxy
+import image_select
+import metrics
+import tracing
+
+from server import (
+    pipeline,
+    sse_event,
+    stream_local_events,
+    stream_web_events,
+    sessions,
+    SESSION_COOKIE,
+    SESSION_IDLE_TIMEOUT,
+)
+from web_search import aclose_async_session, cache_stats, warm_up_async
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    more = True
+    while more:
+        message = await receive()
+        body += message.get("body", b"")
+        more = message.get("more_body", False)
+    return body
+
+
+def _cookie(scope, name: str):
+    for key, value in scope.get("headers", []):
+        if key == b"cookie":
+            cookie = SimpleCookie()
+            try:
+                cookie.load(value.decode("latin-1"))
+            except Exception:
+                return None
+            if name in cookie:
+                return cookie[name].value
+    return None
+
+
+async def _send(send, status: int, body: bytes, content_type: str, headers: list | None = None):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ] + (headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, data: dict, status: int = 200, headers: list | None = None):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    await _send(send, status, body, "application/json", headers)
+
+
+async def _read_message(scope, receive, send):
+    """Lit {"message": ...} ; renvoie (texte, session, en-tête Set-Cookie) ou None si la requête est invalide."""
+    try:
+        data = json.loads(await _read_body(receive) or b"{}")
+    except ValueError:
+        await _send_json(send, {"error": "invalid json"}, 400)
+        return None
+
+    user_text = (data.get("message") or "").strip()
+    if not user_text:
+        await _send_json(send, {"error": "empty message"}, 400)
+        return None
+
+    session = sessions.get(_cookie(scope, SESSION_COOKIE) or data.get("session_id"))
+    set_cookie = (
+        f"{SESSION_COOKIE}={session.id}; Max-Age={int(SESSION_IDLE_TIMEOUT)}; "
+        "Path=/; HttpOnly; SameSite=Lax"
+    )
+    return user_text, session, (b"set-cookie", set_cookie.encode("latin-1"))
+
+
+async def chat(scope, receive, send):
+    t0 = time.perf_counter()
+    with metrics.CHAT_IN_FLIGHT.track(endpoint="chat"), tracing.trace("chat", endpoint="chat"):
+        await _chat(scope, receive, send)
+    metrics.CHAT_LATENCY.observe(time.perf_counter() - t0, endpoint="chat")
+
+
+async def _chat(scope, receive, send):
+    message = await _read_message(scope, receive, send)
+    if message is None:
+        return
+    user_text, session, cookie_header = message
+
+    # verrou asyncio : un seul tour à la fois par visiteur, sans bloquer la boucle
+    async with session.alock:
+        turn = await pipeline.run_async(user_text, session.state)
+
+    headers = [cookie_header, (b"server-timing", turn.server_timing().encode("latin-1"))]
+    trace_id = tracing.current_trace_id()
+    if trace_id is not None:
+        headers.append((b"x-trace-id", trace_id.encode("latin-1")))
+    with tracing.span("serialize"):
+        body = json.dumps(turn.response, ensure_ascii=False).encode("utf-8")
+    await _send(send, 200, body, "application/json", headers)
+
+
+async def chat_stream(scope, receive, send):
+    """Version Server-Sent Events de /api/chat (voir server.chat_stream)."""
+    t0 = time.perf_counter()
+    with metrics.CHAT_IN_FLIGHT.track(endpoint="stream"), tracing.trace("chat", endpoint="stream"):
+        await _chat_stream(scope, receive, send)
+    metrics.CHAT_LATENCY.observe(time.perf_counter() - t0, endpoint="stream")
+
+
+async def _chat_stream(scope, receive, send):
+    message = await _read_message(scope, receive, send)
+    if message is None:
+        return
+    user_text, session, cookie_header = message
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            cookie_header,
+        ],
+    })
+
+    async def emit(*events: str):
+        for event in events:
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+
+    async with session.alock:
+        state = session.state
+        turn = pipeline.start(user_text, state)
+        if turn.response is None:
+            await emit(
+                sse_event("intent", {"intent": turn.intent, "is_image_query": turn.is_image_query}),
+                sse_event("searching", {}),
+            )
+            result = await pipeline.search_async(turn)
+            await emit(*stream_web_events(pipeline.finish(turn, result, state)))
+        elif turn.response["mode"] == "local":
+            await emit(*stream_local_events(turn))
+        else:
+            # déjà connue (knowledge.py) : pas de recherche
+            await emit(
+                sse_event("intent", {"intent": turn.intent, "is_image_query": turn.is_image_query}),
+                *stream_web_events(turn.response),
+            )
+
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def admin_profile(scope, receive, send):
+    """Voir server.admin_profile (jeton dans l'en-tête X-Admin-Token)."""
+    if not tracing.ADMIN_TOKEN:
+        await _send_json(send, {"error": "not found"}, 404)
+        return
+    if not tracing.check_admin(_header(scope, b"x-admin-token")):
+        await _send_json(send, {"error": "forbidden"}, 403)
+        return
+    if scope["method"] == "POST":
+        try:
+            data = json.loads(await _read_body(receive) or b"{}")
+            n = int(data.get("requests", 20))
+        except (ValueError, TypeError, AttributeError):
+            await _send_json(send, {"error": "requests doit être un entier"}, 400)
+            return
+        await _send_json(send, tracing.profile_next(n))
+        return
+    await _send_json(send, tracing.stats())
+
+
+def _header(scope, name: bytes):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def image(scope, receive, send):
+    """Miniature d'une image (voir server.image) ; le téléchargement tourne dans un thread."""
+    params = {k: v[0] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+    try:
+        url = image_proxy.decode_request(params.get("u", ""), params.get("s", ""), params.get("sig", ""))
+    except image_proxy.ImageError as e:
+        await _send_json(send, {"error": str(e)}, e.status)
+        return
+
+    size = params["s"]
+    headers = image_proxy.cache_headers(image_proxy.etag_for(url, size))
+    raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]
+    if _header(scope, b"if-none-match") == headers["ETag"]:
+        await send({"type": "http.response.start", "status": 304, "headers": raw_headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+
+    try:
+        data = await asyncio.to_thread(image_proxy.get_thumbnail, url, size)
+    except image_proxy.ImageError as e:
+        await _send_json(send, {"error": str(e)}, e.status, [(b"cache-control", b"public, max-age=300")])
+        return
+    await _send(send, 200, data, image_proxy.content_type_of(data), raw_headers)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.ensure_future(warm_up_async())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aclose_async_session()
+            await image_select.aclose_async_session()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    method = scope["method"]
+
+    if path == "/api/chat" and method == "POST":
+        await chat(scope, receive, send)
+    elif path == "/api/chat/stream" and method == "POST":
+        await chat_stream(scope, receive, send)
+    elif path == "/api/cache" and method == "GET":
+        await _send_json(send, cache_stats())
+    elif path == "/api/admin/profile" and method in ("GET", "POST"):
+        await admin_profile(scope, receive, send)
+    elif path == "/metrics" and method == "GET":
+        await _send(send, 200, metrics.render().encode("utf-8"), metrics.CONTENT_TYPE)
+    elif path == "/api/pipeline" and method == "GET":
+        await _send_json(send, pipeline.stats())
+    elif path == "/api/sessions" and method == "GET":
+        await _send_json(send, sessions.stats())
+    elif path == "/api/image" and method == "GET":
+        await image(scope, receive, send)
+    elif path == "/api/image/cache" and method == "GET":
+        await _send_json(send, {**image_proxy.cache_stats(), "probes": image_select.stats()})
+    elif path in ("/", "/index.html") and method in ("GET", "HEAD"):
+        with open(INDEX_PATH, "rb") as f:
+            await _send(send, 200, f.read(), "text/html; charset=utf-8")
+    else:
+        await _send_json(send, {"error": "not found"}, 404)
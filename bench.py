@@ -0,0 +1,1756 @@
+# bench.py
+"""
+Petits benchmarks de Boty AI, contre un faux Tavily local (fake_tavily.py).
+
+    python bench.py transport --calls 200
+    python bench.py singleflight --clients 50
+    python bench.py asgi --requests 1000 --latency 1.0
+    python bench.py ttfb --latency 1.0
+    python bench.py intent --messages 200000
+    python bench.py micro --save bench-baseline.json
+    python bench.py micro --compare bench-baseline.json --threshold 0.2
+    python bench.py pipeline --messages 2000 --latency 0.05
+    python bench.py knowledge --messages 5000
+    python bench.py cachekeys --messages 20000 --visitors 200
+    python bench.py profiles --messages 2000
+    python bench.py deadline --queries 300
+    python bench.py circuit --clients 20 --outage errors
+    python bench.py metrics --threads 8
+    python bench.py tracing --messages 20000
+    python bench.py calc
+    python bench.py image
+    python bench.py images --queries 40
+    python bench.py tk-soak --answers 3000     (appli Tk : il faut un affichage)
+    python bench.py tk-transcript --messages 10000
+    python bench.py tk-resize --messages 2000
+
+Les benchmarks mesurent (durées, appels Tavily, taux de hit) ; les
+vérifications de comportement sont des tests : python -m pytest -q (tests/).
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+
+import requests
+
+import web_search
+from fake_tavily import FakeTavily
+
+
+def _report(label: str, timings: list[float]):
+    timings = sorted(timings)
+    n = len(timings)
+    p50 = timings[n // 2]
+    p95 = timings[min(n - 1, int(n * 0.95))]
+    print(
+        f"{label:<28} n={n:<5} moy={statistics.mean(timings) * 1000:7.2f} ms  "
+        f"p50={p50 * 1000:7.2f} ms  p95={p95 * 1000:7.2f} ms"
+    )
+
+
+# ---------- transport : avec / sans pool de connexions ----------
+
+def cmd_transport(args):
+    with FakeTavily(latency=args.latency, certfile=args.tls_cert, keyfile=args.tls_key) as fake:
+        verify = args.tls_cert or True
+        payload = {"query": "recette de cookies"}
+
+        # 1) sans pool : requests.post nu, une nouvelle connexion à chaque appel
+        timings = []
+        for _ in range(args.calls):
+            t0 = time.perf_counter()
+            requests.post(fake.url, json=payload, timeout=15, verify=verify).json()
+            timings.append(time.perf_counter() - t0)
+        _report("sans pool (requests.post)", timings)
+        print(f"{'':<28} connexions ouvertes : {fake.connection_count}")
+
+        # 2) avec la Session partagée de web_search (pré-connectée)
+        fake.reset_counters()
+        web_search.TAVILY_ENDPOINT = fake.url
+        web_search.reset_session()
+        session = web_search.get_session()
+        web_search.warm_up(background=False)
+
+        timings = []
+        for _ in range(args.calls):
+            t0 = time.perf_counter()
+            session.post(fake.url, json=payload, timeout=15, verify=verify).json()
+            timings.append(time.perf_counter() - t0)
+        _report("avec pool (Session)", timings)
+        print(f"{'':<28} connexions ouvertes : {fake.connection_count}")
+        web_search.reset_session()
+
+
+# ---------- single-flight : N requêtes /api/chat identiques -> 1 appel Tavily ----------
+
+def _start_flask(app):
+    import logging
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    httpd = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f"http://127.0.0.1:{httpd.server_port}"
+
+
+def _concurrent_chat(base_url: str, message: str, clients: int) -> list[dict]:
+    barrier = threading.Barrier(clients)
+    replies: list[dict] = [None] * clients
+
+    def worker(i):
+        barrier.wait()
+        r = requests.post(f"{base_url}/api/chat", json={"message": message}, timeout=60)
+        replies[i] = r.json()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return replies
+
+
+def cmd_singleflight(args):
+    import server
+
+    message = "c'est quoi la photosynthèse"
+    with FakeTavily(latency=args.latency) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+        httpd, base_url = _start_flask(server.app)
+        try:
+            # 1) succès : tout le monde reçoit la même réponse
+            web_search.cache.clear()
+            replies = _concurrent_chat(base_url, message, args.clients)
+            texts = {r.get("text") for r in replies}
+            print(f"succès : {args.clients} clients -> {fake.request_count} appel(s) Tavily, "
+                  f"{len(texts)} réponse(s) distincte(s)")
+
+            # 2) erreur amont : propagée à tous, toujours un seul appel, rien en cache
+            fake.reset_counters()
+            fake.status = 500
+            web_search.cache.clear()
+            replies = _concurrent_chat(base_url, message, args.clients)
+            errors = sum(1 for r in replies if (r.get("text") or "").startswith("Erreur Tavily 500"))
+            print(f"erreur  : {args.clients} clients -> {fake.request_count} appel(s) Tavily, "
+                  f"{errors} erreur(s) propagée(s)")
+            fake.status = 200
+
+            # 3) attente trop longue : les suiveurs abandonnent, le leader termine
+            fake.reset_counters()
+            web_search.cache.clear()
+            old_wait = web_search.SINGLEFLIGHT_WAIT
+            web_search.SINGLEFLIGHT_WAIT = args.latency / 5
+            replies = _concurrent_chat(base_url, message, args.clients)
+            web_search.SINGLEFLIGHT_WAIT = old_wait
+            timeouts = sum(1 for r in replies if "délai dépassé" in (r.get("text") or ""))
+            print(f"timeout : {args.clients} clients -> {fake.request_count} appel(s) Tavily, "
+                  f"{timeouts} suiveur(s) en timeout")
+        finally:
+            httpd.shutdown()
+
+
+# ---------- Flask (threads) vs ASGI (asyncio) sous charge ----------
+# Chaque serveur tourne dans son propre process (comme en prod), sinon le faux
+# Tavily, le serveur testé et le générateur de charge se partagent le même GIL.
+
+def _serve_pooled_flask(app, port: int, threads: int):
+    """Flask derrière un serveur WSGI à nombre de threads fixe (comme gunicorn --threads)."""
+    import logging
+    from concurrent.futures import ThreadPoolExecutor
+    from werkzeug.serving import BaseWSGIServer
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    class PooledServer(BaseWSGIServer):
+        request_queue_size = 4096
+
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            self._pool = ThreadPoolExecutor(max_workers=threads)
+
+        def process_request(self, request, client_address):
+            self._pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    httpd = PooledServer("127.0.0.1", port, app)
+    print(f"http://127.0.0.1:{httpd.server_port}", flush=True)
+    httpd.serve_forever()
+
+
+def _serve_uvicorn(app, port: int):
+    import socket
+    import uvicorn
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", port))
+    print(f"http://127.0.0.1:{sock.getsockname()[1]}", flush=True)
+    config = uvicorn.Config(app, log_level="warning", backlog=4096)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def cmd_serve(args):
+    """Sous-commande interne : lance un serveur pour cmd_asgi (1re ligne = URL)."""
+    if args.mode == "flask":
+        import server
+        _serve_pooled_flask(server.app, args.port, args.threads)
+    else:
+        import asgi
+        _serve_uvicorn(asgi.app, args.port)
+
+
+def _spawn(argv: list[str], env: dict | None = None):
+    """Lance un script Python et attend la 1re ligne (l'URL du serveur)."""
+    import subprocess
+
+    proc = subprocess.Popen(
+        [sys.executable] + argv,
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, **(env or {})},
+    )
+    url = proc.stdout.readline().strip()
+    return proc, url
+
+
+def _wait_http(url: str):
+    for _ in range(200):
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.05)
+
+
+def _load(base_url: str, n: int) -> tuple[float, list[float], int]:
+    """Envoie n requêtes /api/chat distinctes en même temps ; renvoie (durée, latences, erreurs)."""
+    import asyncio
+    import aiohttp
+
+    async def run():
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=300)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as client:
+            async def one(i):
+                t0 = time.perf_counter()
+                message = {"message": f"c'est quoi le sujet numéro {i}"}
+                async with client.post(f"{base_url}/api/chat", json=message) as r:
+                    data = await r.json()
+                ok = r.status == 200 and not data.get("text", "").startswith("Erreur")
+                return time.perf_counter() - t0, ok
+
+            t0 = time.perf_counter()
+            results = await asyncio.gather(*(one(i) for i in range(n)))
+            return time.perf_counter() - t0, results
+
+    wall, results = asyncio.run(run())
+    return wall, [r[0] for r in results], sum(1 for r in results if not r[1])
+
+
+def cmd_asgi(args):
+    fake, fake_url = _spawn(["fake_tavily.py", "--latency", str(args.latency)])
+    stats_url = fake_url.rsplit("/", 1)[0] + "/stats"
+    try:
+        modes = [
+            (f"flask ({args.threads} threads)", ["--mode", "flask", "--threads", str(args.threads)]),
+            ("asgi (uvicorn)", ["--mode", "asgi"]),
+        ]
+        for label, extra in modes:
+            before = requests.get(stats_url, timeout=5).json()["requests"]
+            srv, base_url = _spawn(["bench.py", "serve"] + extra, env={"TAVILY_ENDPOINT": fake_url})
+            try:
+                _wait_http(base_url + "/")
+                wall, timings, errors = _load(base_url, args.requests)
+            finally:
+                srv.terminate()
+                srv.wait()
+            upstream = requests.get(stats_url, timeout=5).json()["requests"] - before
+            _report(label, timings)
+            print(f"{'':<28} total={wall:6.2f} s  débit={args.requests / wall:7.1f} req/s  "
+                  f"erreurs={errors}  appels Tavily={upstream}")
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+# ---------- temps jusqu'au 1er octet : /api/chat vs /api/chat/stream ----------
+
+def cmd_ttfb(args):
+    import server
+
+    with FakeTavily(latency=args.latency) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+        httpd, base_url = _start_flask(server.app)
+        try:
+            for label, path in (("/api/chat", "/api/chat"), ("/api/chat/stream", "/api/chat/stream")):
+                first, total = [], []
+                for i in range(args.calls):
+                    web_search.cache.clear()
+                    message = {"message": f"c'est quoi le sujet numéro {i}"}
+                    t0 = time.perf_counter()
+                    with requests.post(base_url + path, json=message, stream=True, timeout=60) as r:
+                        chunks = r.iter_content(chunk_size=None)
+                        next(chunks)
+                        first.append(time.perf_counter() - t0)
+                        for _ in chunks:
+                            pass
+                    total.append(time.perf_counter() - t0)
+                _report(f"{label} 1er octet", first)
+                _report(f"{label} total", total)
+        finally:
+            httpd.shutdown()
+
+
+# ---------- corpus synthétique de messages en français ----------
+
+_SUJETS = [
+    "la photosynthèse", "napoléon", "la tour eiffel", "les trous noirs", "le python",
+    "la révolution française", "les volcans", "le chocolat", "la lune", "les dinosaures",
+    "le réchauffement climatique", "l'intelligence artificielle", "le covid", "minecraft",
+    "les impôts", "le bitcoin", "la coupe du monde", "les abeilles", "la 5g", "le sommeil",
+]
+_TEMPLATES = [
+    # smalltalk
+    "salut", "bonjour !", "slt ça va ?", "coucou toi", "yo", "hey boty", "ça va ?", "comment tu vas",
+    "wesh bien ou quoi", "bonjour, comment sa va aujourd'hui ?",
+    # heure
+    "quelle heure est-il ?", "il est quelle heure", "t'as l'heure stp",
+    # calculs
+    "combien fait {a}+{b}", "{a} x {b}", "ça fait combien {a}*{b}-{c}", "{a}/{b}", "({a}+{b})*{c} ?",
+    # recherche
+    "c'est quoi {s}", "c est quoi {s} ?", "qu'est-ce que {s}", "qui est {s}", "pourquoi {s} existe",
+    "comment fonctionne {s}", "explique moi {s}", "recette de cookies", "histoire de {s}",
+    "définition de {s}", "tuto pour installer {s}", "où se trouve {s} ?",
+    "je voudrais en savoir plus sur {s} et ses origines",
+    # suivis
+    "explique plus", "et pour {s} ?", "détaille stp", "développe un peu", "en détail",
+    # images
+    "montre moi une photo de {s}", "image de {s}", "le drapeau de la france", "logo de {s}",
+    "fond d'écran {s}", "en noir et blanc", "plus grande",
+    # vague
+    "ok", "merci", "mdr", "d'accord", "hmm", "non", "pas compris",
+]
+
+
+def _french_corpus(n: int, seed: int = 1) -> list[str]:
+    """Messages de chat réalistes (salutations, heure, calculs, recherches, suivis, images)."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        msg = rng.choice(_TEMPLATES).format(
+            s=rng.choice(_SUJETS), a=rng.randint(1, 999), b=rng.randint(1, 99), c=rng.randint(1, 9),
+        )
+        if rng.random() < 0.2:
+            msg = msg.capitalize()
+        out.append(msg)
+    return out
+
+
+# ---------- intent : matcher compilé vs ancienne version ----------
+
+def _legacy_detect_intent(text, state):
+    """Copie de l'ancienne brain.detect_intent (référence pour le benchmark et la non-régression)."""
+    import brain
+
+    t = text.lower().strip()
+    if state.last_answer:
+        if any(kw in t for kw in ["explique plus", "détaille", "en détail", "développe", "et pour"]):
+            return brain.INTENT_FOLLOWUP_MORE
+    if any(kw in t for kw in ["salut", "bonjour", "slt", "cc", "coucou", "yo", "wesh", "hey"]):
+        return brain.INTENT_SMALLTALK
+    if any(kw in t for kw in ["ça va", "ca va", "comment tu vas", "comment sa va"]):
+        return brain.INTENT_SMALLTALK
+    if any(kw in t for kw in ["heure", "il est quelle heure", "quelle heure est il", "quelle heure est-il"]):
+        return brain.INTENT_TIME
+    if re.search(r"\d", t) and re.search(r"[+\-*/x]", t):
+        return brain.INTENT_MATH
+    question_words = [
+        "comment ", "pourquoi", "c est quoi", "c'est quoi",
+        "qui est", "qu est ce que", "qu'est ce que", "qu'est-ce que",
+        "où ", "ou ", "recette", "histoire", "définition", "definition",
+        "tutoriel", "tuto", "explique", "explique moi"
+    ]
+    if any(kw in t for kw in question_words) or t.endswith("?"):
+        return brain.INTENT_RESEARCH
+    if len(t.split()) >= 4:
+        return brain.INTENT_RESEARCH
+    return brain.INTENT_OTHER
+
+
+def _per_message_cost(fn, corpus, state) -> float:
+    t0 = time.perf_counter()
+    for msg in corpus:
+        fn(msg, state)
+    return (time.perf_counter() - t0) / len(corpus)
+
+
+def cmd_intent(args):
+    import brain
+
+    corpus = _french_corpus(args.messages)
+    fresh = brain.ConversationState()
+    followup = brain.ConversationState(last_user_question="c'est quoi la lune", last_answer="...")
+
+    mismatches = 0
+    for state in (fresh, followup):
+        for msg in corpus:
+            if brain.detect_intent(msg, state) != _legacy_detect_intent(msg, state):
+                mismatches += 1
+    print(f"{len(corpus)} messages, {mismatches} intent(s) différent(s) de l'ancienne version")
+
+    for label, state in (("sans historique", fresh), ("avec historique", followup)):
+        before = min(_per_message_cost(_legacy_detect_intent, corpus, state) for _ in range(3))
+        after = min(_per_message_cost(brain.detect_intent, corpus, state) for _ in range(3))
+        print(f"{label:<16} avant={before * 1e6:6.2f} µs/msg  après={after * 1e6:6.2f} µs/msg  "
+              f"gain=x{before / after:.2f}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+# ---------- pipeline : durée de chaque étape d'un tour ----------
+
+def _print_stages(label: str, stats: dict):
+    print(f"{label} ({stats['turns']} tours)")
+    from pipeline import STAGES
+
+    for name in STAGES:
+        s = stats["stages"].get(name)
+        if s:
+            print(f"  {name:<8} n={s['count']:<6} moy={s['avg_ms']:9.3f} ms  max={s['max_ms']:9.3f} ms")
+
+
+def cmd_pipeline(args):
+    """Le même corpus à travers ChatPipeline : étapes locales seules, puis avec Tavily (faux) et le cache."""
+    from brain import ConversationState
+    from pipeline import ChatPipeline
+
+    corpus = _french_corpus(args.messages)
+    instant = {"summary": "ok", "sources": [], "images": []}
+
+    # 1) recherche instantanée, sans cache : le coût des étapes locales seules
+    pipe = ChatPipeline(cache=None, search=lambda q, **kw: instant)
+    state = ConversationState()
+    for msg in corpus:
+        pipe.run(msg, state)
+    _print_stages("étapes locales (recherche instantanée)", pipe.stats())
+
+    # 2) vrai search_web contre le faux Tavily : cache froid puis chaud
+    with FakeTavily(latency=args.latency) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+        web_search.cache.clear()
+        pipe = ChatPipeline()
+        for label in ("cache froid", "cache chaud"):
+            pipe.reset_stats()
+            fake.reset_counters()
+            state = ConversationState()
+            for msg in corpus[:args.web_messages]:
+                pipe.run(msg, state)
+            _print_stages(f"{label} (faux Tavily {args.latency * 1000:.0f} ms)", pipe.stats())
+            print(f"  appels Tavily : {fake.request_count}")
+    web_search.reset_session()
+
+
+# ---------- knowledge : appels web évités par la mémoire locale ----------
+
+def cmd_knowledge(args):
+    """Le corpus dans une conversation, mémoire locale (knowledge.py) désactivée puis activée."""
+    from brain import ConversationState
+    from pipeline import IMAGE_KEYWORDS, ChatPipeline
+
+    # sans les demandes d'image : après une image, les phrases courtes deviennent des précisions
+    # sur l'image (pipeline.IMAGE_FOLLOWUP_MAX_WORDS), jamais cherchées dans la mémoire
+    corpus = [m for m in _french_corpus(args.messages, seed=args.seed)
+              if not any(k in m.lower() for k in IMAGE_KEYWORDS)]
+    queries = []
+
+    def search(query, **kw):
+        queries.append(query)
+        return {"summary": f"résumé : {query}", "sources": [{"title": query, "url": "https://example.org"}],
+                "images": [], "freshness": "fresh"}
+
+    def subjects(text):
+        text = text.lower()
+        return {s for s in _SUJETS if s in text}
+
+    results = {}
+    for label, enabled in (("sans mémoire", False), ("avec mémoire", True)):
+        queries.clear()
+        pipe = ChatPipeline(cache=None, search=search, knowledge=enabled)
+        state = ConversationState()
+        modes = {}
+        wrong = 0
+        t0 = time.perf_counter()
+        for msg in corpus:
+            turn = pipe.run(msg, state)
+            mode = turn.response.get("mode")
+            modes[mode] = modes.get(mode, 0) + 1
+            if mode == "knowledge":
+                # la réponse resservie parle-t-elle des mêmes sujets que la requête de ce tour ?
+                answered = turn.response["sources"][0]["title"]
+                if subjects(answered) != subjects(turn.query):
+                    wrong += 1
+        elapsed = time.perf_counter() - t0
+        results[label] = len(queries)
+        print(f"{label:<14} appels web={len(queries):6d}  requêtes distinctes={len(set(queries)):5d}  "
+              f"modes={modes}  {elapsed / len(corpus) * 1e6:6.1f} µs/tour")
+        if enabled:
+            print(f"{'':<14} {state.knowledge.stats() if state.knowledge else {}}")
+            print(f"{'':<14} réponses resservies sur un autre sujet : {wrong}")
+            _print_stages("  étapes (avec mémoire)", pipe.stats())
+    before, after = results["sans mémoire"], results["avec mémoire"]
+    if before:
+        print(f"appels web évités : {before - after}/{before} ({(before - after) / before:.1%})")
+
+
+# ---------- cachekeys : clés de cache exactes / canoniques / quasi-doublons ----------
+
+def _typing_noise(text: str, rng: random.Random, rate: float) -> str:
+    """Variantes de frappe d'un message : sans accents, majuscule, ponctuation, lettres inversées."""
+    import unicodedata
+
+    if rng.random() >= rate:
+        return text
+    r = rng.random()
+    if r < 0.4:
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    elif r < 0.6:
+        text = text.upper() if rng.random() < 0.2 else text.capitalize()
+    elif r < 0.8:
+        text = text.rstrip(" ?!.") + rng.choice([" ?", "?", " !", "...", ""])
+    else:
+        i = rng.randrange(len(text) - 1) if len(text) > 1 else 0
+        text = text[:i] + text[i + 1:i + 2] + text[i:i + 1] + text[i + 2:]
+    return text
+
+
+def cmd_cachekeys(args):
+    """Requêtes Tavily d'un corpus rejoué (plusieurs visiteurs) : taux de hit du cache selon la clé."""
+    from brain import ConversationState
+    import difflib
+    from pipeline import ChatPipeline
+    import querykey
+
+    rng = random.Random(args.seed)
+    if args.input:
+        from replay import load_messages
+        messages = load_messages(args.input)
+    else:
+        messages = _french_corpus(args.messages, seed=args.seed)
+    messages = [_typing_noise(m, rng, args.noise) for m in messages]
+
+    # les requêtes que le pipeline enverrait à Tavily, visiteur par visiteur
+    pipe = ChatPipeline(cache=None, search=lambda q, **kw: {"summary": "", "sources": [], "images": []},
+                        knowledge=False)
+    states = [ConversationState() for _ in range(args.visitors)]
+    queries = []
+    for i, msg in enumerate(messages):
+        turn = pipe.run(msg, states[i % args.visitors])
+        if turn.query is not None:
+            queries.append(turn.query)
+
+    # sujets du corpus présents dans une requête, fautes de frappe comprises
+    subject_words = {s: querykey.keywords(s) for s in _SUJETS}
+    vocabulary = sorted(set().union(*subject_words.values()))
+    closest: dict[str, str] = {}
+
+    def subjects(text):
+        words = set()
+        for word in querykey.keywords(text):
+            if word not in closest:
+                match = difflib.get_close_matches(word, vocabulary, n=1, cutoff=0.8)
+                closest[word] = match[0] if match else word
+            words.add(closest[word])
+        return frozenset(s for s, needed in subject_words.items() if needed and needed <= words)
+
+    print(f"{len(messages)} messages, {args.visitors} visiteurs -> {len(queries)} requêtes web "
+          f"({len(set(queries))} chaînes distinctes)")
+    base = None
+    for mode in ("exact", "canonical", "near"):
+        querykey.reset_near()
+        t0 = time.perf_counter()
+        keys = [querykey.cache_query(q, mode) for q in queries]
+        per = (time.perf_counter() - t0) / len(queries) if queries else 0
+        first: dict[str, frozenset] = {}
+        hits = wrong = 0
+        for q, key in zip(queries, keys):
+            seen = first.get(key)
+            if seen is None:
+                first[key] = subjects(q)
+            else:
+                hits += 1
+                # résultat d'une requête sur un autre sujet ?
+                if seen != subjects(q):
+                    wrong += 1
+        rate = hits / len(queries) if queries else 0
+        base = rate if base is None else base
+        print(f"{mode:<10} hits={hits:6d} ({rate:6.1%}, {rate - base:+6.1%})  clés={len(first):6d}  "
+              f"autre sujet={wrong:4d}  {per * 1e6:6.1f} µs/clé")
+    print(f"quasi-doublons : {querykey.near_stats()}")
+
+
+# ---------- profiles : ce qu'on demande à Tavily selon l'intent ----------
+
+def _tavily_like_payload(rng: random.Random) -> dict:
+    """Réponse au format Tavily, de taille réaliste (10 résultats, images, textes de quelques centaines de mots)."""
+    words = "le la de des une pour avec dans est sont plus très cette comme aussi entre".split() + _SUJETS
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    return {
+        "query": "...",
+        "answer": text(80),
+        "images": [f"https://images.example.org/{i}/{rng.getrandbits(64):x}.jpg" for i in range(8)],
+        "results": [
+            {
+                "title": text(8),
+                "url": f"https://site{i}.example.org/{rng.getrandbits(64):x}",
+                "content": text(120),
+                "score": rng.random(),
+                "raw_content": None,
+            }
+            for i in range(10)
+        ],
+        "response_time": 1.2,
+    }
+
+
+def _rendered(turn) -> tuple:
+    """Ce que les interfaces affichent d'un tour web (résumé, 1re image ou 5 sources)."""
+    r = turn.response
+    if r["is_image_query"]:
+        return r["mode"], r["text"], r["images"][:1]
+    return r["mode"], r["text"], [s["url"] for s in r["sources"][:5]]
+
+
+def cmd_profiles(args):
+    """Le corpus à travers ChatPipeline contre un faux Tavily réaliste : profil "full" pour tout, puis par intent."""
+    import metrics
+    import querykey
+    from brain import ConversationState
+    from pipeline import ChatPipeline
+
+    corpus = _french_corpus(args.messages, seed=args.seed)
+    profiles = list(web_search.PROFILES)
+    rendered = {}
+    with FakeTavily(latency=args.latency, payload=_tavily_like_payload(random.Random(args.seed))) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+        for label, enabled in (("sans profils", False), ("avec profils", True)):
+            web_search.SEARCH_PROFILES_ENABLED = enabled
+            web_search.cache.clear()
+            querykey.reset_near()
+            fake.reset_counters()
+            before = {p: (metrics.SEARCH_LATENCY.value(profile=p), metrics.SEARCH_BYTES.value(profile=p))
+                      for p in profiles}
+            # pas de sondes d'images (URLs factices), pas de mémoire : seul le payload change
+            pipe = ChatPipeline(knowledge=False, select_images=None, select_images_async=None)
+            # des conversations courtes : dans une longue, tout finit en précision d'image
+            rendered[label] = []
+            for i, msg in enumerate(corpus):
+                if i % args.turns == 0:
+                    state = ConversationState()
+                turn = pipe.run(msg, state)
+                rendered[label].append(_rendered(turn) if turn.response["mode"] != "local" else None)
+
+            total_bytes = 0
+            print(f"{label} : {fake.request_count} appels Tavily")
+            for p in profiles:
+                (n0, t0), b0 = before[p]
+                (n1, t1), b1 = metrics.SEARCH_LATENCY.value(profile=p), metrics.SEARCH_BYTES.value(profile=p)
+                calls, nbytes = n1 - n0, b1 - b0
+                total_bytes += nbytes
+                if calls:
+                    print(f"  {p:<9} appels={calls:5d}  {nbytes / calls / 1024:6.2f} Ko/appel  "
+                          f"latence moy={(t1 - t0) / calls * 1000:6.2f} ms")
+            print(f"  total reçu : {total_bytes / 1024:8.1f} Ko")
+            rendered[label, "bytes"] = total_bytes
+
+        # coût du décodage d'une réponse (JSON + extraction), par profil
+        for p in profiles:
+            body = json.dumps(fake._shape(web_search._build_options(p)))
+            cost = min(_time_per_call(lambda: web_search._parse_response(json.loads(body), p), 2000)
+                       for _ in range(3))
+            print(f"  décodage {p:<9} {cost * 1e6:6.1f} µs  ({len(body) / 1024:5.2f} Ko)")
+    web_search.SEARCH_PROFILES_ENABLED = True
+    web_search.reset_session()
+
+    before, after = rendered["sans profils", "bytes"], rendered["avec profils", "bytes"]
+    diff = sum(a != b for a, b in zip(rendered["sans profils"], rendered["avec profils"]))
+    if before:
+        print(f"octets reçus : {before / 1024:.1f} Ko -> {after / 1024:.1f} Ko ({(before - after) / before:.1%} de moins)")
+    print(f"tours affichés différemment : {diff}")
+    if diff:
+        sys.exit(1)
+
+
+def _time_per_call(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+
+# ---------- deadline : budget de temps, hedge, réponse périmée ----------
+
+def _timed_searches(queries, deadline: float, search=None) -> tuple[list[float], dict]:
+    """Recherches une à une ; (durées, {fraîcheur: nombre})."""
+    from collections import Counter
+
+    search = search or web_search.search_web
+    timings, freshness = [], Counter()
+    for query in queries:
+        t0 = time.perf_counter()
+        result = search(query, deadline=time.monotonic() + deadline)
+        timings.append(time.perf_counter() - t0)
+        freshness[result.get("freshness") or "erreur"] += 1
+    return timings, dict(freshness)
+
+
+def _report_tail(label: str, timings: list[float], extra: str = ""):
+    timings = sorted(timings)
+    n = len(timings)
+    pct = {q: timings[min(n - 1, int(n * q))] * 1000 for q in (0.5, 0.95, 0.99)}
+    print(f"{label:<26} p50={pct[0.5]:7.1f} ms  p95={pct[0.95]:7.1f} ms  p99={pct[0.99]:7.1f} ms  "
+          f"max={timings[-1] * 1000:7.1f} ms  {extra}")
+
+
+def cmd_deadline(args):
+    import asyncio
+
+    from search_cache import SearchCache
+
+    old_cache, old_hedge = web_search.cache, web_search.HEDGE_ENABLED
+    with FakeTavily(latency=args.latency, latency_dist="lognormal", latency_sigma=0.3,
+                    slow_rate=args.slow_rate, slow_latency=args.slow_latency, seed=args.seed) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+
+        # 1) hedge : queue de latence avec / sans 2e requête (requêtes toutes différentes)
+        print(f"faux Tavily : ~{args.latency * 1000:.0f} ms, {args.slow_rate:.0%} des appels à "
+              f"{args.slow_latency:.1f} s ; {args.queries} recherches distinctes")
+        for hedge in (False, True):
+            web_search.cache = SearchCache(ttl=3600)
+            web_search.HEDGE_ENABLED = hedge
+            web_search.reset_search_stats()
+            # de quoi estimer le percentile avant de mesurer
+            _timed_searches([f"préchauffage {i + 100} {hedge}" for i in range(30)], args.deadline)
+            fake.reset_counters()
+            timings, freshness = _timed_searches(
+                [f"question numéro {i + 100} {hedge}" for i in range(args.queries)], args.deadline)
+            stats = web_search.cache_stats()["searches"]
+            _report_tail("avec hedge" if hedge else "sans hedge", timings,
+                         f"appels Tavily={fake.request_count}  {freshness}  seuil={stats['hedge_after_ms']} ms")
+        web_search.HEDGE_ENABLED = old_hedge
+
+        # 2) budget dépassé : réponse périmée tout de suite, cache rafraîchi en fond
+        queries = [f"sujet périmé {i + 100}" for i in range(args.stale_queries)]
+        for label in ("threads", "asyncio"):
+            web_search.cache = SearchCache(ttl=0.5, stale_ttl=3600)
+            fake.latency, fake.slow_rate, fake.latency_dist = 0.0, 0.0, "fixed"
+            _timed_searches(queries, args.deadline)
+            time.sleep(0.6)  # tout le cache a expiré
+            web_search.cache.ttl = 3600  # les réponses rafraîchies, elles, restent
+            fake.latency = args.deadline * 2
+            fake.reset_counters()
+            if label == "threads":
+                stale = _timed_searches(queries, args.deadline)
+                time.sleep(fake.latency + 0.5)  # les appels en fond terminent
+                fresh = _timed_searches(queries, args.deadline)
+            else:
+                stale, fresh = asyncio.run(_stale_then_fresh_async(queries, args.deadline, fake.latency + 0.5))
+            _report_tail(f"lent, périmé ({label})", stale[0], f"{stale[1]}")
+            _report_tail("après rafraîchissement", fresh[0], f"{fresh[1]}  appels Tavily={fake.request_count}")
+
+        # 3) Tavily en erreur : réponse périmée ; rien en cache : erreur au bout du budget
+        web_search.cache = SearchCache(ttl=0.5, stale_ttl=3600)
+        fake.latency = 0.0
+        _timed_searches(queries, args.deadline)
+        time.sleep(0.6)
+        fake.status = 500
+        _, freshness = _timed_searches(queries, args.deadline)
+        print(f"{'Tavily en erreur (500)':<26} {freshness}")
+        fake.status = 200
+        fake.latency = args.deadline * 2
+        timings, freshness = _timed_searches([f"jamais vu {i + 100}" for i in range(3)], args.deadline)
+        _report_tail("lent, rien en cache", timings, f"{freshness}")
+        fake.latency = 0.0
+
+    web_search.cache = old_cache
+    web_search.reset_session()
+
+
+async def _stale_then_fresh_async(queries, deadline: float, pause: float):
+    """Comme le scénario threads : une passe (réponses périmées), attente des appels en fond, une passe."""
+    import asyncio
+    from collections import Counter
+
+    async def one_pass():
+        timings, freshness = [], Counter()
+        for query in queries:
+            t0 = time.perf_counter()
+            result = await web_search.search_web_async(query, deadline=time.monotonic() + deadline)
+            timings.append(time.perf_counter() - t0)
+            freshness[result.get("freshness") or "erreur"] += 1
+        return timings, dict(freshness)
+
+    stale = await one_pass()
+    await asyncio.sleep(pause)
+    fresh = await one_pass()
+    await web_search.aclose_async_session()
+    return stale, fresh
+
+
+# ---------- circuit : disjoncteur devant un Tavily en panne ----------
+
+def _outage_load(clients: int, per_client: int, deadline: float, tag: str) -> tuple[list[float], dict]:
+    """`clients` visiteurs en parallèle, chacun `per_client` recherches distinctes ; (durées, fraîcheurs)."""
+    from collections import Counter
+
+    timings, freshness = [], Counter()
+    lock = threading.Lock()
+
+    def client(c):
+        t, f = _timed_searches([f"panne {tag} visiteur {c + 100} question {i + 100}" for i in range(per_client)],
+                               deadline)
+        with lock:
+            timings.extend(t)
+            freshness.update(f)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return timings, dict(freshness)
+
+
+def _trickle(duration: float, deadline: float, until: str | None = None) -> int:
+    """Une recherche toutes les 20 ms pendant `duration` (ou jusqu'à l'état `until`) ; nombre de tours."""
+    t0 = time.perf_counter()
+    turns = 0
+    while time.perf_counter() - t0 < duration and web_search.breaker.state != until:
+        web_search.search_web(f"en continu {turns + 100}", deadline=time.monotonic() + deadline)
+        turns += 1
+        time.sleep(0.02)
+    return turns
+
+
+def cmd_circuit(args):
+    import circuit
+    import metrics
+    from search_cache import SearchCache
+
+    old_cache, old_breaker, old_timeout = web_search.cache, web_search.breaker, web_search.SEARCH_TIMEOUT
+    web_search.SEARCH_TIMEOUT = args.timeout
+    web_search.reset_session()
+
+    def new_breaker(enabled: bool):
+        return circuit.CircuitBreaker("bench", enabled=enabled, window=10, min_calls=5,
+                                      slow_call=args.timeout * 0.8, open_for=args.open_for)
+
+    with FakeTavily(latency=0.05) as fake:
+        web_search.TAVILY_ENDPOINT = fake.url
+        if args.outage == "errors":
+            print(f"panne : Tavily répond 503 ; {args.clients} visiteurs x {args.per_client} recherches")
+        else:
+            print(f"panne : Tavily répond en {args.timeout * 2:.1f} s (timeout {args.timeout:.1f} s) ; "
+                  f"{args.clients} visiteurs x {args.per_client} recherches")
+
+        # 1) pendant la panne : sans / avec disjoncteur ; la moitié des questions a une réponse périmée
+        for enabled in (False, True):
+            web_search.cache = SearchCache(ttl=0.5, stale_ttl=3600)
+            # le remplissage (réussi) reste dans la fenêtre du disjoncteur, comme un trafic normal
+            # juste avant la panne : le taux d'erreur est dilué, les échecs d'affilée, non
+            web_search.breaker = new_breaker(enabled)
+            _outage_load(args.clients // 2, args.per_client, args.deadline, str(enabled))
+            time.sleep(0.6)
+            if args.outage == "errors":
+                fake.status = 503
+            else:
+                fake.latency = args.timeout * 2
+            fake.reset_counters()
+            timings, freshness = _outage_load(args.clients, args.per_client, args.deadline, str(enabled))
+            stats = web_search.breaker.stats()
+            _report_tail("avec disjoncteur" if enabled else "sans disjoncteur", timings,
+                         f"appels Tavily={fake.request_count}  refusés={stats['rejected']}  {freshness}")
+            if not enabled:
+                fake.status, fake.latency = 200, 0.05
+                continue
+
+            # 2) la panne continue : un tour toutes les 20 ms, seuls quelques essais partent
+            fake.reset_counters()
+            turns = _trickle(args.open_for * 1.5, args.deadline)
+            print(f"{'panne, en continu':<26} {turns} tours en {args.open_for * 1.5:.1f} s, "
+                  f"{fake.request_count} appels Tavily (essais du demi-ouvert)")
+
+            # 3) Tavily revient : fermeture au prochain essai réussi
+            fake.status, fake.latency = 200, 0.05
+            fake.reset_counters()
+            t0 = time.perf_counter()
+            turns = _trickle(args.open_for * 4, args.deadline, until=circuit.CLOSED)
+            print(f"{'retour de Tavily':<26} fermé au bout de {time.perf_counter() - t0:.2f} s "
+                  f"({turns} tours, {fake.request_count} appels Tavily)")
+
+        print("transitions :")
+        for old, new in ((circuit.CLOSED, circuit.OPEN), (circuit.OPEN, circuit.HALF_OPEN),
+                         (circuit.HALF_OPEN, circuit.OPEN), (circuit.HALF_OPEN, circuit.CLOSED)):
+            n = metrics.CIRCUIT_TRANSITIONS.value(name="bench", from_state=old, to_state=new)
+            print(f"  {old:>9} -> {new:<9} {n:.0f}")
+
+    web_search.breaker.reset()
+    web_search.cache, web_search.breaker = old_cache, old_breaker
+    web_search.SEARCH_TIMEOUT = old_timeout
+    web_search.reset_session()
+
+
+# ---------- metrics : coût d'un inc / observe, avec N threads ----------
+
+def cmd_metrics(args):
+    """metrics.py (API à étiquettes nommées) vs un dict + verrou nu, sous concurrence, /metrics lu en même temps."""
+    import metrics
+
+    counter = metrics.Counter("bench_total", "bench", ("intent", "mode"))
+    histogram = metrics.Histogram("bench_seconds", "bench")
+    lock = threading.Lock()
+    locked: dict = {}
+
+    def locked_inc(intent, mode):
+        with lock:
+            key = (intent, mode)
+            locked[key] = locked.get(key, 0) + 1
+
+    names = ("intent", "mode")
+
+    def locked_inc_labels(**labels):
+        key = tuple(map(labels.get, names))
+        with lock:
+            locked[key] = locked.get(key, 0) + 1
+
+    cases = [
+        ("Counter.inc", lambda: counter.inc(intent="research", mode="web")),
+        ("Histogram.observe", lambda: histogram.observe(0.042)),
+        # référence : le même dict + verrou écrit à la main, avec puis sans étiquettes nommées
+        ("dict + verrou", lambda: locked_inc_labels(intent="research", mode="web")),
+        ("dict + verrou, positionnel", lambda: locked_inc("research", "web")),
+    ]
+    n = args.ops
+    for label, op in cases:
+        barrier = threading.Barrier(args.threads + 1)
+
+        def worker():
+            barrier.wait()
+            for _ in range(n):
+                op()
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        # un scrape de /metrics pendant les écritures : seaux et compte toujours cohérents
+        torn = 0
+        while any(t.is_alive() for t in threads):
+            text = metrics.render([histogram])
+            buckets = re.findall(r'bench_seconds_bucket\{le="\+Inf"\} (\d+)', text)
+            counts = re.findall(r"bench_seconds_count (\d+)", text)
+            torn += buckets != counts
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:<28} {args.threads} threads x {n}  {elapsed / (n * args.threads) * 1e9:7.0f} ns/op")
+
+    expected = n * args.threads
+    total = counter.value(intent="research", mode="web")
+    print(f"total compté : {total} (attendu {expected}), observations : {histogram.value()[0]}, "
+          f"lectures incohérentes : {torn}")
+    if total != expected or histogram.value()[0] != expected or torn:
+        sys.exit(1)
+    t0 = time.perf_counter()
+    text = metrics.render()
+    print(f"rendu de /metrics : {(time.perf_counter() - t0) * 1000:.2f} ms, {len(text)} octets")
+
+
+# ---------- tracing : coût des traces, désactivées / activées ----------
+
+def cmd_tracing(args):
+    """Tours locaux dans une trace : sans traces, avec traces (rien de gardé), avec tout gardé."""
+    import tempfile
+
+    import tracing
+    from brain import ConversationState
+    from pipeline import ChatPipeline
+
+    corpus = _french_corpus(args.messages)
+    pipe = ChatPipeline(cache=None, search=lambda q, **kw: {"summary": "ok", "sources": [], "images": []})
+    path = os.path.join(tempfile.mkdtemp(prefix="boty-trace-"), "traces.jsonl")
+
+    def per_turn() -> float:
+        state = ConversationState()
+        t0 = time.perf_counter()
+        for msg in corpus:
+            with tracing.trace("chat", endpoint="bench"):
+                pipe.run(msg, state)
+        return (time.perf_counter() - t0) / len(corpus)
+
+    results = []
+    for label, config in (
+        ("traces désactivées", None),
+        ("traces, aucune gardée", (path, 1e9, 0.0)),
+        ("traces, toutes gardées", (path, 0.0, 1.0)),
+    ):
+        if config is None:
+            tracing.configure(None)
+        else:
+            tracing.configure(*config)
+        cost = min(per_turn() for _ in range(3))
+        results.append(cost)
+        print(f"{label:<24} {cost * 1e6:7.2f} µs/tour  (+{(cost - results[0]) * 1e6:5.2f} µs)")
+
+    # /api/chat tracé : les réponses d'erreur (tuple Flask) gardent leur code et l'en-tête X-Trace-Id
+    from server import app
+
+    client = app.test_client()
+    ok = True
+    for body, status in (({"message": ""}, 400), ({"message": "salut"}, 200)):
+        resp = client.post("/api/chat", json=body)
+        print(f"/api/chat {body} tracé -> {resp.status_code}  X-Trace-Id={resp.headers.get('X-Trace-Id')}")
+        ok &= resp.status_code == status and bool(resp.headers.get("X-Trace-Id"))
+    tracing.configure(None)
+    print(f"fichier : {path} ({os.path.getsize(path) // 1024} Ko)")
+    if not ok:
+        sys.exit(1)
+
+
+# ---------- micro : fonctions chaudes de brain.py / web_search.py, baseline + comparaison ----------
+
+def _canned_payloads(n: int, seed: int = 1) -> list[dict]:
+    """Réponses Tavily variées : avec / sans "answer", contenus longs, images en str ou en dict."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        sujet = rng.choice(_SUJETS)
+        results = []
+        for j in range(rng.randint(0, 5)):
+            content = f"  {sujet}   est un sujet  intéressant.\n " * rng.randint(1, 40)
+            r = {"title": f"{sujet} ({j})", "url": f"https://example.org/{i}/{j}", "content": content}
+            if rng.random() < 0.3:
+                r["images"] = [f"https://example.org/{i}/{j}.jpg", {"url": f"https://example.org/{i}/{j}b.png"}]
+            results.append(r)
+        payload = {"results": results, "images": [f"https://example.org/{i}.jpg"] * rng.randint(0, 3)}
+        if rng.random() < 0.6:
+            payload["answer"] = f"  {sujet} :   " + "une réponse  assez   longue. " * rng.randint(1, 8)
+        out.append(payload)
+    return out
+
+
+def _micro_cases(n: int, seed: int) -> dict:
+    """nom -> (fonction à un argument, entrées)."""
+    import brain
+
+    corpus = _french_corpus(n, seed)
+    fresh = brain.ConversationState()
+    followup = brain.ConversationState(last_user_question="c'est quoi la lune", last_answer="La lune est un satellite.")
+    with_intent = [(msg, brain.detect_intent(msg, fresh)) for msg in corpus]
+    research = [(msg, i) for msg, i in with_intent if brain.should_use_web(i)]
+    payloads = _canned_payloads(max(1, n // 10), seed)
+    contents = [r["content"] for p in payloads for r in p["results"]] or ["  "]
+
+    return {
+        "brain.detect_intent": (lambda m: brain.detect_intent(m, fresh), corpus),
+        "brain.detect_intent[suivi]": (lambda m: brain.detect_intent(m, followup), corpus),
+        "brain.generate_local_reply": (lambda mi: brain.generate_local_reply(mi[0], fresh, mi[1]), with_intent),
+        "brain.build_web_query": (lambda mi: brain.build_web_query(mi[0], followup, mi[1]), research),
+        "web_search._clean": (web_search._clean, contents),
+        "web_search._parse_response": (web_search._parse_response, payloads),
+    }
+
+
+def _measure(fn, inputs: list, rounds: int, batch: int) -> dict:
+    """
+    Temps par appel, mesuré par lots de `batch` appels (le coût de perf_counter
+    serait sinon du même ordre que la fonction) ; percentiles sur les lots.
+    p50 = meilleure médiane des tours (comme min() dans cmd_intent : moins sensible au bruit).
+    """
+    for x in inputs:
+        fn(x)  # échauffement (caches, regex, mémo du calculateur...)
+    gc.collect()
+    gc.disable()  # pas de pause du ramasse-miettes au milieu d'un lot
+    try:
+        return _measure_rounds(fn, inputs, rounds, batch)
+    finally:
+        gc.enable()
+
+
+def _measure_rounds(fn, inputs: list, rounds: int, batch: int) -> dict:
+    per_call = []
+    medians = []
+    total_calls = 0
+    total_time = 0.0
+    for _ in range(rounds):
+        this_round = []
+        for start in range(0, len(inputs) - batch + 1, batch):
+            chunk = inputs[start:start + batch]
+            t0 = time.perf_counter()
+            for x in chunk:
+                fn(x)
+            elapsed = time.perf_counter() - t0
+            this_round.append(elapsed / batch)
+            total_calls += batch
+            total_time += elapsed
+        medians.append(statistics.median(this_round))
+        per_call.extend(this_round)
+    per_call.sort()
+    k = len(per_call)
+    return {
+        "ops_per_sec": round(total_calls / total_time),
+        "p50_ns": round(min(medians) * 1e9),
+        "p95_ns": round(per_call[min(k - 1, int(k * 0.95))] * 1e9),
+        "p99_ns": round(per_call[min(k - 1, int(k * 0.99))] * 1e9),
+    }
+
+
+def cmd_micro(args):
+    """Ops/s et percentiles par fonction ; --save écrit une baseline, --compare signale les régressions."""
+    results = {}
+    for name, (fn, inputs) in _micro_cases(args.messages, args.seed).items():
+        batch = max(1, min(args.batch, len(inputs)))
+        results[name] = r = _measure(fn, inputs, args.rounds, batch)
+        print(f"{name:<30} {r['ops_per_sec']:>10,} ops/s  p50={r['p50_ns'] / 1000:7.2f} µs  "
+              f"p95={r['p95_ns'] / 1000:7.2f} µs  p99={r['p99_ns'] / 1000:7.2f} µs")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "messages": args.messages,
+            "seed": args.seed,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"baseline écrite dans {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("python") != report["meta"]["python"]:
+            print(f"attention : baseline faite avec Python {baseline['meta'].get('python')}")
+        regressions = 0
+        print(f"\ncomparaison avec {args.compare} (seuil +{args.threshold:.0%} sur le p50)")
+        for name, r in results.items():
+            base = baseline["results"].get(name)
+            if base is None:
+                print(f"{name:<30} (pas dans la baseline)")
+                continue
+            ratio = r["p50_ns"] / base["p50_ns"] - 1
+            flag = ""
+            if ratio > args.threshold:
+                flag = "  <-- RÉGRESSION"
+                regressions += 1
+            print(f"{name:<30} p50 {base['p50_ns'] / 1000:7.2f} -> {r['p50_ns'] / 1000:7.2f} µs  "
+                  f"({ratio:+.1%}){flag}")
+        if regressions:
+            print(f"{regressions} régression(s)")
+            sys.exit(1)
+
+
+# ---------- image : proxy /api/image (miniatures + cache disque) ----------
+
+def cmd_image(args):
+    import tempfile
+
+    os.environ["BOTY_IMAGE_CACHE_DIR"] = tempfile.mkdtemp(prefix="boty-bench-img-")
+    import image_proxy
+    import server
+
+    with FakeTavily() as fake:
+        original = fake.image_url(args.width, args.height)
+        fake.payload = {**fake.payload, "images": [original]}
+        web_search.TAVILY_ENDPOINT = fake.url
+        web_search.cache.clear()
+        httpd, base_url = _start_flask(server.app)
+        try:
+            reply = requests.post(f"{base_url}/api/chat", json={"message": "une photo de cookies"}, timeout=30).json()
+            proxied = base_url + reply["images"][0]
+            print(f"/api/chat renvoie : {reply['images'][0][:60]}...")
+
+            requests.get(original, timeout=30)  # le faux serveur génère l'image au 1er appel
+            t0 = time.perf_counter()
+            direct = requests.get(original, timeout=30)
+            t_direct = time.perf_counter() - t0
+            print(f"image d'origine      {len(direct.content) / 1024:8.1f} Ko  {t_direct * 1000:7.1f} ms")
+
+            for label in ("proxy (1er appel)", "proxy (cache disque)"):
+                t0 = time.perf_counter()
+                r = requests.get(proxied, timeout=30)
+                elapsed = time.perf_counter() - t0
+                print(f"{label:<20} {len(r.content) / 1024:8.1f} Ko  {elapsed * 1000:7.1f} ms  "
+                      f"{r.headers['Content-Type']}  {r.headers['Cache-Control']}")
+
+            r = requests.get(proxied, headers={"If-None-Match": r.headers["ETag"]}, timeout=30)
+            print(f"{'If-None-Match':<20} -> {r.status_code}")
+
+            # N clients simultanés sur une image pas encore en cache -> 1 seul téléchargement
+            fake.reset_counters()
+            other = base_url + image_proxy.proxy_url(fake.image_url(args.width + 1, args.height))
+            barrier = threading.Barrier(args.clients)
+            statuses = []
+
+            def worker():
+                barrier.wait()
+                statuses.append(requests.get(other, timeout=30).status_code)
+
+            threads = [threading.Thread(target=worker) for _ in range(args.clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            print(f"{args.clients} clients simultanés -> {fake.image_count} téléchargement(s) de l'image")
+
+            print(f"cache : {image_proxy.cache_stats()}")
+        finally:
+            httpd.shutdown()
+            image_proxy.cache.clear()
+
+
+# ---------- choix des images : sondes, classement, cache négatif ----------
+
+# catégorie -> (poids dans le tirage, l'image s'affiche-t-elle vite et bien ?)
+_IMAGE_KINDS = {
+    "bonne": (0.35, True),
+    "sans HEAD": (0.10, True),
+    "lourde": (0.10, False),
+    "page HTML": (0.10, False),
+    "404": (0.15, False),
+    "lente": (0.10, False),
+    "hôte mort": (0.10, False),
+}
+
+
+def _image_lists(args, good_base: str, slow_base: str, dead_base: str) -> list[tuple[list[str], dict]]:
+    """Listes d'images façon Tavily (avec doublons), et la catégorie de chaque URL."""
+    rng = random.Random(args.seed)
+    kinds, weights = list(_IMAGE_KINDS), [w for w, _ in _IMAGE_KINDS.values()]
+    lists = []
+    for i in range(args.queries):
+        images, kind_of = [], {}
+        for j, kind in enumerate(rng.choices(kinds, weights, k=args.images)):
+            url = {
+                "bonne": f"{good_base}/img/640x480.jpg?q={i}&n={j}",
+                "sans HEAD": f"{good_base}/img/640x480.jpg?nohead=1&q={i}&n={j}",
+                "lourde": f"{good_base}/img/3000x2000.jpg?q={i}&n={j}",
+                "page HTML": f"{good_base}/img/64x64.jpg?type=html&q={i}&n={j}",
+                "404": f"{good_base}/nope/{i}-{j}.jpg",
+                "lente": f"{slow_base}/img/640x480.jpg?delay={args.slow}&q={i}&n={j}",
+                "hôte mort": f"{dead_base}/img/{i}-{j}.jpg",
+            }[kind]
+            kind_of[url] = kind
+            images.append(url)
+            if rng.random() < 0.2:
+                images.append(url + "#doublon")
+        lists.append((images, kind_of))
+    return lists
+
+
+def _select_all(lists, select) -> list[tuple[list[str], float]]:
+    out = []
+    for images, _ in lists:
+        t0 = time.perf_counter()
+        out.append((select(images), time.perf_counter() - t0))
+    return out
+
+
+async def _select_all_async(lists, rounds: int) -> list[list[tuple[list[str], float]]]:
+    import image_select
+
+    passes = []
+    for _ in range(rounds):
+        out = []
+        for images, _ in lists:
+            t0 = time.perf_counter()
+            out.append((await image_select.select_images_async(images), time.perf_counter() - t0))
+        passes.append(out)
+    await image_select.aclose_async_session()
+    return passes
+
+
+def _report_images(label: str, lists, results) -> None:
+    from collections import Counter
+
+    first = Counter(kind_of[ranked[0]] if ranked else "aucune" for (_, kind_of), (ranked, _) in zip(lists, results))
+    shown_ok = sum(n for kind, n in first.items() if _IMAGE_KINDS.get(kind, (0, False))[1])
+    _report(label, [elapsed for _, elapsed in results])
+    print(f"{'':<28} 1re image affichable : {shown_ok / len(lists):6.1%}   {dict(first.most_common())}")
+
+
+def cmd_images(args):
+    import asyncio
+    import socket
+
+    import image_select
+
+    # un port fermé : "hôte mort" (connexion refusée tout de suite)
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    dead_base = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    sock.close()
+
+    with FakeTavily() as good, FakeTavily() as slow:
+        lists = _image_lists(args, good.url.rsplit("/", 1)[0], slow.url.rsplit("/", 1)[0], dead_base)
+        raw = sum(len(images) for images, _ in lists)
+        lists = [(web_search._dedupe_urls(images), kind_of) for images, kind_of in lists]
+        print(f"{args.queries} réponses, {raw} images -> {sum(len(i) for i, _ in lists)} après dédoublonnage "
+              f"(délai sonde {image_select.IMAGE_PROBE_TIMEOUT} s, budget {image_select.IMAGE_PROBE_BUDGET} s, "
+              f"images lentes : {args.slow} s)")
+        print()
+        _report_images("ordre Tavily", lists, _select_all(lists, list))
+
+        for label in ("threads", "asyncio"):
+            image_select.cache.clear()
+            good.reset_counters()
+            if label == "threads":
+                passes = [_select_all(lists, image_select.select_images) for _ in range(2)]
+            else:
+                passes = asyncio.run(_select_all_async(lists, 2))
+            for name, results in zip(("1er passage", "2e passage"), passes):
+                _report_images(f"sondes {label}, {name}", lists, results)
+            print(f"{'':<28} sondes reçues : {good.image_count}  cache : {image_select.stats()}")
+
+        # toutes les sondes expirent (serveur lent) : les images restent ; tour déjà fini : pas de sonde
+        image_select.cache.clear()
+        slow_only = [f"{slow.url.rsplit('/', 1)[0]}/img/640x480.jpg?delay={args.slow}&tout=lent&n={j}"
+                     for j in range(3)]
+        kept = image_select.select_images(slow_only)
+        t0 = time.perf_counter()
+        late = image_select.select_images([u + "&fin=1" for u in slow_only], deadline=time.monotonic())
+        late_ms = (time.perf_counter() - t0) * 1000
+        print(f"{'toutes lentes':<28} gardées : {len(kept)}/{len(slow_only)}   "
+              f"tour fini : {len(late)} gardées en {late_ms:.1f} ms")
+
+
+# ---------- appli Tk (main.py) : il faut un affichage (DISPLAY / Xvfb) ----------
+
+def _tk_app():
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"pas d'affichage disponible ({e}) : lancer par ex. avec xvfb-run")
+        sys.exit(2)
+    root.geometry("900x600")
+
+    import main
+    app = main.BotyAIApp(root)
+    root.update()
+    return root, app
+
+
+def _rss_mb() -> float:
+    """Mémoire résidente du process (Linux : /proc ; ailleurs : pic via resource)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def cmd_tk_soak(args):
+    """Affiche des milliers de réponses avec image et suit la mémoire résidente."""
+    from PIL import Image
+
+    from image_loader import ImageLoader
+
+    root, app = _tk_app()
+    app.inline_images.budget_bytes = int(args.budget_mb * 1024 * 1024)
+
+    # pas de réseau : chaque "téléchargement" fabrique une image 320x320 différente
+    def fake_fetch(url, max_size):
+        return Image.effect_noise(max_size, 30 + int(url.rsplit("/", 1)[1]) % 50).convert("RGB")
+
+    app.image_loader.shutdown()
+    app.image_loader = ImageLoader(root, fetch=fake_fetch)
+
+    print(f"budget images décodées : {args.budget_mb} Mo   RSS au départ : {_rss_mb():7.1f} Mo")
+    t0 = time.perf_counter()
+    for i in range(args.answers):
+        app.add_web_answer_block("Voici une image. Et une phrase de plus.", True, [], [f"http://fake/{i}"])
+        if (i + 1) % 50 == 0:
+            while app.image_loader.stats()["loaded"] < i + 1:
+                root.update()
+            app._check_images()
+        if (i + 1) % args.report_every == 0:
+            print(f"{i + 1:6d} réponses  RSS={_rss_mb():7.1f} Mo  {app.inline_images.stats()}")
+
+    # on remonte tout en haut puis on redescend : les images se ré-affichent
+    for fraction in (0.0, 0.5, 1.0):
+        app.chat_canvas.yview_moveto(fraction)
+        root.update()
+        app._check_images()
+    print(f"après défilement  RSS={_rss_mb():7.1f} Mo  {app.inline_images.stats()}")
+    print(f"durée : {time.perf_counter() - t0:.1f} s")
+    root.destroy()
+
+
+def cmd_tk_transcript(args):
+    """Ajoute des milliers de messages (texte / code / liens) et mesure le coût de chaque ajout."""
+    root, app = _tk_app()
+    rng = random.Random(args.seed)
+    code = "```python\ndef f(x):\n    return x * 2\n```"
+    sources = [{"title": f"Source {i}", "url": f"https://example.org/{i}"} for i in range(5)]
+
+    timings = []
+    t_start = time.perf_counter()
+    for i in range(args.messages):
+        kind = rng.random()
+        t0 = time.perf_counter()
+        if kind < 0.4:
+            app.add_user_message(f"question {i} " + "blabla " * rng.randint(1, 30))
+        elif kind < 0.6:
+            app.add_bot_message(f"réponse {i} " + "texte " * rng.randint(1, 60))
+        elif kind < 0.8:
+            app.add_web_answer_block(f"Voici du code {i} :\n{code}\nVoilà.", False, [], [])
+        else:
+            app.add_web_answer_block(f"Résumé {i}. " + "mot " * 40, False, sources, [])
+        timings.append(time.perf_counter() - t0)
+        if i % 100 == 0:
+            root.update()
+
+    total = time.perf_counter() - t_start
+    n = len(timings)
+    _report("1ers 1000 ajouts", timings[:1000])
+    _report("derniers 1000 ajouts", timings[max(0, n - 1000):])
+    print(f"max={max(timings) * 1000:.1f} ms  total={total:.1f} s  {app.transcript.stats()}")
+
+    # défilement complet : haut, milieu, bas
+    for fraction in (0.0, 0.5, 1.0):
+        t0 = time.perf_counter()
+        app.chat_canvas.yview_moveto(fraction)
+        app.transcript.refresh()
+        root.update()
+        print(f"saut à {fraction:.0%} : {(time.perf_counter() - t0) * 1000:.1f} ms")
+    root.destroy()
+
+
+def cmd_tk_resize(args):
+    """Simule un redimensionnement à la souris (rafales de <Configure>) sur un long historique."""
+    root, app = _tk_app()
+    code = "```python\ndef f(x):\n    return x * 2\n```"
+    for i in range(args.messages):
+        if i % 3 == 0:
+            app.add_user_message(f"question {i} " + "blabla " * (i % 25 + 1))
+        elif i % 3 == 1:
+            app.add_bot_message(f"réponse {i} " + "texte " * (i % 50 + 1))
+        else:
+            app.add_web_answer_block(f"Voici du code {i} :\n{code}\nVoilà.", False, [], [])
+    root.update()
+
+    # on compte les redimensionnements appliqués et la fin du re-wrap
+    applied = [0]
+    pending = [False]
+    apply_resize, rewrap_step = app._apply_resize, app._rewrap_step
+
+    def counting_apply():
+        applied[0] += 1
+        apply_resize()
+
+    def tracking_step(generation, queue):
+        rewrap_step(generation, queue)
+        pending[0] = bool(queue) and generation == app._rewrap_generation
+
+    app._apply_resize, app._rewrap_step = counting_apply, tracking_step
+
+    class FakeEvent:
+        def __init__(self, width):
+            self.widget = root
+            self.width = width
+
+    frame_times = []
+    events = 0
+    width = 900
+    t0 = time.perf_counter()
+    for frame in range(args.frames):
+        # un gestionnaire de fenêtres envoie plusieurs <Configure> par image pendant un glissé
+        for _ in range(args.events_per_frame):
+            width += 3 if frame < args.frames // 2 else -3
+            app.on_resize(FakeEvent(width))
+            events += 1
+        t_frame = time.perf_counter()
+        time.sleep(0.016)
+        root.update()
+        frame_times.append(time.perf_counter() - t_frame - 0.016)
+    drag = time.perf_counter() - t0
+
+    t_settle = time.perf_counter()
+    while pending[0] or app._resize_job is not None:
+        root.update()
+    settle = time.perf_counter() - t_settle
+
+    print(f"{events} événements <Configure> -> {applied[0]} redimensionnements appliqués "
+          f"({args.frames} images, {drag:.1f} s)")
+    _report("travail par image", frame_times)
+    print(f"max={max(frame_times) * 1000:.1f} ms  re-wrap terminé {settle * 1000:.1f} ms après le glissé  "
+          f"{app.transcript.stats()}")
+    root.destroy()
+
+
+# ---------- calc : évaluateur sûr vs eval ----------
+
+_PATHOLOGICAL = [
+    "9**9**9*1",
+    "9**9**9**9",
+    "(2**64)**(2**64)",
+    "10**10**10",
+    "99999999999999999999**99999999",
+    "9" * 5000 + "*9",
+    "(" * 150 + "1" + ")" * 150,
+    "1+" * 500 + "1",
+    "-" * 1000 + "1",
+    "2**4096*2**4096",
+]
+
+
+def _random_expr(rng, depth: int = 0) -> str:
+    """Petite expression aléatoire, du genre de ce que tapent les utilisateurs."""
+    if depth > 2 or rng.random() < 0.35:
+        if rng.random() < 0.2:
+            return f"{rng.randint(0, 999)}.{rng.randint(0, 99)}"
+        return str(rng.randint(0, 9999))
+    op = rng.choice(["+", "-", "*", "/", "//", "**"])
+    left = _random_expr(rng, depth + 1)
+    right = str(rng.randint(0, 6)) if op == "**" else _random_expr(rng, depth + 1)
+    expr = f"{left}{op}{right}"
+    return f"({expr})" if rng.random() < 0.3 else expr
+
+
+def _eval_or_error(fn, expr):
+    try:
+        return fn(expr)
+    except Exception as e:  # noqa: BLE001 - on compare juste "erreur" vs "erreur"
+        return type(e).__name__ if not isinstance(e, ValueError) else "error"
+
+
+def cmd_calc(args):
+    import calculator
+
+    def legacy(expr):
+        return eval(expr, {"__builtins__": {}}, {})
+
+    def safe(expr):
+        return calculator.evaluate(expr)
+
+    rng = random.Random(args.seed)
+    exprs = [_random_expr(rng) for _ in range(args.exprs)]
+
+    mismatches = 0
+    limited = []
+    for expr in exprs:
+        try:
+            b = calculator.evaluate(expr)
+        except calculator.CalcLimitError:
+            limited.append(expr)  # trop gros : refusé volontairement, eval aurait calculé
+            continue
+        except calculator.CalcError:
+            b = "error"
+        a = _eval_or_error(legacy, expr)
+        if isinstance(a, str) and isinstance(b, str):
+            continue  # erreur des deux côtés (division par zéro, etc.)
+        if a != b and not (a != a and b != b):  # nan != nan
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  différence : {expr!r} eval={a!r:.60} calculator={b!r:.60}")
+    print(f"fuzz : {len(exprs)} expressions, {mismatches} différence(s) avec eval, "
+          f"{len(limited)} refusée(s) car trop coûteuses")
+
+    # le chrono ne porte que sur les expressions "normales" (eval bloquerait sur les autres)
+    normal = [e for e in exprs if e not in set(limited)]
+    for label, fn in (("eval", legacy), ("calculator", safe)):
+        start = time.perf_counter()
+        for expr in normal:
+            _eval_or_error(fn, expr)
+        per = (time.perf_counter() - start) / len(normal)
+        print(f"{label:<11} {per * 1e6:7.2f} µs/expression")
+
+    # calculs qui reviennent (analyse servie par le petit LRU)
+    hot = normal[:calculator.PARSE_CACHE_SIZE // 2] * 20
+    start = time.perf_counter()
+    for expr in hot:
+        _eval_or_error(safe, expr)
+    per = (time.perf_counter() - start) / len(hot)
+    print(f"{'  (répétées)':<11} {per * 1e6:7.2f} µs/expression  cache={calculator.cache_info()}")
+
+    print("expressions pathologiques (refusées) :")
+    for expr in _PATHOLOGICAL:
+        start = time.perf_counter()
+        try:
+            calculator.evaluate(expr)
+            outcome = "ACCEPTÉE"
+            mismatches += 1
+        except calculator.CalcError as e:
+            outcome = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        print(f"  {expr[:32]!r:<36} {elapsed * 1e6:8.1f} µs  {outcome[:60]}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks Boty AI")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("transport", help="latence par appel avec / sans pool HTTP")
+    p.add_argument("--calls", type=int, default=200)
+    p.add_argument("--latency", type=float, default=0.0, help="latence simulée côté serveur (s)")
+    p.add_argument("--tls-cert", help="certificat (auto-signé) pour tester en HTTPS")
+    p.add_argument("--tls-key", help="clé privée du certificat")
+    p.set_defaults(func=cmd_transport)
+
+    p = sub.add_parser("singleflight", help="N requêtes identiques simultanées -> 1 appel amont")
+    p.add_argument("--clients", type=int, default=50)
+    p.add_argument("--latency", type=float, default=0.5)
+    p.set_defaults(func=cmd_singleflight)
+
+    p = sub.add_parser("asgi", help="charge : Flask à threads fixes vs mode ASGI")
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--latency", type=float, default=1.0, help="latence du faux Tavily (s)")
+    p.add_argument("--threads", type=int, default=32, help="threads du serveur Flask")
+    p.set_defaults(func=cmd_asgi)
+
+    p = sub.add_parser("ttfb", help="temps jusqu'au 1er octet, réponse JSON vs streaming SSE")
+    p.add_argument("--calls", type=int, default=10)
+    p.add_argument("--latency", type=float, default=1.0)
+    p.set_defaults(func=cmd_ttfb)
+
+    p = sub.add_parser("intent", help="coût par message de detect_intent (avant / après)")
+    p.add_argument("--messages", type=int, default=200000)
+    p.set_defaults(func=cmd_intent)
+
+    p = sub.add_parser("pipeline", help="durée de chaque étape d'un tour de chat (ChatPipeline)")
+    p.add_argument("--messages", type=int, default=20000)
+    p.add_argument("--web-messages", type=int, default=300)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.set_defaults(func=cmd_pipeline)
+
+    p = sub.add_parser("knowledge", help="appels web évités par la mémoire locale des réponses")
+    p.add_argument("--messages", type=int, default=5000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_knowledge)
+
+    p = sub.add_parser("cachekeys", help="taux de hit du cache : clés exactes / canoniques / quasi-doublons")
+    p.add_argument("--messages", type=int, default=20000)
+    p.add_argument("--input", help="messages JSONL à rejouer (sinon : corpus synthétique)")
+    p.add_argument("--visitors", type=int, default=200)
+    p.add_argument("--noise", type=float, default=0.3, help="part des messages retapés (accents, casse, fautes)")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_cachekeys)
+
+    p = sub.add_parser("profiles", help="octets / latence Tavily par profil de requête (text, image, followup)")
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--turns", type=int, default=6, help="messages par conversation")
+    p.add_argument("--latency", type=float, default=0.0, help="latence du faux Tavily (s)")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_profiles)
+
+    p = sub.add_parser("deadline", help="budget de temps : hedge, réponse périmée, rafraîchissement en fond")
+    p.add_argument("--queries", type=int, default=300)
+    p.add_argument("--latency", type=float, default=0.1, help="latence médiane du faux Tavily (s)")
+    p.add_argument("--slow-rate", type=float, default=0.03)
+    p.add_argument("--slow-latency", type=float, default=2.0)
+    p.add_argument("--deadline", type=float, default=1.0, help="budget d'une recherche (s)")
+    p.add_argument("--stale-queries", type=int, default=20)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_deadline)
+
+    p = sub.add_parser("circuit", help="disjoncteur : Tavily en panne, échec rapide puis retour progressif")
+    p.add_argument("--clients", type=int, default=20)
+    p.add_argument("--per-client", type=int, default=10)
+    p.add_argument("--outage", choices=("errors", "slow"), default="errors")
+    p.add_argument("--timeout", type=float, default=1.0, help="timeout HTTP vers Tavily (s)")
+    p.add_argument("--deadline", type=float, default=3.0, help="budget d'une recherche (s)")
+    p.add_argument("--open-for", type=float, default=1.0, help="durée de l'état ouvert (s)")
+    p.set_defaults(func=cmd_circuit)
+
+    p = sub.add_parser("metrics", help="coût des compteurs / histogrammes de /metrics sous concurrence")
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--ops", type=int, default=100000)
+    p.set_defaults(func=cmd_metrics)
+
+    p = sub.add_parser("tracing", help="coût des traces par tour (désactivées / activées)")
+    p.add_argument("--messages", type=int, default=20000)
+    p.set_defaults(func=cmd_tracing)
+
+    p = sub.add_parser("micro", help="micro-benchmarks brain.py / web_search.py, avec baseline")
+    p.add_argument("--messages", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--rounds", type=int, default=5)
+    p.add_argument("--batch", type=int, default=200, help="appels par mesure de temps")
+    p.add_argument("--save", metavar="FICHIER", help="écrire les résultats comme baseline (JSON)")
+    p.add_argument("--compare", metavar="FICHIER", help="comparer à une baseline")
+    p.add_argument("--threshold", type=float, default=0.2, help="régression si p50 > baseline x (1 + seuil)")
+    p.set_defaults(func=cmd_micro)
+
+    p = sub.add_parser("calc", help="évaluateur de calculs : fuzz vs eval + expressions pathologiques")
+    p.add_argument("--exprs", type=int, default=20000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_calc)
+
+    p = sub.add_parser("image", help="proxy d'images : poids / latence, cache disque, ETag")
+    p.add_argument("--width", type=int, default=3000)
+    p.add_argument("--height", type=int, default=2000)
+    p.add_argument("--clients", type=int, default=20)
+    p.set_defaults(func=cmd_image)
+
+    p = sub.add_parser("images", help="choix des images : sondes, classement, cache négatif")
+    p.add_argument("--queries", type=int, default=40)
+    p.add_argument("--images", type=int, default=6, help="images par réponse")
+    p.add_argument("--slow", type=float, default=3.0, help="délai des images lentes (s)")
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_images)
+
+    p = sub.add_parser("tk-soak", help="appli Tk : mémoire avec des milliers de réponses image")
+    p.add_argument("--answers", type=int, default=3000)
+    p.add_argument("--budget-mb", type=float, default=32)
+    p.add_argument("--report-every", type=int, default=500)
+    p.set_defaults(func=cmd_tk_soak)
+
+    p = sub.add_parser("tk-transcript", help="appli Tk : coût d'un ajout de message sur un long historique")
+    p.add_argument("--messages", type=int, default=10000)
+    p.add_argument("--seed", type=int, default=1)
+    p.set_defaults(func=cmd_tk_transcript)
+
+    p = sub.add_parser("tk-resize", help="appli Tk : rafales de redimensionnement sur un long historique")
+    p.add_argument("--messages", type=int, default=2000)
+    p.add_argument("--frames", type=int, default=120)
+    p.add_argument("--events-per-frame", type=int, default=5)
+    p.set_defaults(func=cmd_tk_resize)
+
+    p = sub.add_parser("serve", help=argparse.SUPPRESS)
+    p.add_argument("--mode", choices=["flask", "asgi"], required=True)
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--threads", type=int, default=32)
+    p.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
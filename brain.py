@@ -1,10 +1,12 @@
 # brain.py
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 import re
 from datetime import datetime
 
+from calculator import CalcError, CalcLimitError, evaluate
+
 
 # ---------- Intents ----------
 
@@ -16,12 +18,50 @@ INTENT_FOLLOWUP_MORE = "followup_more"
 INTENT_OTHER = "other"
 
 
-@dataclass
+@dataclass(slots=True)
 class ConversationState:
     """État simple de la conversation (mémoire courte)."""
     last_user_question: Optional[str] = None
     last_answer: Optional[str] = None
-    knowledge: object | None = None  # pas utilisé dans cette version, mais conservé pour compatibilité
+    knowledge: object | None = None  # réponses web déjà obtenues (knowledge.KnowledgeIndex, créé par ChatPipeline)
+    last_mode: Optional[str] = None  # "image" ou "text"
+    last_image_question: Optional[str] = None
+
+
+# ---------- Mots-clés (compilés une seule fois) ----------
+
+def _keywords_re(keywords) -> re.Pattern:
+    """Une seule regex (alternation) qui trouve n'importe lequel des mots-clés, n'importe où."""
+    ordered = sorted(keywords, key=len, reverse=True)
+    return re.compile("|".join(re.escape(kw) for kw in ordered))
+
+
+FOLLOWUP_KEYWORDS = ("explique plus", "détaille", "en détail", "développe", "et pour")
+GREETING_KEYWORDS = ("salut", "bonjour", "slt", "cc", "coucou", "yo", "wesh", "hey")
+HOW_ARE_YOU_KEYWORDS = ("ça va", "ca va", "comment tu vas", "comment sa va")
+TIME_KEYWORDS = ("heure", "il est quelle heure", "quelle heure est il", "quelle heure est-il")
+QUESTION_KEYWORDS = (
+    "comment ", "pourquoi", "c est quoi", "c'est quoi",
+    "qui est", "qu est ce que", "qu'est ce que", "qu'est-ce que",
+    "où ", "ou ", "recette", "histoire", "définition", "definition",
+    "tutoriel", "tuto", "explique", "explique moi",
+)
+
+_FOLLOWUP_RE = _keywords_re(FOLLOWUP_KEYWORDS)
+_SMALLTALK_RE = _keywords_re(GREETING_KEYWORDS + HOW_ARE_YOU_KEYWORDS)
+_TIME_RE = _keywords_re(TIME_KEYWORDS)
+_QUESTION_RE = _keywords_re(QUESTION_KEYWORDS)
+_DIGIT_RE = re.compile(r"\d")
+_OPERATOR_RE = re.compile(r"[+\-*/x]")
+
+_CA_VA_RE = _keywords_re(("ça va", "ca va"))
+_COMMENT_TU_VAS_RE = _keywords_re(("comment tu vas", "comment sa va"))
+_MATH_NOISE_RE = re.compile(r"(combien fait|ça fait combien|ca fait combien|fait|=|\?)")
+_MATH_EXPR_RE = re.compile(r"[0-9+\-*/().\s]+")
+
+_COOKING_VERBS = ("recette", "faire", "cuisiner", "préparer")
+_WHAT_IS_RE = re.compile(r"(c'est quoi|c est quoi|qu'est ce que|qu est ce que)\s+(.*)")
+_WHO_IS_RE = re.compile(r"qui est\s+(.*)")
 
 
 # ---------- Détection d'intention ----------
@@ -36,36 +76,30 @@ def detect_intent(text: str, state: ConversationState) -> str:
     - research (question d'info)
     - other (vague)
     """
-    t = text.lower().strip()
+    return _classify(text.lower().strip(), bool(state.last_answer))
 
+
+def _classify(t: str, has_history: bool) -> str:
+    """Cœur de detect_intent, sur un texte déjà mis en minuscules et nettoyé."""
     # Follow-up "explique plus", "en détail", etc.
-    if state.last_answer:
-        if any(kw in t for kw in ["explique plus", "détaille", "en détail", "développe", "et pour"]):
+    if has_history:
+        if _FOLLOWUP_RE.search(t):
             return INTENT_FOLLOWUP_MORE
 
-    # Smalltalk
-    if any(kw in t for kw in ["salut", "bonjour", "slt", "cc", "coucou", "yo", "wesh", "hey"]):
-        return INTENT_SMALLTALK
-
-    if any(kw in t for kw in ["ça va", "ca va", "comment tu vas", "comment sa va"]):
+    # Smalltalk (salutations, "ça va")
+    if _SMALLTALK_RE.search(t):
         return INTENT_SMALLTALK
 
     # Heure
-    if any(kw in t for kw in ["heure", "il est quelle heure", "quelle heure est il", "quelle heure est-il"]):
+    if _TIME_RE.search(t):
         return INTENT_TIME
 
     # Calcul simple : présence de chiffres + opérateurs
-    if re.search(r"\d", t) and re.search(r"[+\-*/x]", t):
+    if _DIGIT_RE.search(t) and _OPERATOR_RE.search(t):
         return INTENT_MATH
 
     # Questions de type "comment", "pourquoi", "c'est quoi", etc. -> recherche
-    question_words = [
-        "comment ", "pourquoi", "c est quoi", "c'est quoi",
-        "qui est", "qu est ce que", "qu'est ce que", "qu'est-ce que",
-        "où ", "ou ", "recette", "histoire", "définition", "definition",
-        "tutoriel", "tuto", "explique", "explique moi"
-    ]
-    if any(kw in t for kw in question_words) or t.endswith("?"):
+    if _QUESTION_RE.search(t) or t.endswith("?"):
         return INTENT_RESEARCH
 
     # Phrases un peu longues (> 4 mots) -> probablement une demande d'info
@@ -76,6 +110,34 @@ def detect_intent(text: str, state: ConversationState) -> str:
     return INTENT_OTHER
 
 
+def detect_intents(
+    texts: Iterable[str],
+    state: Optional[ConversationState] = None,
+    memo_size: int = 100_000,
+) -> Iterator[str]:
+    """
+    Version "en masse" de detect_intent, pour analyser des logs hors ligne.
+    Renvoie les intents au fur et à mesure (générateur : mémoire bornée).
+
+    Tous les textes sont classés avec le même `state` (par défaut : sans historique).
+    Les messages répétés ("salut", "ok"...) ne sont classés qu'une fois grâce
+    à un petit mémo, vidé quand il dépasse `memo_size` entrées.
+    """
+    has_history = bool(state is not None and state.last_answer)
+    memo: dict[str, str] = {}
+    classify = _classify
+
+    for text in texts:
+        t = text.lower().strip()
+        intent = memo.get(t)
+        if intent is None:
+            intent = classify(t, has_history)
+            if len(memo) >= memo_size:
+                memo.clear()
+            memo[t] = intent
+        yield intent
+
+
 # ---------- Quand utiliser le web ? ----------
 
 def should_use_web(intent: str) -> bool:
@@ -97,9 +159,9 @@ def generate_local_reply(text: str, state: ConversationState, intent: str) -> Op
 
     # Smalltalk
     if intent == INTENT_SMALLTALK:
-        if any(kw in t for kw in ["ça va", "ca va"]):
+        if _CA_VA_RE.search(t):
             return "Ça va bien, merci 😄 Et toi ?"
-        if any(kw in t for kw in ["comment tu vas", "comment sa va"]):
+        if _COMMENT_TU_VAS_RE.search(t):
             return "Je vais très bien, merci 🙌 Et toi, ça va ?"
         # salut simple
         return "Salut 😄 Comment puis-je t'aider ?"
@@ -113,14 +175,16 @@ def generate_local_reply(text: str, state: ConversationState, intent: str) -> Op
     if intent == INTENT_MATH:
         expr = t
         # on enlève quelques mots parasites
-        expr = re.sub(r"(combien fait|ça fait combien|ca fait combien|fait|=|\?)", "", expr)
+        expr = _MATH_NOISE_RE.sub("", expr)
         expr = expr.replace("x", "*").replace(":", "/")
         # garder uniquement chiffres, opérateurs et espaces
-        if not re.fullmatch(r"[0-9+\-*/().\s]+", expr):
+        if not _MATH_EXPR_RE.fullmatch(expr):
             return "Je ne suis pas sûr du calcul. Réécris juste l'opération, par ex : 12+5*3"
         try:
-            result = eval(expr, {"__builtins__": {}}, {})
-        except Exception:
+            result = evaluate(expr)
+        except CalcLimitError:
+            return "Ce calcul est trop gros pour moi 😅 Essaie avec des nombres plus petits."
+        except CalcError:
             return "Je n'ai pas réussi à faire ce calcul."
         return f"{expr.strip()} = {result}"
 
@@ -162,7 +226,7 @@ def build_web_query(text: str, state: ConversationState, intent: str) -> str:
 
     # Recettes / cuisine
     if "cookie" in t or "cookies" in t:
-        if any(kw in t for kw in ["recette", "faire", "cuisiner", "préparer"]):
+        if any(kw in t for kw in _COOKING_VERBS):
             return "recette de cookies maison simples en français, étapes détaillées"
     if "marmiton" in t or "marmithon" in t:
         return "site Marmiton recette cookies"
@@ -172,13 +236,13 @@ def build_web_query(text: str, state: ConversationState, intent: str) -> str:
         return "drapeau français explication couleurs bleu blanc rouge histoire"
 
     # Questions du type "c'est quoi X"
-    m = re.search(r"(c'est quoi|c est quoi|qu'est ce que|qu est ce que)\s+(.*)", t)
+    m = _WHAT_IS_RE.search(t)
     if m:
         sujet = m.group(2)
         return f"explication simple de {sujet} en français"
 
     # Questions du type "qui est X"
-    m = re.search(r"qui est\s+(.*)", t)
+    m = _WHO_IS_RE.search(t)
     if m:
         personne = m.group(1)
         return f"qui est {personne}, biographie courte en français"
@@ -0,0 +1,128 @@
+# calculator.py
+"""
+Évaluateur d'expressions arithmétiques sûr, à coût borné (remplace eval).
+
+L'expression est analysée en AST, seuls les nombres et + - * / // ** sont
+acceptés, et chaque opération est vérifiée AVANT d'être calculée :
+"9**9**9" est refusé en quelques microsecondes au lieu de bloquer le CPU.
+
+    >>> evaluate("12+5*3")
+    27
+"""
+from __future__ import annotations
+
+import ast
+import operator
+import os
+import time
+from functools import lru_cache
+
+MAX_EXPR_LEN = int(os.environ.get("BOTY_CALC_MAX_LEN", "200"))      # caractères
+MAX_NODES = int(os.environ.get("BOTY_CALC_MAX_NODES", "100"))       # nœuds de l'AST
+MAX_DIGITS = int(os.environ.get("BOTY_CALC_MAX_DIGITS", "50"))      # chiffres par nombre
+MAX_EXPONENT = int(os.environ.get("BOTY_CALC_MAX_EXPONENT", "10000"))
+MAX_BITS = int(os.environ.get("BOTY_CALC_MAX_BITS", "4096"))        # taille max d'un entier intermédiaire
+MAX_TIME = float(os.environ.get("BOTY_CALC_MAX_TIME", "0.05"))      # secondes
+PARSE_CACHE_SIZE = 256
+
+_MAX_LITERAL = 10 ** MAX_DIGITS
+
+
+class CalcError(ValueError):
+    """Expression invalide ou impossible à calculer (division par zéro, etc.)."""
+
+
+class CalcLimitError(CalcError):
+    """Expression valide mais trop coûteuse (dépasse une des limites)."""
+
+
+_BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+_UNARYOPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+_ALLOWED = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.operator, ast.unaryop)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(expr: str) -> ast.expr:
+    """Analyse + validation (mise en cache : les mêmes calculs reviennent souvent)."""
+    if len(expr) > MAX_EXPR_LEN:
+        raise CalcLimitError(f"expression trop longue (> {MAX_EXPR_LEN} caractères)")
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+        raise CalcError(f"expression invalide : {e}") from None
+
+    count = 0
+    for node in ast.walk(tree):
+        count += 1
+        if count > MAX_NODES:
+            raise CalcLimitError(f"expression trop complexe (> {MAX_NODES} éléments)")
+        if not isinstance(node, _ALLOWED):
+            raise CalcError(f"élément non autorisé : {type(node).__name__}")
+        if isinstance(node, ast.BinOp) and type(node.op) not in _BINOPS:
+            raise CalcError(f"opérateur non autorisé : {type(node.op).__name__}")
+        if isinstance(node, ast.UnaryOp) and type(node.op) not in _UNARYOPS:
+            raise CalcError(f"opérateur non autorisé : {type(node.op).__name__}")
+        if isinstance(node, ast.Constant):
+            value = node.value
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise CalcError("seuls les nombres sont autorisés")
+            if isinstance(value, int) and value >= _MAX_LITERAL:
+                raise CalcLimitError(f"nombre trop long (> {MAX_DIGITS} chiffres)")
+    return tree.body
+
+
+def _check_binop(op: type, a, b):
+    """Refuse une opération dont le résultat serait trop gros, sans la calculer."""
+    if op is ast.Pow:
+        if isinstance(b, (int, float)) and abs(b) > MAX_EXPONENT:
+            raise CalcLimitError(f"exposant trop grand (> {MAX_EXPONENT})")
+        if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1:
+            if a.bit_length() * b > MAX_BITS:
+                raise CalcLimitError("résultat trop grand")
+    elif op is ast.Mult:
+        if isinstance(a, int) and isinstance(b, int):
+            if a.bit_length() + b.bit_length() > MAX_BITS:
+                raise CalcLimitError("résultat trop grand")
+
+
+def _eval(node: ast.expr, deadline: float):
+    if time.perf_counter() > deadline:
+        raise CalcLimitError("calcul trop long")
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.UnaryOp):
+        return _UNARYOPS[type(node.op)](_eval(node.operand, deadline))
+    op = type(node.op)
+    a = _eval(node.left, deadline)
+    b = _eval(node.right, deadline)
+    _check_binop(op, a, b)
+    return _BINOPS[op](a, b)
+
+
+def evaluate(expr: str, max_time: float = MAX_TIME):
+    """
+    Calcule `expr` (mêmes résultats que eval pour une opération normale).
+    Lève CalcLimitError si c'est trop coûteux, CalcError si c'est invalide.
+    """
+    node = _parse(expr)
+    try:
+        return _eval(node, time.perf_counter() + max_time)
+    except CalcError:
+        raise
+    except (ArithmeticError, ValueError, TypeError, RecursionError) as e:
+        # ZeroDivisionError, OverflowError (flottants), etc.
+        raise CalcError(str(e)) from None
+
+
+def cache_info():
+    return _parse.cache_info()
@@ -0,0 +1,195 @@
+# circuit.py
+"""
+Disjoncteur (circuit breaker) devant un service amont (Tavily).
+
+Quand Tavily est en panne ou nous limite, chaque recherche attendrait sa
+connexion / son timeout : les threads du serveur restent bloqués et la panne
+se propage à tout le chat. Le disjoncteur suit les appels récents :
+
+- fermé : tout passe ; CONSECUTIVE_FAILURES échecs d'affilée, ou sur les
+  WINDOW dernières secondes (au moins MIN_CALLS appels) trop d'erreurs
+  (ERROR_RATE) ou trop d'appels lents (plus de SLOW_CALL secondes,
+  SLOW_RATE) -> ouvert. Les échecs d'affilée détectent une panne franche
+  tout de suite, même si la fenêtre est pleine d'appels réussis juste
+  avant (le taux d'erreur, lui, monte lentement) ;
+- ouvert : les appels échouent tout de suite (la recherche se rabat sur le
+  cache, voir web_search) pendant OPEN_FOR secondes -> demi-ouvert ;
+- demi-ouvert : HALF_OPEN_PROBES appels à la fois passent pour tester
+  l'amont ; CLOSE_AFTER réussites d'affilée -> fermé, un échec -> ouvert.
+
+Les changements d'état partent dans les métriques (boty_circuit_state,
+boty_circuit_transitions_total).
+
+    if not breaker.allow():
+        ...  # échec immédiat
+    ok = appel()
+    breaker.record(ok, durée)   # après chaque appel autorisé
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import metrics
+
+CIRCUIT_ENABLED = os.environ.get("BOTY_CIRCUIT", "1") != "0"
+CIRCUIT_WINDOW = float(os.environ.get("BOTY_CIRCUIT_WINDOW", "30"))
+CIRCUIT_MIN_CALLS = int(os.environ.get("BOTY_CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_ERROR_RATE = float(os.environ.get("BOTY_CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_CALL = float(os.environ.get("BOTY_CIRCUIT_SLOW_CALL", "5.0"))
+CIRCUIT_SLOW_RATE = float(os.environ.get("BOTY_CIRCUIT_SLOW_RATE", "0.8"))
+CIRCUIT_CONSECUTIVE_FAILURES = int(os.environ.get("BOTY_CIRCUIT_CONSECUTIVE_FAILURES", "5"))
+CIRCUIT_OPEN_FOR = float(os.environ.get("BOTY_CIRCUIT_OPEN_FOR", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("BOTY_CIRCUIT_HALF_OPEN_PROBES", "1"))
+CIRCUIT_CLOSE_AFTER = int(os.environ.get("BOTY_CIRCUIT_CLOSE_AFTER", "2"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# valeur de la jauge boty_circuit_state
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        enabled: bool = CIRCUIT_ENABLED,
+        window: float = CIRCUIT_WINDOW,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        error_rate: float = CIRCUIT_ERROR_RATE,
+        slow_call: float = CIRCUIT_SLOW_CALL,
+        slow_rate: float = CIRCUIT_SLOW_RATE,
+        consecutive_failures: int = CIRCUIT_CONSECUTIVE_FAILURES,
+        open_for: float = CIRCUIT_OPEN_FOR,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        close_after: int = CIRCUIT_CLOSE_AFTER,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.consecutive_failures = consecutive_failures
+        self.open_for = open_for
+        self.half_open_probes = half_open_probes
+        self.close_after = close_after
+        self._clock = clock
+
+        self.state = CLOSED
+        # (instant, échec ?, lent ?) des appels récents (état fermé)
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        # échecs d'affilée (état fermé)
+        self._streak = 0
+        self._open_until = 0.0
+        self._probes = 0
+        self._successes = 0
+        self._lock = threading.Lock()
+
+        self.rejected = 0
+        self.transitions = 0
+        metrics.CIRCUIT_STATE.inc(_STATE_VALUES[CLOSED], name=name)
+
+    # ---------- API ----------
+
+    def allow(self) -> bool:
+        """L'appel peut-il partir ? (False : échouer tout de suite, sans appeler l'amont)."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if self._clock() < self._open_until:
+                    self.rejected += 1
+                    return False
+                self._move(HALF_OPEN)
+            if self._probes >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes += 1
+            return True
+
+    def record(self, ok: bool, elapsed: float):
+        """Résultat d'un appel autorisé par allow() (ok=False : panne, limite de débit, timeout)."""
+        if not self.enabled:
+            return
+        slow = elapsed >= self.slow_call
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if not ok or slow:
+                    self._open()
+                else:
+                    self._successes += 1
+                    if self._successes >= self.close_after:
+                        self._move(CLOSED)
+                return
+            if self.state == OPEN:
+                # appel parti avant l'ouverture : il ne compte plus
+                return
+
+            now = self._clock()
+            self._calls.append((now, not ok, slow))
+            self._failures += not ok
+            self._slow += slow
+            self._streak = 0 if ok else self._streak + 1
+            self._trim(now)
+            total = len(self._calls)
+            if self._streak >= self.consecutive_failures or total >= self.min_calls and (
+                self._failures >= self.error_rate * total or self._slow >= self.slow_rate * total
+            ):
+                self._open()
+
+    def reset(self):
+        with self._lock:
+            self._move(CLOSED)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._trim(self._clock())
+            return {
+                "state": self.state if self.enabled else "disabled",
+                "calls": len(self._calls),
+                "failures": self._failures,
+                "slow": self._slow,
+                "streak": self._streak,
+                "rejected": self.rejected,
+                "transitions": self.transitions,
+                "retry_in": round(max(0.0, self._open_until - self._clock()), 3) if self.state == OPEN else None,
+            }
+
+    # ---------- à appeler avec self._lock ----------
+
+    def _trim(self, now: float):
+        calls = self._calls
+        while calls and calls[0][0] <= now - self.window:
+            _, failed, slow = calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _open(self):
+        self._open_until = self._clock() + self.open_for
+        self._move(OPEN)
+
+    def _move(self, state: str):
+        old = self.state
+        # nouvel état : on repart de zéro
+        self._calls.clear()
+        self._failures = self._slow = self._streak = 0
+        self._probes = self._successes = 0
+        if state == old:
+            return
+        self.state = state
+        self.transitions += 1
+        metrics.CIRCUIT_STATE.inc(_STATE_VALUES[state] - _STATE_VALUES[old], name=self.name)
+        metrics.CIRCUIT_TRANSITIONS.inc(name=self.name, from_state=old, to_state=state)
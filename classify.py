@@ -0,0 +1,143 @@
+# classify.py
+"""
+Classification en masse des intents (analyse de logs hors ligne).
+
+Lit du JSONL (un objet par ligne, comme requests.jsonl), ajoute un champ
+"intent" à chaque objet et réécrit du JSONL, dans le même ordre.
+Tout est traité en flux, par lots : la mémoire reste bornée même sur
+un fichier de plusieurs Go.
+
+    python classify.py logs.jsonl > logs_intents.jsonl
+    python classify.py logs.jsonl --field message --workers 4 -o out.jsonl
+    cat logs.jsonl | python classify.py -
+
+Les compteurs par intent sont affichés sur stderr à la fin.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from brain import detect_intents
+
+# champs essayés dans l'ordre quand --field n'est pas donné
+TEXT_FIELDS = ("message", "text", "body", "title", "content")
+
+
+def _pick_text(obj, field):
+    if not isinstance(obj, dict):
+        return obj if isinstance(obj, str) else ""
+    if field:
+        value = obj.get(field)
+        return value if isinstance(value, str) else ""
+    for name in TEXT_FIELDS:
+        value = obj.get(name)
+        if isinstance(value, str):
+            return value
+    return ""
+
+
+def classify_lines(lines: list, field: str | None = None) -> tuple[list, Counter]:
+    """
+    Classe un lot de lignes JSONL brutes.
+    Renvoie (lignes de sortie avec "intent", compteurs du lot).
+    Les lignes vides sont ignorées ; les lignes invalides sont gardées
+    avec "intent": null et un champ "error".
+    """
+    objs = []
+    texts = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            objs.append({"raw": line, "error": f"JSON invalide : {e}"})
+            texts.append(None)
+            continue
+        objs.append(obj if isinstance(obj, dict) else {"value": obj})
+        texts.append(_pick_text(obj, field))
+
+    intents = detect_intents(t for t in texts if t is not None)
+    counts: Counter = Counter()
+    out = []
+    for obj, text in zip(objs, texts):
+        intent = None if text is None else next(intents)
+        obj["intent"] = intent
+        counts[intent] += 1
+        out.append(json.dumps(obj, ensure_ascii=False))
+    return out, counts
+
+
+def _batches(f, batch_size: int):
+    while True:
+        batch = list(islice(f, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def run(f_in, f_out, field=None, batch_size=10_000, workers=1) -> Counter:
+    """
+    Traite tout le flux f_in -> f_out. Avec workers > 1, les lots sont répartis
+    sur plusieurs process, avec au plus 2 lots en vol par process (mémoire bornée).
+    """
+    total: Counter = Counter()
+
+    def write(result):
+        lines, counts = result
+        if lines:
+            f_out.write("\n".join(lines))
+            f_out.write("\n")
+        total.update(counts)
+
+    if workers <= 1:
+        for batch in _batches(f_in, batch_size):
+            write(classify_lines(batch, field))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for batch in _batches(f_in, batch_size):
+            pending.append(pool.submit(classify_lines, batch, field))
+            # fenêtre bornée : on écrit (dans l'ordre) avant de lire plus loin
+            if len(pending) >= workers * 2:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classification en masse des intents (JSONL)")
+    parser.add_argument("input", help="fichier JSONL, ou - pour stdin")
+    parser.add_argument("-o", "--output", help="fichier de sortie (défaut : stdout)")
+    parser.add_argument("--field", help=f"champ texte (défaut : le 1er présent parmi {', '.join(TEXT_FIELDS)})")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"nombre de process (0 = un par cœur, soit {os.cpu_count()})")
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    f_in = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    f_out = sys.stdout if not args.output else open(args.output, "w", encoding="utf-8")
+    try:
+        total = run(f_in, f_out, args.field, max(1, args.batch_size), workers)
+    finally:
+        if f_in is not sys.stdin:
+            f_in.close()
+        if f_out is not sys.stdout:
+            f_out.close()
+
+    n = sum(total.values())
+    print(f"{n} message(s) classé(s)", file=sys.stderr)
+    for intent, count in total.most_common():
+        print(f"  {intent or '(JSON invalide)'}: {count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
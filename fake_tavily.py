@@ -0,0 +1,372 @@
+# fake_tavily.py
+"""
+Faux serveur Tavily local (HTTP, ou HTTPS si on fournit un certificat).
+Sert aux benchmarks (bench.py) : pas de vraie clé API, pas d'internet,
+et on peut compter les requêtes / connexions reçues (GET /stats).
+
+Sert aussi des images JPEG générées (GET /img/<largeur>x<hauteur>.jpg),
+pour tester le proxy d'images sans aller sur internet.
+
+Basé sur asyncio : il tient des milliers de connexions lentes simultanées
+sans devenir lui-même le goulot d'étranglement du benchmark.
+
+La latence peut suivre une distribution (fixe, uniforme, exponentielle,
+log-normale), avec une part de réponses très lentes (queue de distribution)
+et une part d'erreurs HTTP, pour rejouer du trafic réaliste (replay.py).
+
+    python fake_tavily.py --port 8900 --latency 1.0
+    python fake_tavily.py --latency 0.8 --latency-dist lognormal --error-rate 0.02 --error-status 429,500
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import random
+import re
+import ssl
+import threading
+
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PAYLOAD = {
+    "answer": "Les cookies se préparent avec du beurre, du sucre, de la farine et des pépites de chocolat.",
+    "results": [
+        {
+            "title": "Recette de cookies",
+            "url": "https://example.org/cookies",
+            "content": "Mélanger le beurre et le sucre, ajouter la farine puis les pépites.",
+        },
+        {
+            "title": "Cookies moelleux",
+            "url": "https://example.org/cookies-moelleux",
+            "content": "Cuire 10 minutes à 180 degrés.",
+        },
+    ],
+    # chemins relatifs : servis par le faux serveur lui-même (voir start)
+    "images": ["/img/640x480.jpg"],
+}
+
+_REASONS = {
+    200: "OK", 302: "Found", 404: "Not Found", 429: "Too Many Requests",
+    500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+LATENCY_DISTS = ("fixed", "uniform", "exp", "lognormal")
+
+# /img/LxH.jpg[?delay=s][&nohead=1][&type=html] : latence propre, HEAD refusé, pas une image
+_IMAGE_PATH_RE = re.compile(r"/img/(\d{1,5})x(\d{1,5})\.jpg")
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """Image JPEG de test (dégradé + bruit, pour avoir un poids réaliste)."""
+    from PIL import Image
+
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+    img = Image.blend(img, noise, 0.5)
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=92)
+    return out.getvalue()
+
+
+class FakeTavily:
+    """
+    Démarre un serveur local sur un port libre, dans un thread.
+
+        with FakeTavily(latency=0.05) as fake:
+            web_search.TAVILY_ENDPOINT = fake.url
+            ...
+    """
+
+    def __init__(self, latency: float = 0.0, payload: dict | None = None,
+                 certfile: str | None = None, keyfile: str | None = None,
+                 status: int = 200, port: int = 0,
+                 latency_dist: str = "fixed", latency_sigma: float = 0.5,
+                 slow_rate: float = 0.0, slow_latency: float = 10.0,
+                 error_rate: float = 0.0, error_status: tuple[int, ...] = (500,),
+                 seed: int | None = None):
+        """
+        latency : latence moyenne (médiane pour lognormal) d'une recherche, en secondes.
+        latency_dist : "fixed", "uniform" (0 à 2 x latency), "exp" ou "lognormal" (écart-type latency_sigma).
+        slow_rate : part des recherches qui prennent slow_latency (queue de distribution).
+        error_rate : part des recherches qui répondent un code tiré dans error_status.
+        """
+        if latency_dist not in LATENCY_DISTS:
+            raise ValueError(f"distribution inconnue : {latency_dist}")
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.error_status = tuple(error_status)
+        self._rng = random.Random(seed)
+        self.error_count = 0
+        self.status = status
+        self.payload = payload or DEFAULT_PAYLOAD
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.port = port
+        self.request_count = 0
+        self.connection_count = 0
+        self.image_count = 0
+        self.queries: list = []
+        self._images: dict[tuple[int, int], bytes] = {}
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.AbstractServer | None = None
+        self._thread: threading.Thread | None = None
+        self._address = None
+        self._writers: set[asyncio.StreamWriter] = set()
+
+    # ---------- compteurs ----------
+
+    def _on_connection(self):
+        with self._lock:
+            self.connection_count += 1
+
+    def _on_request(self, query):
+        with self._lock:
+            self.request_count += 1
+            self.queries.append(query)
+
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.connection_count = 0
+            self.image_count = 0
+            self.error_count = 0
+            self.queries = []
+
+    def _draw(self) -> tuple[float, int]:
+        """Latence et code HTTP d'une recherche, selon les distributions configurées."""
+        with self._lock:
+            rng = self._rng
+            if self.slow_rate and rng.random() < self.slow_rate:
+                delay = self.slow_latency
+            elif self.latency_dist == "uniform":
+                delay = rng.uniform(0, 2 * self.latency)
+            elif self.latency_dist == "exp":
+                delay = rng.expovariate(1 / self.latency) if self.latency else 0.0
+            elif self.latency_dist == "lognormal":
+                delay = rng.lognormvariate(math.log(self.latency), self.latency_sigma) if self.latency else 0.0
+            else:
+                delay = self.latency
+            status = self.status
+            if self.error_rate and rng.random() < self.error_rate:
+                status = rng.choice(self.error_status)
+            if status != 200:
+                self.error_count += 1
+        return delay, status
+
+    # ---------- HTTP/1.1 minimal (keep-alive) ----------
+
+    def image_url(self, width: int, height: int) -> str:
+        """URL d'une image de test servie par ce serveur."""
+        return self.url.rsplit("/", 1)[0] + f"/img/{width}x{height}.jpg"
+
+    def _image(self, path: str) -> bytes | None:
+        m = _IMAGE_PATH_RE.fullmatch(path.split("?", 1)[0])
+        if not m:
+            return None
+        size = (int(m.group(1)), int(m.group(2)))
+        with self._lock:
+            self.image_count += 1
+            data = self._images.get(size)
+        if data is None:
+            data = make_jpeg(*size)
+            with self._lock:
+                self._images[size] = data
+        return data
+
+    def _response(self, method: str, path: str, body: bytes) -> tuple[float, int, bytes]:
+        """Renvoie (délai, code HTTP, corps) pour une requête."""
+        if method == "HEAD" and not path.startswith(("/img/", "/redirect?")):
+            return 0.0, 200, b""
+        if method == "GET" and path == "/stats":
+            stats = {"requests": self.request_count, "connections": self.connection_count,
+                     "images": self.image_count, "errors": self.error_count}
+            return 0.0, 200, json.dumps(stats).encode("utf-8")
+        if method in ("GET", "HEAD") and path.startswith("/redirect?"):
+            # /redirect?to=URL : 302 vers URL (corps = Location, voir _handle)
+            target = parse_qs(urlsplit(path).query).get("to", [""])[0]
+            return 0.0, 302, target.encode("utf-8")
+        if method in ("GET", "HEAD") and path.startswith("/img/"):
+            params = parse_qs(urlsplit(path).query)
+            if method == "HEAD" and params.get("nohead"):
+                return 0.0, 405, b"{}"
+            data = self._image(path)
+            delay = float(params["delay"][0]) if "delay" in params else self.latency
+            return (delay, 200, data) if data is not None else (0.0, 404, b"{}")
+        if method != "POST":
+            return 0.0, 404, b"{}"
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            request = {}
+        self._on_request(request.get("query"))
+
+        delay, status = self._draw()
+        if status != 200:
+            return delay, status, json.dumps({"detail": {"error": "fake error"}}).encode("utf-8")
+        return delay, 200, json.dumps(self._shape(request)).encode("utf-8")
+
+    def _shape(self, request: dict) -> dict:
+        """Comme Tavily : réponse, images et nombre de résultats selon les options de la requête."""
+        payload = dict(self.payload)
+        if not request.get("include_answer", False):
+            payload.pop("answer", None)
+        if not request.get("include_images", False):
+            payload.pop("images", None)
+            payload["results"] = [{k: v for k, v in r.items() if k != "images"} for r in payload.get("results") or []]
+        payload["results"] = (payload.get("results") or [])[:request.get("max_results", 5)]
+        return payload
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._on_connection()
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                length = 0
+                keep_alive = True
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    name = name.strip().lower()
+                    if name == "content-length":
+                        length = int(value)
+                    elif name == "connection" and value.strip().lower() == "close":
+                        keep_alive = False
+                body = await reader.readexactly(length) if length else b""
+
+                delay, status, out = self._response(method, path, body)
+                if delay:
+                    await asyncio.sleep(delay)
+
+                if status == 200 and path.startswith("/img/"):
+                    content_type = "text/html" if "type=html" in path else "image/jpeg"
+                else:
+                    content_type = "application/json"
+                location = ""
+                if status == 302:
+                    location, out = f"Location: {out.decode('utf-8')}\r\n", b""
+                head = (
+                    f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+                    f"{location}"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(out)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode("latin-1")
+                writer.write(head if method == "HEAD" else head + out)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            # CancelledError : arrêt du serveur pendant une réponse lente (voir stop)
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    # ---------- démarrage / arrêt ----------
+
+    @property
+    def url(self) -> str:
+        host, port = self._address[:2]
+        scheme = "https" if self.certfile else "http"
+        return f"{scheme}://{host}:{port}/search"
+
+    def start(self) -> "FakeTavily":
+        ctx = None
+        if self.certfile:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(self.certfile, self.keyfile)
+
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, "127.0.0.1", self.port, ssl=ctx, backlog=4096)
+        )
+        self._address = self._server.sockets[0].getsockname()
+        base = self.url.rsplit("/", 1)[0]
+        images = self.payload.get("images") or []
+        if any(isinstance(u, str) and u.startswith("/") for u in images):
+            self.payload = {**self.payload, "images": [
+                base + u if isinstance(u, str) and u.startswith("/") else u for u in images
+            ]}
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def _close():
+            self._server.close()
+            # on ferme les connexions keep-alive encore ouvertes : leurs handlers s'arrêtent seuls
+            for writer in list(self._writers):
+                writer.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=self.latency + 1)
+                # encore en attente (ex. image lente ?delay=) : annulées
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Faux serveur Tavily local")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--status", type=int, default=200)
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTS, default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", default="500", help="codes séparés par des virgules (ex. 429,500)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--tls-cert")
+    parser.add_argument("--tls-key")
+    args = parser.parse_args()
+
+    fake = FakeTavily(
+        latency=args.latency, status=args.status, port=args.port,
+        certfile=args.tls_cert, keyfile=args.tls_key,
+        latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+        slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        error_rate=args.error_rate, error_status=tuple(int(s) for s in args.error_status.split(",") if s),
+        seed=args.seed,
+    ).start()
+    # 1re ligne de sortie = URL, lue par bench.py quand il lance ce script
+    print(fake.url, flush=True)
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# image_loader.py
+"""
+Chargement des images de l'appli Tk (main.py) hors du thread de l'interface.
+
+Téléchargement + décodage + miniature se font dans un petit pool de threads ;
+seule la création du PhotoImage (qui doit se faire dans le thread Tk) passe
+par root.after. Si le widget cible a disparu entre temps, le résultat est jeté.
+Les téléchargements ont leurs propres connexions (pas le pool de Tavily, qui
+ne garde que quelques hôtes et perdrait sa connexion à Tavily).
+
+    loader = ImageLoader(root)
+    loader.load(url, (320, 320), on_ready, on_error, widget=placeholder)
+"""
+from __future__ import annotations
+
+import io
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+IMAGE_WORKERS = int(os.environ.get("BOTY_IMAGE_WORKERS", "4"))
+IMAGE_TIMEOUT = float(os.environ.get("BOTY_IMAGE_TIMEOUT", "10"))
+IMAGE_MAX_BYTES = int(os.environ.get("BOTY_IMAGE_MAX_SOURCE_BYTES", str(15 * 1024 * 1024)))
+
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=32, pool_maxsize=IMAGE_WORKERS)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def fetch_thumbnail(url: str, max_size: tuple[int, int]) -> Image.Image:
+    """Télécharge `url` et renvoie une miniature PIL (bloquant : à appeler hors du thread Tk)."""
+    resp = _get_session().get(url, timeout=IMAGE_TIMEOUT, stream=True)
+    with resp:
+        resp.raise_for_status()
+        buf = bytearray()
+        for chunk in resp.iter_content(64 * 1024):
+            buf += chunk
+            if len(buf) > IMAGE_MAX_BYTES:
+                raise ValueError("image trop lourde")
+
+    img = Image.open(io.BytesIO(bytes(buf)))
+    # JPEG : décodage directement à une échelle réduite
+    img.draft("RGB", (max_size[0] * 2, max_size[1] * 2))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail(max_size)
+    img.load()
+    return img
+
+
+class ImageLoader:
+    def __init__(self, root, workers: int = IMAGE_WORKERS,
+                 fetch: Callable[[str, tuple[int, int]], Image.Image] = fetch_thumbnail):
+        self.root = root
+        self._fetch = fetch
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="boty-image")
+        self._lock = threading.Lock()
+        self._closed = False
+
+        self.loaded = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def load(
+        self,
+        url: str,
+        max_size: tuple[int, int],
+        on_ready: Callable[[Image.Image], None],
+        on_error: Optional[Callable[[Exception], None]] = None,
+        widget=None,
+    ) -> Future:
+        """
+        Lance le chargement en arrière-plan. on_ready(image PIL) / on_error(exception)
+        sont appelés dans le thread Tk, et seulement si `widget` existe encore.
+        Si `widget` est détruit avant le début du téléchargement, celui-ci est annulé.
+        """
+        future = self._pool.submit(self._fetch, url, max_size)
+
+        if widget is not None:
+            # bulle supprimée avant que le worker ne commence : on annule
+            def _on_destroy(event, f=future):
+                if event.widget is widget and f.cancel():
+                    with self._lock:
+                        self.cancelled += 1
+
+            widget.bind("<Destroy>", _on_destroy, add="+")
+
+        def _done(f: Future):
+            if f.cancelled():
+                return
+            self._call_in_ui(lambda: self._deliver(f, on_ready, on_error, widget))
+
+        future.add_done_callback(_done)
+        return future
+
+    def _call_in_ui(self, fn):
+        if self._closed:
+            return
+        try:
+            self.root.after(0, fn)
+        except Exception:
+            # fenêtre fermée pendant le téléchargement
+            pass
+
+    def _deliver(self, future: Future, on_ready, on_error, widget):
+        if widget is not None:
+            try:
+                alive = bool(widget.winfo_exists())
+            except Exception:
+                alive = False
+            if not alive:
+                with self._lock:
+                    self.cancelled += 1
+                return
+
+        error = future.exception()
+        if error is None:
+            with self._lock:
+                self.loaded += 1
+            on_ready(future.result())
+        else:
+            with self._lock:
+                self.failed += 1
+            if on_error is not None:
+                on_error(error)
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"loaded": self.loaded, "failed": self.failed, "cancelled": self.cancelled}
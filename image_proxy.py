@@ -0,0 +1,238 @@
+# image_proxy.py
+"""
+Proxy d'images pour l'interface web (/api/image).
+
+Au lieu de laisser le navigateur télécharger des images de plusieurs Mo
+pour une bulle de 320 px, le serveur récupère l'image une seule fois,
+en fait une miniature (Pillow) aux tailles utilisées par l'interface,
+et la garde dans un cache disque (image_cache.ImageCache).
+
+Les URLs proxy sont signées (HMAC) : le serveur ne va chercher que des
+images qu'il a lui-même renvoyées dans /api/chat (pas de proxy ouvert).
+Les redirections sont suivies à la main (urlguard) : une redirection vers
+un autre hôte n'est suivie que s'il n'a que des adresses publiques (pas de
+rebond vers le réseau interne du serveur).
+
+Téléchargements sur leurs propres connexions : le pool de Tavily ne garde
+que quelques hôtes et perdrait sa connexion à Tavily.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import io
+import os
+import re
+import secrets
+import tempfile
+import threading
+from urllib.parse import urlencode
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+from image_cache import ImageCache
+from singleflight import SingleFlight
+from urlguard import MAX_REDIRECTS, RedirectError, check_redirect
+
+# tailles utilisées par index.html (.answer-image / .yt-thumb)
+IMAGE_SIZES = {
+    "answer": (320, 320),
+    "yt": (320, 180),
+}
+
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("BOTY_IMAGE_TIMEOUT", "10"))
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get("BOTY_IMAGE_MAX_SOURCE_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.environ.get("BOTY_IMAGE_MAX_PIXELS", str(40_000_000)))
+IMAGE_CACHE_DIR = os.environ.get("BOTY_IMAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "boty-images")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("BOTY_IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Les miniatures d'une URL donnée ne changent pas : le navigateur peut les garder longtemps
+IMAGE_MAX_AGE = int(os.environ.get("BOTY_IMAGE_MAX_AGE", str(7 * 24 * 3600)))
+
+# clé de signature ; à fixer dans l'environnement pour que les URLs restent
+# valables après un redémarrage (ou entre plusieurs process)
+_SECRET = (os.environ.get("BOTY_IMAGE_SECRET") or secrets.token_hex(32)).encode("utf-8")
+
+cache = ImageCache(IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES)
+_inflight = SingleFlight()
+
+_YT_ID_RE = re.compile(r"(?:v=|youtu\.be/)([A-Za-z0-9_-]{6,})")
+
+
+class ImageError(Exception):
+    """Échec du proxy d'image ; `status` est le code HTTP à renvoyer."""
+
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------- URLs signées ----------
+
+def _sign(url: str, size: str) -> str:
+    msg = f"{size}\n{url}".encode("utf-8")
+    return hmac.new(_SECRET, msg, hashlib.sha256).hexdigest()[:32]
+
+
+def proxy_url(url: str, size: str = "answer") -> str:
+    """URL locale (/api/image?...) qui sert la miniature de `url`."""
+    encoded = base64.urlsafe_b64encode(url.encode("utf-8")).decode("ascii").rstrip("=")
+    return "/api/image?" + urlencode({"u": encoded, "s": size, "sig": _sign(url, size)})
+
+
+def decode_request(encoded: str, size: str, sig: str) -> str:
+    """Vérifie les paramètres de /api/image et renvoie l'URL d'origine."""
+    if size not in IMAGE_SIZES:
+        raise ImageError("taille inconnue", 400)
+    try:
+        url = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        raise ImageError("url invalide", 400)
+    if not hmac.compare_digest(_sign(url, size), sig or ""):
+        raise ImageError("signature invalide", 403)
+    if not url.startswith(("http://", "https://")):
+        raise ImageError("url invalide", 400)
+    return url
+
+
+def youtube_thumb_url(url: str) -> str | None:
+    """Miniature proxy d'une vidéo YouTube (ou None si l'id est introuvable)."""
+    m = _YT_ID_RE.search(url)
+    if not m:
+        return None
+    return proxy_url(f"https://img.youtube.com/vi/{m.group(1)}/hqdefault.jpg", "yt")
+
+
+# ---------- récupération + miniature ----------
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=64, pool_maxsize=8)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _get(url: str) -> requests.Response:
+    """GET en flux, redirections suivies à la main (MAX_REDIRECTS au plus)."""
+    session = _get_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        try:
+            resp = session.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True, allow_redirects=False)
+        except Exception as e:
+            raise ImageError(f"connexion impossible : {e}", 502)
+        if not resp.is_redirect:
+            return resp
+        location = resp.headers["Location"]
+        resp.close()
+        try:
+            url = check_redirect(url, location)
+        except RedirectError as e:
+            raise ImageError(str(e), 502)
+    raise ImageError("trop de redirections", 502)
+
+
+def _download(url: str) -> bytes:
+    resp = _get(url)
+    with resp:
+        if resp.status_code != 200:
+            raise ImageError(f"code HTTP {resp.status_code}", 404 if resp.status_code == 404 else 502)
+        content_type = resp.headers.get("Content-Type", "")
+        if content_type and not content_type.startswith(("image/", "application/octet-stream")):
+            raise ImageError(f"pas une image ({content_type})", 415)
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > IMAGE_MAX_SOURCE_BYTES:
+            raise ImageError("image trop lourde", 413)
+
+        # lecture bornée (Content-Length peut manquer ou mentir)
+        buf = bytearray()
+        try:
+            for chunk in resp.iter_content(64 * 1024):
+                buf += chunk
+                if len(buf) > IMAGE_MAX_SOURCE_BYTES:
+                    raise ImageError("image trop lourde", 413)
+        except ImageError:
+            raise
+        except Exception as e:
+            raise ImageError(f"lecture interrompue : {e}", 502)
+    return bytes(buf)
+
+
+def make_thumbnail(data: bytes, size: tuple[int, int]) -> bytes:
+    """Miniature JPEG (ou PNG si l'image a de la transparence)."""
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.width * img.height > IMAGE_MAX_PIXELS:
+            raise ImageError("image trop grande", 413)
+        # JPEG : décodage directement à une échelle réduite (bien plus rapide)
+        img.draft("RGB", (size[0] * 2, size[1] * 2))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(size)
+    except ImageError:
+        raise
+    except Exception as e:
+        raise ImageError(f"image illisible : {e}", 415)
+
+    out = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img.convert("RGBA").save(out, "PNG", optimize=True)
+    else:
+        img.convert("RGB").save(out, "JPEG", quality=82, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def content_type_of(data: bytes) -> str:
+    return "image/png" if data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+
+
+def cache_key(url: str, size: str) -> str:
+    return hashlib.sha256(f"{size}\n{url}".encode("utf-8")).hexdigest()
+
+
+def etag_for(url: str, size: str) -> str:
+    # la miniature ne dépend que de (url, taille) : l'ETag se calcule sans la lire
+    return f'"{cache_key(url, size)[:32]}"'
+
+
+def get_thumbnail(url: str, size: str = "answer") -> bytes:
+    """
+    Renvoie les octets de la miniature. Une seule récupération par image,
+    même si plusieurs clients la demandent en même temps.
+    Lève ImageError si l'image est inaccessible ou invalide.
+    """
+    key = cache_key(url, size)
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    def _build():
+        thumb = make_thumbnail(_download(url), IMAGE_SIZES[size])
+        cache.set(key, thumb)
+        return thumb
+
+    try:
+        return _inflight.do(key, _build, timeout=IMAGE_FETCH_TIMEOUT * 2)
+    except TimeoutError:
+        raise ImageError("délai dépassé", 504)
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}, immutable",
+    }
+
+
+def cache_stats() -> dict:
+    return cache.stats()
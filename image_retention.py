@@ -0,0 +1,244 @@
+# image_retention.py
+"""
+Mémoire des images affichées dans l'appli Tk (main.py), bornée.
+
+Un PhotoImage Tk coûte largeur x hauteur x 4 octets, tant qu'il existe.
+Ici on ne garde "décodées" que les images à l'écran ou proches ; quand le
+total dépasse le budget, les images hors écran (d'abord celles dont le
+label n'existe plus, puis les plus lointaines) sont libérées, et un label
+encore affiché garde juste la place (même taille, image vide).
+Une copie compressée (JPEG/PNG, en mémoire puis sur disque au-delà d'un
+second budget) permet de les ré-afficher quand on remonte dans le chat.
+
+Les images sont identifiées par une clé (ex. "12:img" pour le message 12) :
+le label qui les affiche peut être détruit puis recréé (historique virtualisé).
+
+Toutes les méthodes sont à appeler depuis le thread Tk.
+"""
+from __future__ import annotations
+
+import io
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from PIL import Image, ImageTk
+
+# images décodées (PhotoImage) gardées au maximum, hors images visibles
+IMAGE_BUDGET = int(os.environ.get("BOTY_IMAGE_BUDGET", str(32 * 1024 * 1024)))
+# copies compressées gardées en mémoire ; au-delà, elles partent sur disque
+IMAGE_PACKED_BUDGET = int(os.environ.get("BOTY_IMAGE_PACKED_BUDGET", str(16 * 1024 * 1024)))
+# marge (en pixels) au-dessus / en dessous de la zone visible où l'on garde les images
+IMAGE_MARGIN_PX = int(os.environ.get("BOTY_IMAGE_MARGIN_PX", "1200"))
+
+
+def _compress(img: Image.Image) -> bytes:
+    out = io.BytesIO()
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img.save(out, "PNG")
+    else:
+        img.convert("RGB").save(out, "JPEG", quality=88)
+    return out.getvalue()
+
+
+class _Entry:
+    __slots__ = ("label", "width", "height", "packed", "path", "photo")
+
+    def __init__(self, label, width: int, height: int, packed: bytes, photo):
+        self.label = label  # None si aucun label ne l'affiche en ce moment
+        self.width = width
+        self.height = height
+        self.packed: Optional[bytes] = packed
+        self.path: Optional[str] = None
+        self.photo = photo
+
+    @property
+    def decoded_bytes(self) -> int:
+        return self.width * self.height * 4
+
+
+class ImageRetention:
+    def __init__(
+        self,
+        budget_bytes: int = IMAGE_BUDGET,
+        packed_budget: int = IMAGE_PACKED_BUDGET,
+        margin_px: int = IMAGE_MARGIN_PX,
+    ):
+        self.budget_bytes = budget_bytes
+        self.packed_budget = packed_budget
+        self.margin_px = margin_px
+
+        # clé de l'image (ex. "12:img", pas le label qui l'affiche) -> entrée
+        # (ordre d'ajout = ordre de déversement sur disque)
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # clés dont la copie compressée est encore en mémoire (plus anciennes d'abord)
+        self._in_memory: OrderedDict[str, None] = OrderedDict()
+        self._decoded = 0
+        self._packed = 0
+        self._blank = None
+        self._spill_dir: Optional[str] = None
+        self._spill_seq = 0
+
+        self.released = 0
+        self.restored = 0
+        self.spilled = 0
+
+    # ---------- ajout / suppression ----------
+
+    def has(self, key: str) -> bool:
+        return key in self._entries
+
+    def add(self, key: str, pil_img: Image.Image, label=None):
+        """Enregistre une nouvelle image (et l'affiche dans `label` s'il est donné)."""
+        self.forget(key)
+        entry = _Entry(None, pil_img.width, pil_img.height, _compress(pil_img), None)
+        self._entries[key] = entry
+        self._packed += len(entry.packed)
+        self._in_memory[key] = None
+        if label is not None:
+            photo = ImageTk.PhotoImage(pil_img)
+            entry.photo = photo
+            self._decoded += entry.decoded_bytes
+            self._bind(key, entry, label, photo)
+        self._spill()
+
+    def show(self, key: str, label) -> bool:
+        """Affiche l'image `key` dans `label` (ré-décodée si besoin). False si inconnue."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if entry.photo is None:
+            self._decode(entry)
+        self._bind(key, entry, label, entry.photo)
+        return True
+
+    def _bind(self, key: str, entry: _Entry, label, photo):
+        entry.label = label
+        label.config(image=photo, text="", width=entry.width, height=entry.height)
+        label.image = photo
+
+        def on_destroy(event, k=key, lbl=label):
+            e = self._entries.get(k)
+            if event.widget is lbl and e is not None and e.label is lbl:
+                e.label = None
+
+        label.bind("<Destroy>", on_destroy, add="+")
+
+    def forget(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        if entry.photo is not None:
+            self._decoded -= entry.decoded_bytes
+        if entry.packed is not None:
+            self._packed -= len(entry.packed)
+            self._in_memory.pop(key, None)
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _spill(self):
+        """Envoie sur disque les plus anciennes copies compressées au-delà du budget."""
+        if self._packed <= self.packed_budget:
+            return
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="boty-tk-images-")
+        while self._packed > self.packed_budget and self._in_memory:
+            key = next(iter(self._in_memory))
+            entry = self._entries[key]
+            self._spill_seq += 1
+            path = os.path.join(self._spill_dir, f"{self._spill_seq}.img")
+            try:
+                with open(path, "wb") as f:
+                    f.write(entry.packed)
+            except OSError:
+                return
+            self._packed -= len(entry.packed)
+            del self._in_memory[key]
+            entry.packed = None
+            entry.path = path
+            self.spilled += 1
+
+    # ---------- libération / ré-affichage ----------
+
+    def _blank_image(self):
+        # avec une image (même 1x1), width/height d'un Label sont en pixels : la place est gardée
+        if self._blank is None:
+            self._blank = ImageTk.PhotoImage(Image.new("RGBA", (1, 1), (0, 0, 0, 0)))
+        return self._blank
+
+    def _release(self, entry: _Entry):
+        if entry.label is not None:
+            entry.label.config(image=self._blank_image(), width=entry.width, height=entry.height)
+            entry.label.image = None
+        entry.photo = None
+        self._decoded -= entry.decoded_bytes
+        self.released += 1
+
+    def _decode(self, entry: _Entry):
+        data = entry.packed
+        if data is None:
+            with open(entry.path, "rb") as f:
+                data = f.read()
+        entry.photo = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+        self._decoded += entry.decoded_bytes
+        self.restored += 1
+
+    def _restore(self, entry: _Entry):
+        self._decode(entry)
+        entry.label.config(image=entry.photo, width=entry.width, height=entry.height)
+        entry.label.image = entry.photo
+
+    def update(self, top: int, bottom: int, position_of: Callable[[object], tuple[int, int]]):
+        """
+        top / bottom : zone visible ; position_of(label) -> (y haut, y bas), dans le même repère.
+        Ré-affiche les images proches de l'écran, libère les plus lointaines si on dépasse le budget.
+        """
+        near_top = top - self.margin_px
+        near_bottom = bottom + self.margin_px
+        far: list[tuple[float, _Entry]] = []
+
+        for entry in list(self._entries.values()):
+            if entry.label is None:
+                if entry.photo is not None:
+                    far.append((float("inf"), entry))  # plus affichée nulle part : libérée en premier
+                continue
+            try:
+                y0, y1 = position_of(entry.label)
+            except Exception:
+                continue  # label en cours de destruction
+            if y1 >= near_top and y0 <= near_bottom:
+                if entry.photo is None:
+                    self._restore(entry)
+            elif entry.photo is not None:
+                far.append((max(near_top - y1, y0 - near_bottom), entry))
+
+        if self._decoded <= self.budget_bytes:
+            return
+        far.sort(key=lambda item: item[0], reverse=True)
+        for _, entry in far:
+            if self._decoded <= self.budget_bytes:
+                break
+            self._release(entry)
+
+    def close(self):
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+    def stats(self) -> dict:
+        return {
+            "images": len(self._entries),
+            "decoded": sum(1 for e in self._entries.values() if e.photo is not None),
+            "decoded_bytes": self._decoded,
+            "budget_bytes": self.budget_bytes,
+            "packed_bytes": self._packed,
+            "on_disk": sum(1 for e in self._entries.values() if e.path is not None),
+            "released": self.released,
+            "restored": self.restored,
+            "spilled": self.spilled,
+        }
@@ -0,0 +1,358 @@
+# image_select.py
+"""
+Choix des images d'une réponse web (requêtes d'image seulement).
+
+Tavily renvoie souvent des liens morts, des pages HTML ou des images de
+plusieurs Mo, et les interfaces affichent images[0]. Avant de répondre :
+
+- les premières candidates sont sondées en parallèle, avec un délai court
+  (HEAD, ou GET du premier octet si le serveur refuse HEAD) et un budget
+  global : la réponse n'attend jamais plus de IMAGE_PROBE_BUDGET secondes ;
+- les URLs en échec, et les hôtes qui échouent plusieurs fois de suite,
+  sont mémorisés un moment (cache négatif) : on ne les sonde plus ;
+- classement : images valides d'abord (poids raisonnable puis connu, puis
+  les plus rapides), puis celles qui n'ont pas pu être sondées à temps,
+  puis celles dont la sonde a expiré ou n'a pas pu se connecter (serveur
+  lent ou chargé : pas forcément un lien mort), dans leur ordre d'origine.
+  Seuls les échecs certains (code HTTP, pas une image, trop lourde,
+  redirection refusée) sont retirés. Le budget ne dépasse pas la fin du
+  tour (deadline).
+
+Les sondes utilisent leurs propres connexions (pas le pool de Tavily, qui
+ne garde que quelques hôtes et perdrait sa connexion à Tavily). Comme pour
+le proxy, les redirections sont suivies à la main (urlguard) : une sonde
+ne rebondit pas vers le réseau interne du serveur.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import tracing
+from urlguard import MAX_REDIRECTS, REDIRECT_STATUSES, RedirectError, check_redirect, check_redirect_async
+
+IMAGE_PROBE_ENABLED = os.environ.get("BOTY_IMAGE_PROBE", "1") != "0"
+IMAGE_PROBE_TIMEOUT = float(os.environ.get("BOTY_IMAGE_PROBE_TIMEOUT", "1.5"))
+IMAGE_PROBE_BUDGET = float(os.environ.get("BOTY_IMAGE_PROBE_BUDGET", "2.0"))
+IMAGE_PROBE_CANDIDATES = int(os.environ.get("BOTY_IMAGE_PROBE_CANDIDATES", "6"))
+IMAGE_PROBE_WORKERS = int(os.environ.get("BOTY_IMAGE_PROBE_WORKERS", "16"))
+# au-delà, le proxy refuse l'image (image_proxy.IMAGE_MAX_SOURCE_BYTES)
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get("BOTY_IMAGE_MAX_SOURCE_BYTES", str(15 * 1024 * 1024)))
+# au-delà, l'image est valide mais passe après les plus légères
+IMAGE_HEAVY_BYTES = int(os.environ.get("BOTY_IMAGE_HEAVY_BYTES", str(2 * 1024 * 1024)))
+IMAGE_BAD_TTL = float(os.environ.get("BOTY_IMAGE_BAD_TTL", "600"))
+IMAGE_GOOD_TTL = float(os.environ.get("BOTY_IMAGE_GOOD_TTL", "3600"))
+# échecs de connexion consécutifs avant d'écarter tout l'hôte
+IMAGE_HOST_FAILURES = int(os.environ.get("BOTY_IMAGE_HOST_FAILURES", "3"))
+_MAX_REMEMBERED = 4096
+
+# serveurs qui refusent HEAD (ou le traitent mal) : on réessaie en GET d'un octet
+_HEAD_REFUSED = (403, 405, 501)
+
+
+@dataclass(slots=True)
+class Probe:
+    url: str
+    ok: bool
+    # "ok", "http", "type", "heavy", "redirect", "timeout", "connection"
+    outcome: str
+    status: Optional[int] = None
+    size: Optional[int] = None
+    elapsed: float = 0.0
+
+    def rank(self) -> tuple:
+        heavy = self.size is not None and self.size > IMAGE_HEAVY_BYTES
+        return heavy, self.size is None, self.elapsed
+
+
+def judge(url: str, status: int, headers, elapsed: float) -> Probe:
+    """Résultat d'une sonde à partir du code HTTP et des en-têtes (requests ou aiohttp)."""
+    if status not in (200, 206):
+        return Probe(url, False, "http", status, elapsed=elapsed)
+    content_type = (headers.get("Content-Type") or "").lower()
+    if content_type and not content_type.startswith(("image/", "application/octet-stream")):
+        return Probe(url, False, "type", status, elapsed=elapsed)
+    size = None
+    content_range = headers.get("Content-Range") or ""
+    if status == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        size = int(total) if total.isdigit() else None
+    elif status == 200:
+        length = headers.get("Content-Length") or ""
+        size = int(length) if length.isdigit() else None
+    if size is not None and size > IMAGE_MAX_SOURCE_BYTES:
+        return Probe(url, False, "heavy", status, size, elapsed)
+    return Probe(url, True, "ok", status, size, elapsed)
+
+
+# ---------- mémoire des sondes (positives et négatives) ----------
+
+class ProbeCache:
+    def __init__(self, good_ttl: float = IMAGE_GOOD_TTL, bad_ttl: float = IMAGE_BAD_TTL,
+                 host_failures: int = IMAGE_HOST_FAILURES):
+        self.good_ttl = good_ttl
+        self.bad_ttl = bad_ttl
+        self.host_failures = host_failures
+        # url -> (expire_at, Probe)
+        self._probes: OrderedDict[str, tuple[float, Probe]] = OrderedDict()
+        # hôte -> échecs de connexion consécutifs ; hôte -> fin de mise à l'écart
+        self._host_errors: dict[str, int] = {}
+        self._bad_hosts: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.skipped = 0
+
+    def get(self, url: str) -> Optional[Probe]:
+        """Sonde encore valable pour `url` (une Probe en échec si l'hôte est écarté)."""
+        now = time.monotonic()
+        host = urlsplit(url).netloc
+        with self._lock:
+            until = self._bad_hosts.get(host)
+            if until is not None:
+                if until > now:
+                    self.skipped += 1
+                    return Probe(url, False, "connection")
+                del self._bad_hosts[host]
+            entry = self._probes.get(url)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._probes[url]
+                return None
+            self.hits += 1
+            if not entry[1].ok:
+                self.skipped += 1
+            return entry[1]
+
+    def record(self, probe: Probe):
+        now = time.monotonic()
+        host = urlsplit(probe.url).netloc
+        with self._lock:
+            # un délai dépassé n'est pas un lien mort : on le retentera plus tôt
+            ttl = self.good_ttl if probe.ok else self.bad_ttl / (4 if probe.outcome == "timeout" else 1)
+            self._probes[probe.url] = (now + ttl, probe)
+            self._probes.move_to_end(probe.url)
+            while len(self._probes) > _MAX_REMEMBERED:
+                self._probes.popitem(last=False)
+
+            if probe.outcome in ("timeout", "connection"):
+                errors = self._host_errors[host] = self._host_errors.get(host, 0) + 1
+                if errors >= self.host_failures:
+                    self._bad_hosts[host] = now + self.bad_ttl
+                    del self._host_errors[host]
+                    if len(self._bad_hosts) > _MAX_REMEMBERED:
+                        self._bad_hosts.pop(next(iter(self._bad_hosts)))
+            else:
+                self._host_errors.pop(host, None)
+            if len(self._host_errors) > _MAX_REMEMBERED:
+                self._host_errors.clear()
+
+    def clear(self):
+        with self._lock:
+            self._probes.clear()
+            self._host_errors.clear()
+            self._bad_hosts.clear()
+            self.hits = 0
+            self.skipped = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "urls": len(self._probes),
+                "bad_hosts": len(self._bad_hosts),
+                "hits": self.hits,
+                "skipped": self.skipped,
+            }
+
+
+cache = ProbeCache()
+
+
+def _done(probe: Probe) -> Probe:
+    cache.record(probe)
+    metrics.IMAGE_PROBES.inc(outcome=probe.outcome)
+    return probe
+
+
+# échecs certains : l'image ne sera pas affichable ; les autres (timeout, connexion) restent en dernier
+_DEAD = ("http", "type", "heavy", "redirect")
+
+
+def rank(urls: list[str], probes: dict[str, Probe]) -> list[str]:
+    """Valides (classées), puis non sondées, puis en délai dépassé / erreur de connexion (ordre d'origine)."""
+    good = sorted((p for p in probes.values() if p.ok), key=Probe.rank)
+    unprobed = [u for u in urls if u not in probes]
+    unsure = [u for u in urls if u in probes and not probes[u].ok and probes[u].outcome not in _DEAD]
+    return [p.url for p in good] + unprobed + unsure
+
+
+def _budget(deadline: Optional[float]) -> float:
+    """Temps de sonde : IMAGE_PROBE_BUDGET, sans dépasser la fin du tour (time.monotonic())."""
+    if deadline is None:
+        return IMAGE_PROBE_BUDGET
+    return max(0.0, min(IMAGE_PROBE_BUDGET, deadline - time.monotonic()))
+
+
+def _split(images: list, limit: int) -> tuple[list[str], dict[str, Probe], list[str]]:
+    """(URLs candidates, sondes déjà connues, URLs à sonder maintenant)."""
+    urls = [u for u in images if isinstance(u, str) and u.startswith(("http://", "https://"))]
+    known: dict[str, Probe] = {}
+    for url in urls:
+        probe = cache.get(url)
+        if probe is not None:
+            known[url] = probe
+    todo = [u for u in urls if u not in known][:max(0, limit - sum(p.ok for p in known.values()))]
+    return urls, known, todo
+
+
+# ---------- version bloquante (Flask, appli Tk) ----------
+
+_session: requests.Session | None = None
+_pool: ThreadPoolExecutor | None = None
+_init_lock = threading.Lock()
+
+
+def _get_pool() -> tuple[requests.Session, ThreadPoolExecutor]:
+    global _session, _pool
+    if _pool is None:
+        with _init_lock:
+            if _pool is None:
+                session = requests.Session()
+                # pas de retry : une image lente ou morte est simplement écartée
+                adapter = HTTPAdapter(pool_connections=64, pool_maxsize=4, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+                _pool = ThreadPoolExecutor(IMAGE_PROBE_WORKERS, thread_name_prefix="image-probe")
+    return _session, _pool
+
+
+def _fetch(session: requests.Session, method: str, url: str, **kwargs):
+    """(code HTTP, en-têtes), redirections suivies à la main (MAX_REDIRECTS au plus)."""
+    for _ in range(MAX_REDIRECTS + 1):
+        with session.request(method, url, timeout=IMAGE_PROBE_TIMEOUT, allow_redirects=False, **kwargs) as resp:
+            if not resp.is_redirect:
+                return resp.status_code, resp.headers
+            location = resp.headers["Location"]
+        url = check_redirect(url, location)
+    raise RedirectError("trop de redirections")
+
+
+def probe(url: str) -> Probe:
+    session, _ = _get_pool()
+    t0 = time.perf_counter()
+    try:
+        status, headers = _fetch(session, "HEAD", url)
+        if status in _HEAD_REFUSED or (status == 200 and not headers.get("Content-Type")):
+            status, headers = _fetch(session, "GET", url, headers={"Range": "bytes=0-0"}, stream=True)
+    except RedirectError:
+        return _done(Probe(url, False, "redirect", elapsed=time.perf_counter() - t0))
+    except requests.Timeout:
+        return _done(Probe(url, False, "timeout", elapsed=time.perf_counter() - t0))
+    except requests.RequestException:
+        return _done(Probe(url, False, "connection", elapsed=time.perf_counter() - t0))
+    return _done(judge(url, status, headers, time.perf_counter() - t0))
+
+
+def select_images(images: list, limit: int = IMAGE_PROBE_CANDIDATES,
+                  deadline: Optional[float] = None) -> list[str]:
+    """Images triées pour l'affichage (la première est celle à montrer)."""
+    if not IMAGE_PROBE_ENABLED or not images:
+        return list(images or [])
+    urls, probes, todo = _split(images, limit)
+    budget = _budget(deadline)
+    if todo and budget > 0:
+        _, pool = _get_pool()
+        with tracing.span("images.probe", candidates=len(todo)):
+            futures = [pool.submit(probe, url) for url in todo]
+            # les sondes en retard continuent en fond : leur résultat servira la prochaine fois
+            done, _ = wait(futures, timeout=budget)
+        for future in done:
+            result = future.result()
+            probes[result.url] = result
+    return rank(urls, probes)
+
+
+# ---------- version asyncio (asgi.py) ----------
+
+_async_session = None
+
+
+def _get_async_session():
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        import aiohttp
+
+        _async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=IMAGE_PROBE_WORKERS * 4, limit_per_host=4),
+            timeout=aiohttp.ClientTimeout(total=IMAGE_PROBE_TIMEOUT),
+        )
+    return _async_session
+
+
+async def _fetch_async(session, method: str, url: str, **kwargs):
+    """Comme _fetch, avec aiohttp."""
+    for _ in range(MAX_REDIRECTS + 1):
+        async with session.request(method, url, allow_redirects=False, **kwargs) as resp:
+            location = resp.headers.get("Location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                return resp.status, resp.headers
+        url = await check_redirect_async(url, location)
+    raise RedirectError("trop de redirections")
+
+
+async def probe_async(url: str) -> Probe:
+    import aiohttp
+
+    session = _get_async_session()
+    t0 = time.perf_counter()
+    try:
+        status, headers = await _fetch_async(session, "HEAD", url)
+        if status in _HEAD_REFUSED or (status == 200 and not headers.get("Content-Type")):
+            status, headers = await _fetch_async(session, "GET", url, headers={"Range": "bytes=0-0"})
+    except RedirectError:
+        return _done(Probe(url, False, "redirect", elapsed=time.perf_counter() - t0))
+    except asyncio.TimeoutError:
+        return _done(Probe(url, False, "timeout", elapsed=time.perf_counter() - t0))
+    except (aiohttp.ClientError, ValueError):
+        return _done(Probe(url, False, "connection", elapsed=time.perf_counter() - t0))
+    return _done(judge(url, status, headers, time.perf_counter() - t0))
+
+
+async def select_images_async(images: list, limit: int = IMAGE_PROBE_CANDIDATES,
+                              deadline: Optional[float] = None) -> list[str]:
+    if not IMAGE_PROBE_ENABLED or not images:
+        return list(images or [])
+    urls, probes, todo = _split(images, limit)
+    budget = _budget(deadline)
+    if todo and budget > 0:
+        with tracing.span("images.probe", candidates=len(todo)):
+            tasks = [asyncio.ensure_future(probe_async(url)) for url in todo]
+            done, _ = await asyncio.wait(tasks, timeout=budget)
+        for task in done:
+            result = task.result()
+            probes[result.url] = result
+    return rank(urls, probes)
+
+
+async def aclose_async_session() -> None:
+    global _async_session
+    if _async_session is not None:
+        await _async_session.close()
+        _async_session = None
+
+
+def stats() -> dict:
+    return cache.stats()
@@ -0,0 +1,191 @@
+# knowledge.py
+"""
+Mémoire locale des réponses web d'une conversation (ConversationState.knowledge).
+
+Chaque résumé Tavily réussi et à jour (avec ses sources) est rangé sous la requête
+web qui l'a obtenu (brain.build_web_query), dans un petit index inversé en
+mémoire (mot -> entrées). Une requête qui ressemble assez à une requête déjà
+faite ("c'est quoi les volcans" / "qu'est-ce que les volcans ?") reçoit la
+même réponse tout de suite, sans appel à Tavily. On compare les requêtes et
+pas les messages bruts : quand une question courte dépend de la précédente,
+sa requête contient déjà ce contexte ("Complément d'information sur : ...").
+
+Ressemblance = part de mots utiles communs aux deux requêtes (Jaccard sur
+querykey.keywords : sans accents ni mots vides), à mots interrogatifs
+identiques ("quand est mort X" n'est pas "où est mort X") et avec les mots
+communs dans le même ordre ("le chien mord l'homme" n'est pas "l'homme
+mord le chien"). Pas de pondération par
+rareté : un sujet fréquent dans la conversation ("les impôts") doit compter
+autant qu'un sujet rare, sinon deux requêtes qui ne diffèrent que par lui
+se ressemblent à tort.
+Le résumé ne sert pas à comparer : un texte qui contient les mots d'une
+question n'y répond pas forcément. En dessous de KNOWLEDGE_MIN_SCORE, on va
+sur le web.
+
+Borné en nombre d'entrées (les moins utilisées partent d'abord) et en âge.
+Pas de verrou : une conversation ne joue qu'un tour à la fois.
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from querykey import INTERROGATIVES, words as query_words
+
+KNOWLEDGE_ENABLED = os.environ.get("BOTY_KNOWLEDGE", "1") != "0"
+KNOWLEDGE_MIN_SCORE = float(os.environ.get("BOTY_KNOWLEDGE_MIN_SCORE", "0.85"))
+KNOWLEDGE_MAX_ENTRIES = int(os.environ.get("BOTY_KNOWLEDGE_MAX_ENTRIES", "64"))
+KNOWLEDGE_MAX_AGE = float(os.environ.get("BOTY_KNOWLEDGE_MAX_AGE", "86400"))
+
+
+@dataclass(slots=True)
+class Entry:
+    id: int
+    question: str
+    words: frozenset
+    # mots utiles dans l'ordre de la requête
+    order: tuple
+    result: dict
+    stored_at: float
+    hits: int = 0
+
+
+@dataclass(slots=True)
+class Match:
+    entry: Entry
+    score: float
+
+
+class KnowledgeIndex:
+    def __init__(
+        self,
+        max_entries: int = KNOWLEDGE_MAX_ENTRIES,
+        max_age: float = KNOWLEDGE_MAX_AGE,
+        min_score: float = KNOWLEDGE_MIN_SCORE,
+    ):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.min_score = min_score
+
+        # id -> entrée, de la moins récemment utilisée à la plus récente
+        self._entries: OrderedDict[int, Entry] = OrderedDict()
+        # mot -> ids des entrées dont la question contient ce mot
+        self._postings: dict[str, set[int]] = {}
+        self._next_id = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.learned = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- écriture ----------
+
+    def learn(self, question: str, result: dict) -> Optional[Entry]:
+        """
+        Range une réponse web réussie sous `question` (la requête envoyée à Tavily).
+        Ignorée si elle n'a pas de sources (erreur Tavily, pas de réponse claire)
+        ou si la requête n'a aucun mot utile.
+        """
+        if not isinstance(result, dict) or not result.get("sources") or not result.get("summary"):
+            return None
+        order = _ordered(question)
+        words = frozenset(order)
+        if not words:
+            return None
+        now = time.monotonic()
+        self._purge(now)
+        # même requête (aux mots vides près) : la nouvelle réponse remplace l'ancienne
+        for entry_id in self._candidates(words):
+            if self._entries[entry_id].order == order:
+                self._remove(entry_id)
+                break
+        entry = Entry(self._next_id, question, words, order, result, now)
+        self._next_id += 1
+        self._entries[entry.id] = entry
+        for word in words:
+            self._postings.setdefault(word, set()).add(entry.id)
+        self.learned += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return entry
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for word in entry.words:
+            ids = self._postings[word]
+            ids.discard(entry_id)
+            if not ids:
+                del self._postings[word]
+
+    def _purge(self, now: float):
+        # les entrées les plus anciennes ne sont pas forcément en tête (LRU) : on parcourt tout,
+        # mais il n'y en a que max_entries
+        expired = [e.id for e in self._entries.values() if now - e.stored_at > self.max_age]
+        for entry_id in expired:
+            self._remove(entry_id)
+        self.expirations += len(expired)
+
+    # ---------- lecture ----------
+
+    def _candidates(self, words) -> set:
+        ids = set()
+        for word in words:
+            ids.update(self._postings.get(word, ()))
+        return ids
+
+    def lookup(self, question: str) -> Optional[Match]:
+        """Meilleure entrée assez proche de `question` (score >= min_score), ou None."""
+        self.lookups += 1
+        order = _ordered(question)
+        words = frozenset(order)
+        if not words or not self._entries:
+            return None
+        self._purge(time.monotonic())
+        asked = words & INTERROGATIVES
+        best: Optional[Match] = None
+        for entry_id in self._candidates(words):
+            entry = self._entries[entry_id]
+            if entry.words & INTERROGATIVES != asked:
+                continue
+            shared = words & entry.words
+            if _in_order(order, shared) != _in_order(entry.order, shared):
+                continue
+            score = len(shared) / len(words | entry.words)
+            if best is None or score > best.score:
+                best = Match(entry, score)
+        if best is None or best.score < self.min_score:
+            return None
+        best.entry.hits += 1
+        self._entries.move_to_end(best.entry.id)
+        self.hits += 1
+        return best
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "words": len(self._postings),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "learned": self.learned,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def _ordered(question: str) -> tuple:
+    # avec les répétitions : une précision ("Complément d'information sur : A. L'utilisateur
+    # ajoute : B") garde l'ordre de B, même si A et B ont les mêmes mots
+    return tuple(query_words(question))
+
+
+def _in_order(order: tuple, shared: frozenset) -> tuple:
+    return tuple(w for w in order if w in shared)
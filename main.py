@@ -1,22 +1,17 @@
 # main.py
 import tkinter as tk
 import threading
+import time
 import webbrowser
 import re
+from collections import deque
 
-import requests
-from io import BytesIO
-from PIL import Image, ImageTk
-
-from brain import (
-    ConversationState,
-    detect_intent,
-    should_use_web,
-    generate_local_reply,
-    build_web_query,
-    INTENT_RESEARCH,
-)
-from web_search import search_web
+from brain import ConversationState
+from pipeline import ChatPipeline, Turn
+from web_search import warm_up
+from image_loader import ImageLoader
+from image_retention import ImageRetention
+from transcript import Message, Renderer, Transcript
 
 # ---------- Couleurs & styles ----------
 BG_MAIN = "#020617"        # fond chat
@@ -28,8 +23,13 @@ FG_BOT = "#e5e7eb"
 FONT_TEXT = ("Segoe UI", 10)
 FONT_BUTTON = ("Segoe UI", 9, "bold")
 
+# redimensionnement : au plus une mise à jour par image (~60 par seconde),
+# et le re-wrap des bulles se fait par tranches de quelques ms
+RESIZE_FRAME_MS = 16
+REWRAP_SLICE_MS = 8
+
 
-class BotyAIApp:
+class BotyAIApp(Renderer):
     def __init__(self, root: tk.Tk):
         self.root = root
         self.root.title("Boty AI - Web Chat intelligent")
@@ -38,15 +38,26 @@ class BotyAIApp:
 
         # état de la conversation (mémoire courte, pas de DB)
         self.state = ConversationState()
-        self.state.knowledge = None
-        self.last_mode = None          # "image" ou "text"
-        self.last_image_question = None
+        # même moteur que le serveur web (routage, intent, recherche...)
+        self.pipeline = ChatPipeline()
+
+        # images affichées : mémoire bornée (les images loin de l'écran sont libérées
+        # et ré-affichées depuis une copie compressée quand on y revient)
+        self.inline_images = ImageRetention()
+        self._image_check_job = None
+        # clé d'image -> label qui l'attend / future du téléchargement / message d'erreur
+        self._image_labels: dict[str, tk.Label] = {}
+        self._image_loading: dict = {}
+        self._image_errors: dict[str, str] = {}
 
-        # pour garder les images en mémoire
-        self.inline_images: list[ImageTk.PhotoImage] = []
+        # téléchargement / décodage des images en arrière-plan (l'UI ne gèle plus)
+        self.image_loader = ImageLoader(self.root)
 
         # wrap dynamique (responsive)
         self.wrap_width = 650
+        self._pending_width = None
+        self._resize_job = None
+        self._rewrap_generation = 0
         self.root.bind("<Configure>", self.on_resize)
 
         # ---- Zone de chat scrollable ----
@@ -67,17 +78,17 @@ class BotyAIApp:
         )
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.chat_canvas.configure(yscrollcommand=scrollbar.set)
+        # historique virtualisé : seuls les messages visibles ont des widgets
+        self.transcript = Transcript(self.chat_canvas, self)
+        self.transcript.on_change = self._schedule_image_check
 
-        self.chat_frame = tk.Frame(self.chat_canvas, bg=BG_MAIN)
-        self.chat_canvas.create_window((0, 0), window=self.chat_frame, anchor="nw")
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            self.transcript.schedule_refresh()
+            self._schedule_image_check()
 
-        self.chat_frame.bind(
-            "<Configure>",
-            lambda e: self.chat_canvas.configure(
-                scrollregion=self.chat_canvas.bbox("all")
-            )
-        )
+        self.chat_canvas.configure(yscrollcommand=on_scroll)
+        self.chat_canvas.bind("<Configure>", lambda e: self.transcript.resize(e.width))
 
         # ---- Entrée utilisateur + bouton ----
         bottom_frame = tk.Frame(self.root, bg=BG_WINDOW)
@@ -120,77 +131,170 @@ class BotyAIApp:
     # ---------- Gestion taille / scroll ----------
 
     def on_resize(self, event):
+        # <Configure> remonte aussi pour chaque widget enfant : seule la fenêtre compte
+        if event.widget is not self.root:
+            return
+        # une rafale d'événements (bord de fenêtre tiré) -> une seule mise à jour par image
+        self._pending_width = event.width
+        if self._resize_job is None:
+            self._resize_job = self.root.after(RESIZE_FRAME_MS, self._apply_resize)
+
+    def _apply_resize(self):
+        self._resize_job = None
         # adapte la largeur de wrap à la fenêtre
-        w = max(event.width - 220, 300)
+        w = max(self._pending_width - 220, 300)
+        if w == self.wrap_width:
+            return
         self.wrap_width = w
 
-    def _scroll_to_bottom(self):
-        self.chat_canvas.update_idletasks()
-        self.chat_canvas.yview_moveto(1.0)
+        # les messages hors écran seront re-mesurés quand ils réapparaîtront ;
+        # ceux qui ont un widget sont re-wrappés par tranches, les visibles d'abord
+        self.transcript.mark_stale()
+        self._rewrap_generation += 1
+        first, last = self.transcript.visible_range(margin=0)
+        live = self.transcript.live_indexes()
+        visible = [i for i in live if first <= i < last]
+        others = sorted((i for i in live if not first <= i < last),
+                        key=lambda i: first - i if i < first else i - last)
+        self._rewrap_step(self._rewrap_generation, deque(visible + others))
+
+    def _rewrap_step(self, generation: int, queue: deque):
+        if generation != self._rewrap_generation:
+            return  # un redimensionnement plus récent a pris la main
+        deadline = time.perf_counter() + REWRAP_SLICE_MS / 1000
+        done = []
+        while queue and time.perf_counter() < deadline:
+            index = queue.popleft()
+            widget = self.transcript.widget_for(index)
+            if widget is not None:
+                self._rewrap(widget)
+                done.append(index)
+        if done:
+            self.transcript.remeasure(done)
+        if queue:
+            self.root.after(1, self._rewrap_step, generation, queue)
+
+    def _rewrap(self, widget):
+        """Applique la largeur de wrap actuelle à tous les labels d'une bulle."""
+        stack = [widget]
+        while stack:
+            w = stack.pop()
+            offset = getattr(w, "wrap_offset", None)
+            if offset is not None:
+                w.config(wraplength=self.wrap_width - offset)
+            stack.extend(w.winfo_children())
+
+    # ---------- Mémoire des images ----------
+
+    def _schedule_image_check(self):
+        # une seule vérification par rafale de scroll
+        if self._image_check_job is None:
+            self._image_check_job = self.root.after(100, self._check_images)
+
+    def _y_in_chat(self, widget) -> tuple[int, int]:
+        """Position verticale d'un widget dans le repère du canvas."""
+        y = widget.winfo_rooty() - self.chat_canvas.winfo_rooty() + int(self.chat_canvas.canvasy(0))
+        return y, y + widget.winfo_height()
+
+    def _check_images(self):
+        self._image_check_job = None
+        top = int(self.chat_canvas.canvasy(0))
+        bottom = top + self.chat_canvas.winfo_height()
+        self.inline_images.update(top, bottom, self._y_in_chat)
+
+    # ---------- Rendu des messages (appelé par Transcript) ----------
+
+    def estimate_height(self, message: Message) -> int:
+        """Hauteur approximative (px) d'un message jamais affiché ; corrigée à l'affichage."""
+        chars_per_line = max(20, self.wrap_width // 7)
+        lines = sum(max(1, -(-len(line) // chars_per_line)) for line in message.text.split("\n"))
+        height = lines * 17 + 24
+        if message.kind == "web":
+            if message.is_image_query and message.images:
+                height += 330
+            elif message.sources:
+                shown = [s for s in message.sources[:5] if s.get("url")]
+                height += 22 + 30 * len(shown)
+                height += 190 * sum(1 for s in shown if self._is_youtube(s["url"]))
+        return height
+
+    def kind_of(self, message: Message):
+        # bulles texte simples : recyclables ; réponses web : reconstruites
+        return message.kind if message.kind in ("user", "bot", "system") else None
+
+    def build(self, message: Message, parent):
+        if message.kind == "system":
+            outer = tk.Frame(parent, bg=BG_MAIN)
+            label = tk.Label(
+                outer,
+                text=message.text,
+                bg=BG_MAIN,
+                fg="#9ca3af",
+                font=("Segoe UI", 9),
+                justify="center"
+            )
+            label.pack(pady=6)
+            outer.text_label = label
+            return outer
+
+        outer, bubble = self._create_bubble(parent, from_user=(message.kind == "user"))
+        if message.kind == "web":
+            self._fill_web_answer(bubble, message)
+            return outer
+
+        from_user = message.kind == "user"
+        label = tk.Label(
+            bubble,
+            text=message.text,
+            bg=BG_USER if from_user else BG_BOT,
+            fg=FG_USER if from_user else FG_BOT,
+            wraplength=self.wrap_width,
+            justify="right" if from_user else "left",
+            font=FONT_TEXT
+        )
+        label.pack(padx=10, pady=6)
+        label.wrap_offset = 0
+        outer.text_label = label
+        return outer
+
+    def reuse(self, widget, message: Message) -> bool:
+        label = getattr(widget, "text_label", None)
+        if label is None:
+            return False
+        if message.kind == "system":
+            label.config(text=message.text)
+        else:
+            label.config(text=message.text, wraplength=self.wrap_width)
+        return True
 
     # ---------- Création de bulles ----------
 
-    def _create_bubble(self, from_user: bool) -> tk.Frame:
+    def _create_bubble(self, parent, from_user: bool) -> tuple[tk.Frame, tk.Frame]:
         """
         Crée un conteneur de bulle (sans texte) côté user ou bot.
         On pourra y mettre texte + image + code + liens dans le même bloc.
+        Renvoie (cadre du message, bulle).
         """
-        outer = tk.Frame(self.chat_frame, bg=BG_MAIN)
+        outer = tk.Frame(parent, bg=BG_MAIN)
         if from_user:
-            outer.pack(anchor="e", pady=4, padx=10, fill="x")
             side = "right"
             bg = BG_USER
         else:
-            outer.pack(anchor="w", pady=4, padx=10, fill="x")
             side = "left"
             bg = BG_BOT
 
         bubble = tk.Frame(outer, bg=bg, bd=0)
-        bubble.pack(side=side, padx=5, pady=2, ipadx=1, ipady=1)
-        self._scroll_to_bottom()
-        return bubble
+        bubble.pack(side=side, padx=15, pady=6, ipadx=1, ipady=1)
+        return outer, bubble
 
     def add_user_message(self, message: str):
-        bubble = self._create_bubble(from_user=True)
-        label = tk.Label(
-            bubble,
-            text=message,
-            bg=BG_USER,
-            fg=FG_USER,
-            wraplength=self.wrap_width,
-            justify="right",
-            font=FONT_TEXT
-        )
-        label.pack(padx=10, pady=6)
-        self._scroll_to_bottom()
+        self.transcript.append(Message("user", message))
 
     def add_bot_message(self, message: str):
-        bubble = self._create_bubble(from_user=False)
-        label = tk.Label(
-            bubble,
-            text=message,
-            bg=BG_BOT,
-            fg=FG_BOT,
-            wraplength=self.wrap_width,
-            justify="left",
-            font=FONT_TEXT
-        )
-        label.pack(padx=10, pady=6)
-        self._scroll_to_bottom()
+        self.transcript.append(Message("bot", message))
 
     def add_system_message(self, message: str):
-        outer = tk.Frame(self.chat_frame, bg=BG_MAIN)
-        outer.pack(anchor="c", pady=6)
-        label = tk.Label(
-            outer,
-            text=message,
-            bg=BG_MAIN,
-            fg="#9ca3af",
-            font=("Segoe UI", 9),
-            justify="center"
-        )
-        label.pack()
-        self._scroll_to_bottom()
+        self.transcript.append(Message("system", message))
 
     # ---------- Éléments dans une bulle bot ----------
 
@@ -204,25 +308,84 @@ class BotyAIApp:
             justify="left",
             font=FONT_TEXT
         )
+        label.wrap_offset = 0
         label.pack(padx=10, pady=(6, 4), anchor="w")
 
-    def _add_image_in_bubble(self, bubble: tk.Frame, url: str, max_size=(320, 320)):
-        try:
-            resp = requests.get(url, timeout=10)
-            resp.raise_for_status()
-            img_data = BytesIO(resp.content)
-            pil_img = Image.open(img_data)
-        except Exception as e:
-            self._add_text_in_bubble(bubble, f"(Impossible de charger l'image : {e})")
+    def _add_image_placeholder(self, bubble: tk.Frame, text: str, pady) -> tk.Label:
+        """Label affiché tout de suite, remplacé par l'image quand elle est prête."""
+        placeholder = tk.Label(
+            bubble,
+            text=text,
+            bg=BG_BOT,
+            fg="#9ca3af",
+            font=("Segoe UI", 9, "italic"),
+        )
+        placeholder.pack(padx=10, pady=pady, anchor="w")
+        return placeholder
+
+    def _attach_image(self, label: tk.Label, key: str, url: str, max_size, on_error):
+        """
+        Affiche l'image `key` dans label : depuis la mémoire des images si on l'a déjà,
+        sinon via un téléchargement en arrière-plan (un seul par image).
+        """
+        if self.inline_images.show(key, label):
+            return
+        if key in self._image_errors:
+            on_error(label, self._image_errors[key])
             return
 
-        pil_img.thumbnail(max_size)
-        tk_img = ImageTk.PhotoImage(pil_img)
-        self.inline_images.append(tk_img)
+        self._image_labels[key] = label
+        future = self._image_loading.get(key)
+        if future is None or future.cancelled():
+            self._image_loading[key] = self.image_loader.load(
+                url,
+                max_size,
+                on_ready=lambda pil_img, k=key: self._on_image_ready(k, pil_img),
+                on_error=lambda e, k=key, cb=on_error: self._on_image_error(k, e, cb),
+            )
 
-        img_label = tk.Label(bubble, image=tk_img, bg=BG_BOT)
-        img_label.image = tk_img
-        img_label.pack(padx=10, pady=(2, 6), anchor="w")
+        def on_destroy(event, k=key, lbl=label):
+            # bulle sortie de l'écran avant le début du téléchargement : on l'annule
+            if event.widget is lbl and self._image_labels.get(k) is lbl:
+                del self._image_labels[k]
+                f = self._image_loading.get(k)
+                if f is not None and f.cancel():
+                    del self._image_loading[k]
+
+        label.bind("<Destroy>", on_destroy, add="+")
+
+    def _live_label(self, key: str):
+        label = self._image_labels.pop(key, None)
+        if label is not None and label.winfo_exists():
+            return label
+        return None
+
+    def _on_image_ready(self, key: str, pil_img):
+        """Image décodée par ImageLoader ; appelé dans le thread Tk."""
+        self._image_loading.pop(key, None)
+        # gardée même si sa bulle n'est plus affichée : pas de nouveau téléchargement au retour
+        label = self._live_label(key)
+        self.inline_images.add(key, pil_img, label)
+        if label is not None:
+            self.transcript.remeasure_widget(label)
+        self._schedule_image_check()
+
+    def _on_image_error(self, key: str, error, on_error):
+        self._image_loading.pop(key, None)
+        self._image_errors[key] = str(error)
+        label = self._live_label(key)
+        if label is not None:
+            bubble = label.master
+            on_error(label, str(error))
+            self.transcript.remeasure_widget(bubble)
+
+    def _add_image_in_bubble(self, bubble: tk.Frame, key: str, url: str, max_size=(320, 320)):
+        placeholder = self._add_image_placeholder(bubble, "🖼 Chargement de l'image...", (2, 6))
+
+        def on_error(lbl, e):
+            lbl.config(text=f"(Impossible de charger l'image : {e})")
+
+        self._attach_image(placeholder, key, url, max_size, on_error)
 
     def copy_to_clipboard(self, code: str):
         try:
@@ -275,6 +438,7 @@ class BotyAIApp:
             anchor="w",
             wraplength=self.wrap_width - 40
         )
+        code_lbl.wrap_offset = 40
         code_lbl.pack(padx=6, pady=(0, 6), anchor="w")
 
     def _add_link_row(self, bubble: tk.Frame, title: str, url: str, is_youtube: bool):
@@ -301,6 +465,7 @@ class BotyAIApp:
             padx=8,
             pady=4,
         )
+        label.wrap_offset = 60
         label.pack()
 
         def open_link(event, u=url):
@@ -312,30 +477,22 @@ class BotyAIApp:
         m = re.search(r"(?:v=|youtu\.be/)([A-Za-z0-9_-]{6,})", url)
         return m.group(1) if m else None
 
-    def _add_youtube_thumb(self, bubble: tk.Frame, url: str):
+    def _is_youtube(self, url: str) -> bool:
+        return ("youtube.com" in url) or ("youtu.be" in url)
+
+    def _add_youtube_thumb(self, bubble: tk.Frame, key: str, url: str):
         vid = self._extract_youtube_id(url)
         if not vid:
             return
         thumb_url = f"https://img.youtube.com/vi/{vid}/hqdefault.jpg"
-        try:
-            resp = requests.get(thumb_url, timeout=10)
-            resp.raise_for_status()
-            img_data = BytesIO(resp.content)
-            pil_img = Image.open(img_data)
-            pil_img.thumbnail((320, 180))
-            tk_img = ImageTk.PhotoImage(pil_img)
-            self.inline_images.append(tk_img)
-
-            lbl = tk.Label(bubble, image=tk_img, bg=BG_BOT, cursor="hand2")
-            lbl.image = tk_img
-            lbl.pack(padx=10, pady=(0, 6), anchor="w")
-
-            def open_yt(event, u=url):
-                webbrowser.open(u)
-
-            lbl.bind("<Button-1>", open_yt)
-        except Exception:
-            pass
+        lbl = self._add_image_placeholder(bubble, "▶ ...", (0, 6))
+        lbl.config(cursor="hand2")
+
+        def open_yt(event, u=url):
+            webbrowser.open(u)
+
+        lbl.bind("<Button-1>", open_yt)
+        self._attach_image(lbl, key, thumb_url, (320, 180), on_error=lambda label, e: label.destroy())
 
     # ---------- Parsing texte + code ----------
 
@@ -381,22 +538,24 @@ class BotyAIApp:
         - éventuellement 1 image
         - éventuellement des liens
         """
-        bubble = self._create_bubble(from_user=False)
-
         # Texte principal
         if is_image_query:
             text_to_show = self._one_sentence(summary) or summary or ""
         else:
             text_to_show = summary or "Je n'ai pas trouvé de réponse très claire."
 
-        self.render_text_with_code(bubble, text_to_show)
+        self.transcript.append(Message("web", text_to_show, is_image_query, list(sources or []), list(images or [])))
+
+    def _fill_web_answer(self, bubble: tk.Frame, message: Message):
+        """Contenu d'une bulle de réponse web (refait à chaque fois qu'elle revient à l'écran)."""
+        self.render_text_with_code(bubble, message.text)
 
         # Image uniquement si requête d'image
-        if is_image_query and images:
-            self._add_image_in_bubble(bubble, images[0])
+        if message.is_image_query and message.images:
+            self._add_image_in_bubble(bubble, f"{message.id}:img", message.images[0])
 
         # Liens : seulement si ce n'est PAS une requête d'image
-        if (not is_image_query) and sources:
+        if (not message.is_image_query) and message.sources:
             lbl = tk.Label(
                 bubble,
                 text="Liens utiles :",
@@ -407,17 +566,15 @@ class BotyAIApp:
             )
             lbl.pack(padx=10, pady=(2, 2), anchor="w")
 
-            for src in sources[:5]:
+            for n, src in enumerate(message.sources[:5]):
                 title = src.get("title") or src.get("url") or "Lien"
                 url = src.get("url")
                 if not url:
                     continue
-                is_yt = ("youtube.com" in url) or ("youtu.be" in url)
+                is_yt = self._is_youtube(url)
                 self._add_link_row(bubble, title, url, is_youtube=is_yt)
                 if is_yt:
-                    self._add_youtube_thumb(bubble, url)
-
-        self._scroll_to_bottom()
+                    self._add_youtube_thumb(bubble, f"{message.id}:yt{n}", url)
 
     # ---------- Logique principale ----------
 
@@ -439,72 +596,23 @@ class BotyAIApp:
             self.root.destroy()
             return
 
-        lower_text = user_text.lower()
-
-        # Détection requêtes d'image (affiche image uniquement dans ces cas)
-        image_keywords = ["image", "photo", "drapeau", "logo", "fond d'écran"]
-        base_is_image_query = any(k in lower_text for k in image_keywords)
-
-        # précision sur une image précédente
-        is_image_followup = False
-        if (not base_is_image_query) and self.last_mode == "image":
-            if len(lower_text.split()) <= 15:
-                is_image_followup = True
-
-        is_image_query = base_is_image_query or is_image_followup
-
-        # Détection d'intent
-        intent = detect_intent(user_text, self.state)
-
-        # Réponses locales (salut, heure, calcul...) -> pas de web
-        local_reply = generate_local_reply(user_text, self.state, intent)
-        if local_reply is not None and not should_use_web(intent):
-            self.add_bot_message(local_reply)
-            return
-
-        # Recherche web si nécessaire
-        if should_use_web(intent):
-            # Reformulation pour Tavily
-            if is_image_query and is_image_followup and self.last_image_question:
-                message_for_query = (
-                    "L'utilisateur cherche une image.\n"
-                    f"Sujet initial : {self.last_image_question}.\n"
-                    f"Nouvelle précision : {user_text}.\n"
-                    "Trouve une image qui correspond bien à cette précision."
-                )
-                query = build_web_query(message_for_query, self.state, intent)
+        turn = self.pipeline.start(user_text, self.state)
+        if turn.response is not None:
+            if turn.response["mode"] == "local":
+                # réponses locales (salut, heure, calcul...) -> pas de web
+                self.add_bot_message(turn.response["text"])
             else:
-                query = build_web_query(user_text, self.state, intent)
-
-            if intent == INTENT_RESEARCH:
-                self.state.last_user_question = user_text
-
-            # mémoriser le mode
-            if is_image_query:
-                self.last_mode = "image"
-                if not is_image_followup:
-                    self.last_image_question = user_text
-            else:
-                self.last_mode = "text"
-
-            self.add_bot_message("Je cherche sur le web... 🔍")
-            self.set_loading(True)
-
-            threading.Thread(
-                target=self.run_web_search,
-                args=(query, user_text, is_image_query),
-                daemon=True,
-            ).start()
+                # question déjà posée : réponse web mémorisée (knowledge.py)
+                payload = turn.response
+                self.add_web_answer_block(
+                    payload["text"], payload["is_image_query"], payload["sources"], payload["images"]
+                )
             return
 
-        # sinon : pas de web, pas de réponse locale utile
-        if local_reply is not None:
-            self.add_bot_message(local_reply)
-        else:
-            self.add_bot_message(
-                "Je ne suis pas sûr de ce que tu veux dire. "
-                "Essaye de poser une question plus précise 🙂"
-            )
+        self.add_bot_message("Je cherche sur le web... 🔍")
+        self.set_loading(True)
+
+        threading.Thread(target=self.run_web_search, args=(turn,), daemon=True).start()
 
     def _one_sentence(self, text: str) -> str:
         """Retourne seulement la première phrase d'un texte."""
@@ -517,41 +625,28 @@ class BotyAIApp:
             first += "."
         return first
 
-    def run_web_search(self, query: str, original_question: str, is_image_query: bool):
+    def run_web_search(self, turn: Turn):
         """Thread pour appeler Tavily sans bloquer l'UI."""
-        try:
-            result = search_web(query)
-        except Exception as e:
-            result = {
-                "summary": f"Erreur interne en cherchant sur le web : {e}",
-                "sources": [],
-                "images": [],
-            }
+        result = self.pipeline.search(turn)
 
         def update_ui():
             self.set_loading(False)
-
-            if not isinstance(result, dict):
-                text = str(result)
-                self.state.last_answer = text
-                self.add_bot_message(text)
-                return
-
-            summary = result.get("summary", "") or ""
-            sources = result.get("sources") or []
-            images = result.get("images") or []
-
-            self.state.last_answer = summary
+            payload = self.pipeline.finish(turn, result, self.state)
             # Une seule bulle qui contient tout (texte + code éventuel + image éventuelle + liens)
-            self.add_web_answer_block(summary, is_image_query, sources, images)
+            self.add_web_answer_block(
+                payload["text"], payload["is_image_query"], payload["sources"], payload["images"]
+            )
 
         self.root.after(0, update_ui)
 
 
 def main():
+    warm_up()
     root = tk.Tk()
     app = BotyAIApp(root)
     root.mainloop()
+    app.image_loader.shutdown()
+    app.inline_images.close()
 
 
 if __name__ == "__main__":
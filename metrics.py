@@ -0,0 +1,255 @@
+# metrics.py
+"""
+Compteurs, histogrammes et jauges du serveur, exposés sur /metrics
+(format texte Prometheus).
+
+Un dict (étiquettes -> valeur) par métrique, protégé par un verrou : sous
+le GIL, des shards par thread ne coûtaient pas moins cher qu'un verrou non
+disputé (voir bench.py metrics), et la lecture doit voir des valeurs
+cohérentes (seaux d'un histogramme).
+
+    TURNS.inc(intent="research", mode="web")
+    SEARCH_LATENCY.observe(0.42)
+    with CHAT_IN_FLIGHT.track(endpoint="chat"):
+        ...
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+# secondes ; +Inf est implicite
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric(ABC):
+    """Base : dict étiquettes -> valeur, protégé par self._lock."""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        # valeurs brutes (converties en texte seulement au rendu) : pas de str() dans le chemin chaud
+        return tuple(map(labels.get, self.labels))
+
+    @abstractmethod
+    def _snapshot(self) -> dict:
+        """À appeler avec self._lock : copie des valeurs (rien de partagé avec le chemin chaud)."""
+
+    @staticmethod
+    @abstractmethod
+    def _add(a, b):
+        """Somme de deux valeurs dont les étiquettes ont le même texte (voir _collect)."""
+
+    def _collect(self) -> dict:
+        """Copie cohérente des valeurs, avec les étiquettes converties en texte."""
+        with self._lock:
+            values = self._snapshot()
+        total: dict = {}
+        for key, value in values.items():
+            text_key = tuple(map(_text, key))
+            # deux valeurs brutes peuvent avoir le même texte (ex. 200 et "200")
+            total[text_key] = self._add(total[text_key], value) if text_key in total else value
+        return total
+
+    def _label_str(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples(dict(sorted(self._collect().items()))))
+        return lines
+
+    def _render_samples(self, values: dict) -> list[str]:
+        return [f"{self.name}{self._label_str(key)} {_num(v)}" for key, v in values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(map(labels.get, self.labels))  # self._key, sans l'appel
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _snapshot(self) -> dict:
+        return dict(self._values)
+
+    @staticmethod
+    def _add(a, b):
+        return a + b
+
+    def value(self, **labels) -> float:
+        return self._collect().get(tuple(map(_text, self._key(labels))), 0)
+
+
+class Gauge(Counter):
+    """Valeur qui monte et descend (ex. requêtes en cours) : somme des +1 / -1 de tous les threads."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(1, **labels)
+        try:
+            yield
+        finally:
+            self.inc(-1, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = tuple(map(labels.get, self.labels))  # self._key, sans l'appel
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                # [compte par seau (le dernier = +Inf), somme]
+                h = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            h[0][slot] += 1
+            h[1] += value
+
+    def value(self, **labels) -> tuple[int, float]:
+        """(nombre d'observations, somme) pour ces étiquettes."""
+        h = self._collect().get(tuple(map(_text, self._key(labels))))
+        return (sum(h[0]), h[1]) if h is not None else (0, 0.0)
+
+    def _snapshot(self) -> dict:
+        return {key: [list(counts), total] for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def _add(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1]]
+
+    def _render_samples(self, values: dict) -> list[str]:
+        lines = []
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _num(bound)
+                labels = self._label_str(key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {_num(total)}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    if isinstance(v, int) or float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+# ---------- registre ----------
+
+_registry: list[_Metric] = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render(metrics: Optional[Iterable[_Metric]] = None) -> str:
+    """Toutes les métriques, au format texte Prometheus (version 0.0.4)."""
+    lines = []
+    for metric in metrics if metrics is not None else _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------- métriques du chat ----------
+
+TURNS = _register(Counter(
+    "boty_chat_turns_total", "Tours de chat terminés, par intent et par mode (local / web).",
+    ("intent", "mode"),
+))
+CHAT_LATENCY = _register(Histogram(
+    "boty_chat_request_seconds", "Durée totale d'une requête /api/chat (ou du flux SSE).",
+    ("endpoint",),
+))
+CHAT_IN_FLIGHT = _register(Gauge(
+    "boty_chat_in_flight", "Requêtes de chat en cours.", ("endpoint",),
+))
+STAGE_LATENCY = _register(Histogram(
+    "boty_turn_stage_seconds", "Durée de chaque étape d'un tour (voir pipeline.py).", ("stage",),
+))
+SEARCH_CACHE = _register(Counter(
+    "boty_search_cache_total", "Consultations du cache de recherche (hit / miss).", ("result",),
+))
+KNOWLEDGE = _register(Counter(
+    "boty_knowledge_lookups_total",
+    "Questions de recherche cherchées dans la mémoire locale (hit = pas d'appel web).", ("result",),
+))
+IMAGE_PROBES = _register(Counter(
+    "boty_image_probes_total",
+    "Sondes des images candidates (ok, http, type, heavy, redirect, timeout, connection).", ("outcome",),
+))
+SEARCH_LATENCY = _register(Histogram(
+    "boty_search_upstream_seconds", "Durée des appels HTTP à Tavily (réussis ou non), par profil de requête.",
+    ("profile",),
+))
+SEARCH_BYTES = _register(Counter(
+    "boty_search_upstream_bytes_total", "Octets reçus de Tavily (corps des réponses), par profil de requête.",
+    ("profile",),
+))
+SEARCH_HEDGES = _register(Counter(
+    "boty_search_hedges_total",
+    "Appels Tavily doublés après le seuil de latence (sent), et doublons arrivés les premiers (won).",
+    ("result",),
+))
+SEARCH_ANSWERS = _register(Counter(
+    "boty_search_answers_total",
+    "Recherches web hors cache, par fraîcheur de la réponse (fresh, hedged, stale, error).",
+    ("freshness",),
+))
+CIRCUIT_STATE = _register(Gauge(
+    "boty_circuit_state", "État du disjoncteur devant un service amont (0 fermé, 1 demi-ouvert, 2 ouvert).",
+    ("name",),
+))
+CIRCUIT_TRANSITIONS = _register(Counter(
+    "boty_circuit_transitions_total", "Changements d'état du disjoncteur (voir circuit.py).",
+    ("name", "from_state", "to_state"),
+))
+SEARCH_IN_FLIGHT = _register(Gauge(
+    "boty_search_upstream_in_flight", "Appels HTTP à Tavily en cours.",
+))
+SEARCH_ERRORS = _register(Counter(
+    "boty_search_errors_total",
+    "Échecs de recherche Tavily, par classe (connection, http, json, timeout) et code HTTP.",
+    ("kind", "status"),
+))
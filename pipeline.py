@@ -0,0 +1,367 @@
+# pipeline.py
+"""
+Un tour de chat, étape par étape, partagé par server.py, asgi.py et main.py.
+
+    route   : requête d'image ? précision sur l'image précédente ?
+    intent  : detect_intent
+    local   : generate_local_reply (salut, heure, calcul...)
+    query   : build_web_query (+ mémoire du mode image / texte)
+    knowledge : requête déjà faite dans cette conversation ? (knowledge.py, sans réseau)
+    cache   : résultat déjà en cache ?
+    search  : appel Tavily (dans le budget du tour : réponse périmée en secours)
+    images  : images vérifiées et classées (requêtes d'image ; image_select.py)
+    finish  : mise en forme de la réponse web (+ mémoire)
+
+Chaque tour garde la durée de chacune de ses étapes (Turn.timings), et le
+pipeline cumule ces durées (stats()) pour voir où passe la latence ; elles
+partent aussi dans les métriques Prometheus (metrics.py, /metrics).
+Les backends de cache et de recherche sont injectables, pour mesurer une
+étape isolément (ex. bench avec un faux Tavily ou sans cache).
+
+    pipeline = ChatPipeline()
+    turn = pipeline.start(user_text, state)
+    if turn.response is None:
+        payload = pipeline.finish(turn, pipeline.search(turn), state)
+"""
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Callable, Optional
+
+from brain import (
+    ConversationState,
+    detect_intent,
+    should_use_web,
+    generate_local_reply,
+    build_web_query,
+    INTENT_RESEARCH,
+)
+from knowledge import KNOWLEDGE_ENABLED, KnowledgeIndex
+import image_select
+import metrics
+import tracing
+import web_search
+
+IMAGE_KEYWORDS = ("image", "photo", "drapeau", "logo", "fond d'écran")
+# phrase courte après une image = précision probable sur cette image
+IMAGE_FOLLOWUP_MAX_WORDS = 15
+
+FALLBACK_REPLY = "Je ne suis pas sûr de ce que tu veux dire. Essaye de poser une question plus précise 🙂"
+
+STAGES = ("route", "intent", "local", "query", "knowledge", "cache", "search", "images", "finish")
+
+
+@dataclass(slots=True)
+class Turn:
+    """Un tour de chat : ce qui a été décidé, et combien de temps chaque étape a pris."""
+    text: str
+    intent: Optional[str] = None
+    is_image_query: bool = False
+    is_image_followup: bool = False
+    local_reply: Optional[str] = None
+    query: Optional[str] = None
+    # ce qu'on demande à Tavily (web_search.PROFILES : "text", "image", "followup")
+    profile: str = web_search.PROFILE_FULL
+    # instant (time.monotonic()) où la recherche doit avoir répondu
+    deadline: Optional[float] = None
+    # score de la réponse trouvée dans state.knowledge (None = pas de réponse locale)
+    knowledge_score: Optional[float] = None
+    # réponse prête à envoyer (None tant qu'il faut chercher sur le web)
+    response: Optional[dict] = None
+    # étape -> durée en secondes
+    timings: dict = field(default_factory=dict)
+
+    def server_timing(self) -> str:
+        """En-tête HTTP Server-Timing (visible dans l'onglet réseau du navigateur)."""
+        return ", ".join(f"{name};dur={sec * 1000:.2f}" for name, sec in self.timings.items())
+
+
+def local_response(text: str) -> dict:
+    return {
+        "mode": "local",
+        "text": text,
+        "is_image_query": False,
+        "sources": [],
+        "images": [],
+    }
+
+
+def search_error_result(e: Exception) -> dict:
+    return {
+        "summary": f"Erreur interne en cherchant sur le web : {e}",
+        "sources": [],
+        "images": [],
+    }
+
+
+class ChatPipeline:
+    """
+    cache(query, profile=...) -> résultat ou None ; search(query, profile=...) /
+    search_async(query, profile=..., deadline=...) -> résultat (format de
+    web_search.search_web) ; profile = web_search.request_profile(intent, image ?),
+    deadline = début du tour + budget (secondes). cache=None : pas d'étape de
+    cache séparée.
+    select_images(urls, deadline=...) / select_images_async(urls, deadline=...) -> urls :
+    tri des images d'une requête d'image, sans dépasser la fin du tour (None :
+    images gardées telles quelles).
+    present(payload) -> payload : dernière retouche de la réponse web (ex. URLs proxy).
+    knowledge=True : les réponses web sont retenues dans state.knowledge et resservies
+    (mode "knowledge") aux requêtes de recherche assez proches.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[Callable[[str, str], Optional[dict]]] = web_search.cached_result,
+        search: Optional[Callable[[str, str], dict]] = None,
+        search_async: Optional[Callable[[str, str], Awaitable[dict]]] = None,
+        present: Optional[Callable[[dict], dict]] = None,
+        knowledge: bool = KNOWLEDGE_ENABLED,
+        budget: float = web_search.SEARCH_DEADLINE,
+        select_images: Optional[Callable[[list], list]] = image_select.select_images,
+        select_images_async: Optional[Callable[[list], Awaitable[list]]] = image_select.select_images_async,
+    ):
+        self.cache = cache
+        # le cache vient d'être consulté : la recherche ne le relit pas
+        if search is None:
+            search = partial(web_search.search_web, lookup=cache is None)
+        if search_async is None:
+            search_async = partial(web_search.search_web_async, lookup=cache is None)
+        self.search_backend = search
+        self.search_async_backend = search_async
+        self.present = present
+        self.knowledge = knowledge
+        self.budget = budget
+        self.select_images = select_images
+        self.select_images_async = select_images_async
+
+        self._lock = threading.Lock()
+        self.turns = 0
+        # étape -> [nombre, total (s), max (s)]
+        self._totals: dict[str, list] = {}
+
+    # ---------- mesures ----------
+
+    @contextmanager
+    def _stage(self, turn: Turn, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = turn.timings[name] = time.perf_counter() - t0
+            tracing.record(name, t0, elapsed)
+
+    def _record(self, turn: Turn):
+        metrics.TURNS.inc(intent=turn.intent, mode=turn.response.get("mode"))
+        for name, sec in turn.timings.items():
+            metrics.STAGE_LATENCY.observe(sec, stage=name)
+        with self._lock:
+            self.turns += 1
+            for name, sec in turn.timings.items():
+                total = self._totals.get(name)
+                if total is None:
+                    self._totals[name] = [1, sec, sec]
+                else:
+                    total[0] += 1
+                    total[1] += sec
+                    if sec > total[2]:
+                        total[2] = sec
+
+    def stats(self) -> dict:
+        """Par étape : nombre de passages, durée moyenne et max (ms)."""
+        with self._lock:
+            stages = {
+                name: {
+                    "count": count,
+                    "avg_ms": round(total / count * 1000, 3),
+                    "max_ms": round(peak * 1000, 3),
+                }
+                for name, (count, total, peak) in self._totals.items()
+            }
+            return {"turns": self.turns, "stages": stages}
+
+    def reset_stats(self):
+        with self._lock:
+            self.turns = 0
+            self._totals.clear()
+
+    # ---------- partie locale (sans réseau) ----------
+
+    def start(self, user_text: str, state: ConversationState) -> Turn:
+        """
+        Détection image / intent, réponse locale, construction de la requête web.
+        turn.response est rempli si le tour se termine ici ; sinon turn.query est à chercher.
+        """
+        turn = Turn(user_text, deadline=time.monotonic() + self.budget)
+
+        # Quitter (si tu veux plus tard)
+        if user_text.lower() in ("quit", "exit"):
+            turn.response = {"reply": "Fermeture du chat (côté web, à gérer).", "mode": "local"}
+            return turn
+
+        with self._stage(turn, "route"):
+            lower_text = user_text.lower()
+            base_is_image_query = any(k in lower_text for k in IMAGE_KEYWORDS)
+            turn.is_image_followup = (
+                not base_is_image_query
+                and state.last_mode == "image"
+                and len(lower_text.split()) <= IMAGE_FOLLOWUP_MAX_WORDS
+            )
+            turn.is_image_query = base_is_image_query or turn.is_image_followup
+
+        with self._stage(turn, "intent"):
+            turn.intent = detect_intent(user_text, state)
+
+        with self._stage(turn, "local"):
+            turn.local_reply = generate_local_reply(user_text, state, turn.intent)
+            use_web = should_use_web(turn.intent)
+
+        if not use_web:
+            # pas de web : réponse locale, ou demande de précision
+            reply = turn.local_reply if turn.local_reply is not None else FALLBACK_REPLY
+            state.last_answer = reply
+            turn.is_image_query = False
+            turn.response = local_response(reply)
+            self._record(turn)
+            return turn
+
+        with self._stage(turn, "query"):
+            # reformulation pour Tavily
+            if turn.is_image_query and turn.is_image_followup and state.last_image_question:
+                message_for_query = (
+                    "L'utilisateur cherche une image.\n"
+                    f"Sujet initial : {state.last_image_question}.\n"
+                    f"Nouvelle précision : {user_text}.\n"
+                    "Trouve une image qui correspond bien à cette précision."
+                )
+                turn.query = build_web_query(message_for_query, state, turn.intent)
+            else:
+                turn.query = build_web_query(user_text, state, turn.intent)
+
+            turn.profile = web_search.request_profile(turn.intent, turn.is_image_query)
+
+            if turn.intent == INTENT_RESEARCH:
+                state.last_user_question = user_text
+
+            # mémoriser le mode
+            if turn.is_image_query:
+                state.last_mode = "image"
+                if not turn.is_image_followup:
+                    state.last_image_question = user_text
+            else:
+                state.last_mode = "text"
+
+        index = self._knowledge_for(turn, state)
+        if index is not None and len(index):
+            with self._stage(turn, "knowledge"):
+                match = index.lookup(turn.query)
+            metrics.KNOWLEDGE.inc(result="miss" if match is None else "hit")
+            if match is not None:
+                turn.knowledge_score = match.score
+                self.finish(turn, match.entry.result, state)
+        return turn
+
+    def _knowledge_for(self, turn: Turn, state: ConversationState) -> Optional[KnowledgeIndex]:
+        """L'index de la conversation, pour une vraie question de recherche (pas une image, pas un suivi)."""
+        if not self.knowledge or turn.intent != INTENT_RESEARCH or turn.is_image_query:
+            return None
+        if state.knowledge is None:
+            state.knowledge = KnowledgeIndex()
+        return state.knowledge
+
+    # ---------- recherche ----------
+
+    def _lookup(self, turn: Turn) -> Optional[dict]:
+        if self.cache is None:
+            return None
+        with self._stage(turn, "cache"):
+            result = self.cache(turn.query, profile=turn.profile)
+        metrics.SEARCH_CACHE.inc(result="miss" if result is None else "hit")
+        return result
+
+    def _wants_images(self, turn: Turn, result) -> bool:
+        return turn.is_image_query and isinstance(result, dict) and bool(result.get("images"))
+
+    def search(self, turn: Turn) -> dict:
+        """Résultat de recherche pour turn.query (bloquant ; jamais d'exception)."""
+        result = self._lookup(turn)
+        if result is None:
+            with self._stage(turn, "search"):
+                try:
+                    result = self.search_backend(turn.query, profile=turn.profile, deadline=turn.deadline)
+                except Exception as e:
+                    return search_error_result(e)
+        if self.select_images is not None and self._wants_images(turn, result):
+            with self._stage(turn, "images"):
+                # copie : le résultat est peut-être partagé avec le cache
+                result = {**result, "images": self.select_images(result["images"], deadline=turn.deadline)}
+        return result
+
+    async def search_async(self, turn: Turn) -> dict:
+        """Comme search, sans bloquer la boucle asyncio."""
+        result = self._lookup(turn)
+        if result is None:
+            with self._stage(turn, "search"):
+                try:
+                    result = await self.search_async_backend(turn.query, profile=turn.profile, deadline=turn.deadline)
+                except Exception as e:
+                    return search_error_result(e)
+        if self.select_images_async is not None and self._wants_images(turn, result):
+            with self._stage(turn, "images"):
+                result = {**result, "images": await self.select_images_async(result["images"], deadline=turn.deadline)}
+        return result
+
+    # ---------- réponse web ----------
+
+    def finish(self, turn: Turn, result, state: ConversationState) -> dict:
+        """Transforme le résultat de recherche en réponse (et met à jour la mémoire)."""
+        with self._stage(turn, "finish"):
+            if not isinstance(result, dict):
+                txt = str(result)
+                state.last_answer = txt
+                payload = {
+                    "mode": "web",
+                    "text": txt,
+                    "is_image_query": turn.is_image_query,
+                    "sources": [],
+                    "images": [],
+                    "freshness": None,
+                }
+            else:
+                summary = result.get("summary", "") or ""
+                state.last_answer = summary
+                payload = {
+                    "mode": "web" if turn.knowledge_score is None else "knowledge",
+                    "text": summary,
+                    "is_image_query": turn.is_image_query,
+                    "sources": result.get("sources") or [],
+                    "images": result.get("images") or [],
+                    # "fresh", "hedged" ou "stale" (web_search) ; None pour une erreur
+                    "freshness": result.get("freshness"),
+                }
+                if self.present is not None:
+                    payload = self.present(payload)
+                # une réponse périmée (secours de web_search) n'est pas apprise
+                if turn.knowledge_score is None and result.get("freshness") in (web_search.FRESH, web_search.HEDGED):
+                    index = self._knowledge_for(turn, state)
+                    if index is not None:
+                        index.learn(turn.query, result)
+            turn.response = payload
+        self._record(turn)
+        return payload
+
+    def run(self, user_text: str, state: ConversationState) -> Turn:
+        """Un tour complet (bloquant)."""
+        turn = self.start(user_text, state)
+        if turn.response is None:
+            self.finish(turn, self.search(turn), state)
+        return turn
+
+    async def run_async(self, user_text: str, state: ConversationState) -> Turn:
+        turn = self.start(user_text, state)
+        if turn.response is None:
+            self.finish(turn, await self.search_async(turn), state)
+        return turn
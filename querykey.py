@@ -0,0 +1,279 @@
+# querykey.py
+"""
+Forme canonique des requêtes web, pour que des requêtes quasi identiques
+partagent la même entrée du cache de recherche (et le même appel Tavily).
+
+    "C'est quoi la photosynthèse ?"  -> "photosynthese"
+    "qu'est ce que la photosynthese" -> "photosynthese"
+
+1) canonical_query : minuscules, sans accents ni ponctuation, sans mots
+   vides (ni ceux ajoutés par brain.build_web_query), dans l'ordre de la
+   question. Les mots interrogatifs restent : "quand est mort X" et
+   "où est mort X" sont deux questions ; l'ordre aussi ("le chien mord
+   l'homme" / "l'homme mord le chien").
+2) NearDuplicateIndex (BOTY_CACHE_KEYS=near, pas par défaut) : les formes
+   canoniques déjà vues, indexées par MinHash (trigrammes de caractères) +
+   LSH. Une forme nouvelle prend la clé d'une forme connue qui ne diffère
+   que par une faute de frappe (une lettre en plus, en moins, changée ou
+   inversée, dans un seul mot de 5 lettres ou plus, à la même place :
+   "photosynthese" / "photosyntese"). Un mot en plus ou en moins, ou un
+   nombre différent ("impôts 2023" / "impôts 2024"), c'est une autre requête.
+   Sans dictionnaire, une faute ne se distingue pas d'un autre mot
+   ("poison" / "poisson", "autriche" / "autruche") : deux questions
+   différentes peuvent alors partager une réponse, d'où le mode canonical
+   par défaut. MinHash ne sert qu'à trouver vite les candidats.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from difflib import SequenceMatcher
+from functools import lru_cache
+from collections import Counter, OrderedDict
+from typing import Optional
+
+# exact : la requête telle quelle ; canonical : forme canonique ; near : + quasi-doublons (MinHash)
+CACHE_KEY_MODE = os.environ.get("BOTY_CACHE_KEYS", "canonical")
+# ressemblance minimale (difflib) entre un mot et sa version mal tapée
+NEAR_DUP_WORD_RATIO = float(os.environ.get("BOTY_NEAR_DUP_WORD_RATIO", "0.8"))
+NEAR_DUP_MAX_ENTRIES = int(os.environ.get("BOTY_NEAR_DUP_MAX_ENTRIES", "4096"))
+
+_WORD_RE = re.compile(r"\w+")
+# mots qui ne disent rien du sujet de la question (comparés sans accents),
+# dont ceux ajoutés par brain.build_web_query ("explication simple de ... en français")
+STOPWORDS = frozenset("""
+    a au aux avec c ce ces cest d de des du en est et explique fait
+    il j je l la le les leur m me moi mon ou par pour qu que quoi sa se ses son
+    stp sur t ta te toi ton tu un une y dis definition veux voudrais savoir plus svp
+    explication simple francais tutoriel biographie courte complement information utilisateur ajoute
+    cherche sujet initial nouvelle precision trouve correspond bien cette
+""".split())
+
+# mots interrogatifs (avant retrait des accents : "où" oui, la conjonction "ou" non) -> forme gardée
+_INTERROGATIVES = {
+    "quand": "quand", "où": "ou", "comment": "comment", "pourquoi": "pourquoi", "qui": "qui",
+    "combien": "combien", "quel": "quel", "quelle": "quel", "quels": "quel", "quelles": "quel",
+}
+# ce qu'ils deviennent dans keywords() (knowledge.py exige les mêmes des deux côtés)
+INTERROGATIVES = frozenset(_INTERROGATIVES.values())
+
+# pluriels retirés : seulement ces terminaisons (un "s" ou un "x" final seul, c'est
+# aussi "paris", "prix", "corps"...)
+_PLURALS = (
+    ("eaux", "eau"), ("ments", "ment"), ("tions", "tion"), ("sions", "sion"), ("ages", "age"),
+    ("iques", "ique"), ("istes", "iste"), ("eurs", "eur"), ("ees", "ee"),
+)
+
+
+def words(text: str) -> list[str]:
+    """Mots utiles d'une requête, dans l'ordre : minuscules, sans accents, sans mots vides, pluriel courant retiré."""
+    out = []
+    for word in _WORD_RE.findall(text.lower()):
+        interrogative = _INTERROGATIVES.get(word)
+        if interrogative is not None:
+            out.append(interrogative)
+            continue
+        word = _fold(word)
+        if word is not None:
+            out.append(word)
+    return out
+
+
+@lru_cache(maxsize=8192)
+def _fold(word: str) -> Optional[str]:
+    """Un mot sans accents ni pluriel courant ; None pour un mot vide."""
+    word = unicodedata.normalize("NFKD", word)
+    word = "".join(ch for ch in word if not unicodedata.combining(ch))
+    if word in STOPWORDS or len(word) < 2:
+        return None
+    for plural, singular in _PLURALS:
+        if word.endswith(plural) and len(word) > len(plural) + 1:
+            return word[:-len(plural)] + singular
+    return word
+
+
+def keywords(text: str) -> frozenset[str]:
+    """Les mots utiles de words(), sans ordre (knowledge.py)."""
+    return frozenset(words(text))
+
+
+def canonical_query(query: str) -> str:
+    """Forme canonique (mots utiles dans l'ordre, sans répétition) ; la requête en minuscules si elle n'a aucun mot utile."""
+    kept = words(query)
+    if not kept:
+        return " ".join(query.lower().split())
+    return " ".join(dict.fromkeys(kept))
+
+
+# ---------- quasi-doublons : MinHash + LSH ----------
+
+# MinHash "à une permutation" : chaque trigramme est haché une seule fois et
+# rangé dans un des _NUM_HASHES paniers ; la signature = le minimum de chaque
+# panier (-1 si vide). Un seul hachage par trigramme au lieu de _NUM_HASHES.
+_NUM_HASHES = 32
+# bandes de 2 paniers : une faute de frappe dans un mot court change beaucoup de trigrammes,
+# il faut que des formes peu semblables (Jaccard ~0.3) restent candidates
+_BANDS = 16
+_ROWS = _NUM_HASHES // _BANDS
+# candidats vérifiés mot à mot (difflib) au plus, par forme nouvelle
+_MAX_CHECKS = 4
+
+
+def _signature(text: str) -> tuple[int, ...]:
+    text = f" {text} "
+    mins = [-1] * _NUM_HASHES
+    for i in range(len(text) - 2):
+        h = zlib.crc32(text[i:i + 3].encode("utf-8"))
+        slot, value = h % _NUM_HASHES, h // _NUM_HASHES
+        if mins[slot] < 0 or value < mins[slot]:
+            mins[slot] = value
+    return tuple(mins)
+
+
+def same_words(a: str, b: str, ratio: float = NEAR_DUP_WORD_RATIO) -> bool:
+    """Deux formes canoniques ne diffèrent-elles que par une faute de frappe (un seul mot, une seule lettre) ?"""
+    left, right = a.split(), b.split()
+    if len(left) != len(right):
+        return False
+    differ = [(word, other) for word, other in zip(left, right) if word != other]
+    if len(differ) != 1:
+        return not differ
+    word, other = differ[0]
+    # nombres, mots courts et interrogatifs : à l'identique
+    if word.isdigit() or other.isdigit() or min(len(word), len(other)) < 5:
+        return False
+    if word in INTERROGATIVES or other in INTERROGATIVES:
+        return False
+    return _one_edit(word, other) and SequenceMatcher(None, word, other).ratio() >= ratio
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """Une seule lettre ajoutée, retirée, remplacée, ou deux lettres voisines inversées."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+    longer, shorter = (a, b) if len(a) > len(b) else (b, a)
+    return longer[i + 1:] == shorter[i:]
+
+
+class NearDuplicateIndex:
+    """
+    Formes canoniques déjà vues (LRU borné) ; resolve(forme) renvoie la forme
+    à utiliser comme clé : elle-même, ou une forme connue assez proche.
+    """
+
+    def __init__(self, word_ratio: float = NEAR_DUP_WORD_RATIO, max_entries: int = NEAR_DUP_MAX_ENTRIES):
+        self.word_ratio = word_ratio
+        self.max_entries = max_entries
+        # forme -> signature
+        self._entries: OrderedDict[str, tuple[int, ...]] = OrderedDict()
+        # (bande, valeurs de la bande) -> formes
+        self._buckets: dict[tuple, set[str]] = {}
+        # forme rattachée à une autre -> cette autre (pour ne pas recalculer sa signature)
+        self._aliases: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact = 0
+        self.merged = 0
+        self.added = 0
+
+    @staticmethod
+    def _bands(canonical: str, signature: tuple[int, ...]):
+        # le nombre de mots fait partie du seau : seules les formes de même longueur sont comparées
+        words = canonical.count(" ") + 1
+        for band in range(_BANDS):
+            values = signature[band * _ROWS:(band + 1) * _ROWS]
+            # panier vide : pas de seau (toutes les formes courtes s'y retrouveraient)
+            if -1 not in values:
+                yield words, band, values
+
+    def resolve(self, canonical: str) -> str:
+        with self._lock:
+            if canonical in self._entries:
+                self._entries.move_to_end(canonical)
+                self.exact += 1
+                return canonical
+            alias = self._aliases.get(canonical)
+            if alias is not None:
+                self.merged += 1
+                return alias
+
+        # hors verrou : c'est la partie coûteuse (une fois par forme jamais vue)
+        signature = _signature(canonical)
+
+        with self._lock:
+            # candidat -> nombre de bandes en commun ; seuls les plus proches sont vérifiés
+            shared = Counter()
+            for band in self._bands(canonical, signature):
+                shared.update(self._buckets.get(band, ()))
+            ranked = [other for other, _ in shared.most_common(_MAX_CHECKS)]
+            best = next((other for other in ranked if same_words(canonical, other, self.word_ratio)), None)
+            if best is not None:
+                self._entries.move_to_end(best)
+                self._aliases[canonical] = best
+                if len(self._aliases) > self.max_entries:
+                    self._aliases.popitem(last=False)
+                self.merged += 1
+                return best
+
+            if canonical not in self._entries:
+                self._entries[canonical] = signature
+                for band in self._bands(canonical, signature):
+                    self._buckets.setdefault(band, set()).add(canonical)
+                self.added += 1
+                while len(self._entries) > self.max_entries:
+                    self._remove(next(iter(self._entries)))
+            return canonical
+
+    def _remove(self, canonical: str):
+        signature = self._entries.pop(canonical)
+        for band in self._bands(canonical, signature):
+            bucket = self._buckets[band]
+            bucket.discard(canonical)
+            if not bucket:
+                del self._buckets[band]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._aliases.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "aliases": len(self._aliases),
+                "exact": self.exact,
+                "merged": self.merged,
+                "added": self.added,
+            }
+
+
+_near = NearDuplicateIndex()
+
+
+def cache_query(query: str, mode: Optional[str] = None) -> str:
+    """La requête à utiliser dans la clé de cache, selon `mode` (par défaut BOTY_CACHE_KEYS)."""
+    mode = mode or CACHE_KEY_MODE
+    if mode == "exact":
+        return query
+    canonical = canonical_query(query)
+    if mode == "near":
+        return _near.resolve(canonical)
+    return canonical
+
+
+def near_stats() -> dict:
+    return _near.stats()
+
+
+def reset_near():
+    _near.clear()
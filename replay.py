@@ -0,0 +1,314 @@
+# replay.py
+"""
+Rejoue des messages enregistrés (JSONL) contre /api/chat et mesure
+débit, latences (p50 / p95 / p99) et taux d'erreur.
+
+Par défaut, lance tout en local : un faux Tavily (fake_tavily.py, latence
+et erreurs configurables) et le serveur (Flask à N threads, ou ASGI),
+chacun dans son process pour ne pas partager le GIL avec le générateur.
+
+Deux façons d'envoyer la charge :
+- boucle fermée (--concurrency N) : N clients qui enchaînent les requêtes ;
+- boucle ouverte (--rate R) : arrivées de Poisson à R req/s, quel que soit
+  le temps de réponse (comme de vrais visiteurs) ; la latence est comptée
+  depuis l'heure d'arrivée prévue, pour ne pas cacher la file d'attente.
+
+    python replay.py logs.jsonl --concurrency 64 --requests 5000
+    python replay.py logs.jsonl --rate 200 --duration 30 --server asgi
+    python replay.py logs.jsonl --rate 50 --latency 0.8 --latency-dist lognormal --error-rate 0.02
+    python replay.py logs.jsonl --url http://127.0.0.1:5000 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from itertools import cycle
+
+from classify import TEXT_FIELDS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_messages(path: str, field: str | None = None) -> list[str]:
+    """Textes des lignes JSONL (champ `field`, sinon le premier de classify.TEXT_FIELDS)."""
+    messages = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(obj, str):
+                text = obj
+            elif isinstance(obj, dict):
+                names = (field,) if field else TEXT_FIELDS
+                text = next((obj[n] for n in names if isinstance(obj.get(n), str)), "")
+            else:
+                text = ""
+            if text.strip():
+                messages.append(text.strip())
+    return messages
+
+
+# ---------- serveurs locaux ----------
+
+def _spawn(argv: list[str], env: dict | None = None):
+    """Lance un script de ce dossier ; sa 1re ligne de sortie est son URL."""
+    proc = subprocess.Popen(
+        [sys.executable] + argv, cwd=HERE, stdout=subprocess.PIPE, text=True,
+        env={**os.environ, **(env or {})},
+    )
+    return proc, proc.stdout.readline().strip()
+
+
+def _stop(proc):
+    proc.terminate()
+    try:
+        proc.wait(5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def _wait_ready(url: str):
+    import requests
+
+    for _ in range(200):
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.05)
+    raise RuntimeError(f"serveur injoignable : {url}")
+
+
+@contextmanager
+def local_stack(args):
+    """Faux Tavily + serveur de chat ; renvoie (URL du serveur, URL des stats du faux Tavily)."""
+    fake_argv = [
+        "fake_tavily.py", "--latency", str(args.latency), "--latency-dist", args.latency_dist,
+        "--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency),
+        "--error-rate", str(args.error_rate), "--error-status", args.error_status,
+    ]
+    if args.seed is not None:
+        fake_argv += ["--seed", str(args.seed)]
+    fake, fake_url = _spawn(fake_argv)
+    env = {"TAVILY_ENDPOINT": fake_url}
+    if args.no_cache:
+        env["BOTY_CACHE_TTL"] = "0"
+    mode = ["--mode", "flask", "--threads", str(args.threads)] if args.server == "flask" else ["--mode", "asgi"]
+    srv = None
+    try:
+        srv, base_url = _spawn(["bench.py", "serve"] + mode, env=env)
+        _wait_ready(base_url + "/")
+        yield base_url, fake_url.rsplit("/", 1)[0] + "/stats"
+    finally:
+        if srv is not None:
+            _stop(srv)
+        _stop(fake)
+
+
+# ---------- génération de charge ----------
+
+class Results:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.outcomes: Counter = Counter()
+        self.modes: Counter = Counter()
+        self.dropped = 0
+
+    def add(self, latency: float, outcome: str, mode: str | None = None):
+        self.latencies.append(latency)
+        self.outcomes[outcome] += 1
+        if mode:
+            self.modes[mode] += 1
+
+
+async def _one(client, url: str, message: str, visitor: str, started: float, results: Results):
+    """Une requête ; la latence part de `started` (heure d'arrivée prévue en boucle ouverte)."""
+    import aiohttp
+
+    mode = None
+    try:
+        async with client.post(url, json={"message": message, "session_id": visitor}) as r:
+            data = await r.json(content_type=None)
+        if r.status != 200:
+            outcome = f"http_{r.status}"
+        else:
+            mode = data.get("mode")
+            # le serveur répond 200 avec un résumé "Erreur ..." quand Tavily échoue
+            outcome = "tavily_error" if (data.get("text") or "").startswith("Erreur") else "ok"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+    except aiohttp.ClientError as e:
+        outcome = type(e).__name__
+    except ValueError:
+        outcome = "invalid_json"
+    results.add(time.perf_counter() - started, outcome, mode)
+
+
+async def run_load(base_url: str, messages: list[str], args) -> tuple[Results, float]:
+    import aiohttp
+
+    url = base_url + "/api/chat"
+    visitors = [f"replay-visitor-{i:05d}" for i in range(max(1, args.visitors))]
+    rng = random.Random(args.seed)
+    total = args.requests or (int(args.rate * args.duration) if args.rate else len(messages))
+    work = zip(range(total), cycle(messages), cycle(visitors))
+    results = Results()
+
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    # pas de cookies : le cookie de session du serveur passerait avant le session_id du visiteur
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     cookie_jar=aiohttp.DummyCookieJar()) as client:
+        t0 = time.perf_counter()
+        if args.rate:
+            # boucle ouverte : arrivées de Poisson, indépendantes des réponses
+            tasks = set()
+            next_at = t0
+            for _, message, visitor in work:
+                next_at += rng.expovariate(args.rate)
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(tasks) >= args.max_in_flight:
+                    results.dropped += 1
+                    continue
+                task = asyncio.ensure_future(_one(client, url, message, visitor, next_at, results))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        else:
+            # boucle fermée : N clients, chacun enchaîne ses requêtes
+            async def worker():
+                for _, message, visitor in work:
+                    await _one(client, url, message, visitor, time.perf_counter(), results)
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - t0
+    return results, wall
+
+
+# ---------- rapport ----------
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(results: Results, wall: float) -> dict:
+    lat = sorted(results.latencies)
+    done = len(lat)
+    ok = results.outcomes.get("ok", 0)
+    return {
+        "requests": done,
+        "dropped": results.dropped,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(done / wall, 1) if wall else 0.0,
+        "ok_rps": round(ok / wall, 1) if wall else 0.0,
+        "p50_ms": round(_percentile(lat, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(lat, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(lat, 0.99) * 1000, 1),
+        "max_ms": round(lat[-1] * 1000, 1) if lat else 0.0,
+        "error_rate": round(1 - ok / done, 4) if done else 0.0,
+        "outcomes": dict(results.outcomes),
+        "modes": dict(results.modes),
+    }
+
+
+def print_summary(s: dict):
+    print(f"{s['requests']} requêtes en {s['wall_s']:.1f} s  débit={s['throughput_rps']:.1f} req/s "
+          f"(ok : {s['ok_rps']:.1f} req/s)" + (f"  abandonnées={s['dropped']}" if s["dropped"] else ""))
+    print(f"latence  p50={s['p50_ms']:.1f} ms  p95={s['p95_ms']:.1f} ms  "
+          f"p99={s['p99_ms']:.1f} ms  max={s['max_ms']:.1f} ms")
+    print(f"erreurs  {s['error_rate']:.2%}  {s['outcomes']}")
+    print(f"modes    {s['modes']}")
+
+
+def _get_json(url: str):
+    import requests
+
+    try:
+        return requests.get(url, timeout=5).json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejoue des messages JSONL contre /api/chat")
+    parser.add_argument("input", help="fichier JSONL (un message par ligne)")
+    parser.add_argument("--field", help=f"champ du texte (par défaut : {', '.join(TEXT_FIELDS)})")
+
+    load = parser.add_argument_group("charge")
+    load.add_argument("--concurrency", type=int, default=16, help="boucle fermée : nombre de clients")
+    load.add_argument("--rate", type=float, default=0.0, help="boucle ouverte : arrivées par seconde")
+    load.add_argument("--duration", type=float, default=30.0, help="boucle ouverte : durée (s)")
+    load.add_argument("--requests", type=int, default=0, help="nombre de requêtes (0 = tout le fichier)")
+    load.add_argument("--max-in-flight", type=int, default=10000)
+    load.add_argument("--visitors", type=int, default=1000, help="nombre de sessions différentes")
+    load.add_argument("--timeout", type=float, default=60.0)
+    load.add_argument("--seed", type=int, default=1)
+
+    target = parser.add_argument_group("serveur")
+    target.add_argument("--url", help="serveur déjà lancé (sinon : faux Tavily + serveur locaux)")
+    target.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    target.add_argument("--threads", type=int, default=32, help="threads du serveur Flask")
+    target.add_argument("--no-cache", action="store_true", help="cache de recherche désactivé")
+
+    fake = parser.add_argument_group("faux Tavily")
+    fake.add_argument("--latency", type=float, default=0.5)
+    fake.add_argument("--latency-dist", default="lognormal",
+                      choices=["fixed", "uniform", "exp", "lognormal"])
+    fake.add_argument("--slow-rate", type=float, default=0.0)
+    fake.add_argument("--slow-latency", type=float, default=10.0)
+    fake.add_argument("--error-rate", type=float, default=0.0)
+    fake.add_argument("--error-status", default="500,429")
+
+    parser.add_argument("--json-out", help="écrire le résumé (JSON) dans ce fichier")
+    args = parser.parse_args()
+
+    messages = load_messages(args.input, args.field)
+    if not messages:
+        print("aucun message dans le fichier", file=sys.stderr)
+        sys.exit(1)
+    how = f"{args.rate:g} req/s (boucle ouverte)" if args.rate else f"{args.concurrency} clients (boucle fermée)"
+    print(f"{len(messages)} messages distincts, {how}")
+
+    if args.url:
+        results, wall = asyncio.run(run_load(args.url.rstrip("/"), messages, args))
+        summary = summarize(results, wall)
+        summary["pipeline"] = _get_json(args.url.rstrip("/") + "/api/pipeline")
+    else:
+        with local_stack(args) as (base_url, fake_stats_url):
+            print(f"serveur {args.server} ({base_url}), faux Tavily {args.latency * 1000:.0f} ms "
+                  f"{args.latency_dist}, erreurs {args.error_rate:.1%}")
+            results, wall = asyncio.run(run_load(base_url, messages, args))
+            summary = summarize(results, wall)
+            summary["pipeline"] = _get_json(base_url + "/api/pipeline")
+            summary["tavily"] = _get_json(fake_stats_url)
+
+    print_summary(summary)
+    if summary.get("tavily"):
+        print(f"tavily   {summary['tavily']}")
+    stages = (summary.get("pipeline") or {}).get("stages") or {}
+    if stages:
+        print("étapes   " + "  ".join(f"{name}={s['avg_ms']:.2f} ms" for name, s in stages.items()))
+    if args.json_out:
+        summary["args"] = vars(args)
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# search_cache.py
+"""
+Cache des résultats de recherche web (devant search_web).
+
+- niveau mémoire : LRU borné en nombre d'entrées ET en octets, avec TTL
+- niveau disque (optionnel) : SQLite, pour survivre aux redémarrages
+  de server.py / main.py
+- une entrée expirée reste disponible encore stale_ttl secondes pour
+  get_stale (réponse de secours quand Tavily est trop lent ou en panne)
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def make_key(query: str, options: dict | None = None) -> str:
+    """Clé de cache : la requête finale + les options du payload (ordre stable)."""
+    return json.dumps([query, options or {}], sort_keys=True, ensure_ascii=False)
+
+
+class SearchCache:
+    """
+    Cache TTL + LRU thread-safe.
+    Les valeurs sont des dicts JSON-sérialisables (le résultat de search_web).
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600,
+        max_entries: int = 512,
+        max_bytes: int = 8 * 1024 * 1024,
+        db_path: Optional[str] = None,
+        max_disk_entries: int = 20000,
+        stale_ttl: float = 0,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+
+        # key -> (expire_at, taille_en_octets, valeur)
+        self._mem: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        if db_path:
+            self._open_db(db_path)
+
+    # ---------- SQLite ----------
+
+    def _open_db(self, path: str):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expire_at REAL NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS search_cache_stored ON search_cache(stored_at)")
+        db.execute("DELETE FROM search_cache WHERE expire_at < ?", (time.time() - self.stale_ttl,))
+        db.commit()
+        self._db = db
+
+    def _disk_get(self, key: str) -> tuple[float, str] | None:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT expire_at, value FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row
+
+    def _disk_set(self, key: str, raw: str, expire_at: float):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, expire_at, stored_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, raw, expire_at, time.time()),
+            )
+            self._disk_writes += 1
+            # on ne taille la table que de temps en temps
+            if self._disk_writes % 100 == 0:
+                self._db.execute("DELETE FROM search_cache WHERE expire_at < ?", (time.time() - self.stale_ttl,))
+                self._db.execute(
+                    "DELETE FROM search_cache WHERE key NOT IN ("
+                    " SELECT key FROM search_cache ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_disk_entries,),
+                )
+            self._db.commit()
+
+    # ---------- mémoire ----------
+
+    def _mem_put(self, key: str, value: dict, size: int, expire_at: float):
+        """À appeler avec self._lock."""
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        if size > self.max_bytes:
+            return
+        self._mem[key] = (expire_at, size, value)
+        self._bytes += size
+        while len(self._mem) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, old_size, _) = self._mem.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    # ---------- API ----------
+
+    def get(self, key: str) -> Optional[dict]:
+        return self._get(key, stale=False)
+
+    def get_stale(self, key: str) -> Optional[dict]:
+        """Valeur de `key` même expirée (depuis moins de stale_ttl secondes), sinon None."""
+        return self._get(key, stale=True)
+
+    def _get(self, key: str, stale: bool) -> Optional[dict]:
+        now = time.time()
+        # valable si expire_at > limit
+        limit = now - self.stale_ttl if stale else now
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                expire_at, size, value = entry
+                if expire_at > limit:
+                    self._mem.move_to_end(key)
+                    if stale:
+                        self.stale_hits += 1
+                    else:
+                        self.hits += 1
+                    return value
+                if expire_at + self.stale_ttl <= now:
+                    del self._mem[key]
+                    self._bytes -= size
+                    self.expirations += 1
+
+        row = self._disk_get(key)
+        if row is not None and row[0] > limit:
+            value = json.loads(row[1])
+            with self._lock:
+                self._mem_put(key, value, len(row[1].encode("utf-8")), row[0])
+                if stale:
+                    self.stale_hits += 1
+                else:
+                    self.hits += 1
+                self.disk_hits += 1
+            return value
+
+        if not stale:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def set(self, key: str, value: dict):
+        raw = json.dumps(value, ensure_ascii=False)
+        expire_at = time.time() + self.ttl
+        with self._lock:
+            self._mem_put(key, value, len(raw.encode("utf-8")), expire_at)
+        self._disk_set(key, raw, expire_at)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            self._bytes = 0
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM search_cache")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._mem),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "persistent": self._db is not None,
+            }
@@ -1,309 +1,257 @@
-<<<<<<< HEAD
-# server.py
-from flask import Flask, request, jsonify, send_from_directory
-from brain import (
-    ConversationState,
-    detect_intent,
-    should_use_web,
-    generate_local_reply,
-    build_web_query,
-    INTENT_RESEARCH,
-)
-from web_search import search_web
-import re
-
-app = Flask(__name__, static_folder=".", static_url_path="")
-
-# état global (pour une seule personne, c'est OK)
-state = ConversationState()
-state.knowledge = None
-state.last_mode = None
-state.last_image_question = None
-
-
-@app.route("/")
-def index():
-    return send_from_directory(".", "index.html")
-
-
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    data = request.get_json(force=True)
-    user_text = (data.get("message") or "").strip()
-
-    if not user_text:
-        return jsonify({"error": "empty message"}), 400
-
-    # Quitter (si tu veux plus tard)
-    if user_text.lower() in ("quit", "exit"):
-        return jsonify({"reply": "Fermeture du chat (côté web, à gérer).", "mode": "local"})
-
-    lower_text = user_text.lower()
-
-    # --- détection requête d'image ---
-    image_keywords = ["image", "photo", "drapeau", "logo", "fond d'écran"]
-    base_is_image_query = any(k in lower_text for k in image_keywords)
-
-    is_image_followup = False
-    if (not base_is_image_query) and getattr(state, "last_mode", None) == "image":
-        # phrase courte = précision probable
-        if len(lower_text.split()) <= 15:
-            is_image_followup = True
-
-    is_image_query = base_is_image_query or is_image_followup
-
-    # --- détection d'intent ---
-    intent = detect_intent(user_text, state)
-
-    # --- réponse locale (salut, heure, calcul...) ---
-    local_reply = generate_local_reply(user_text, state, intent)
-    if local_reply is not None and not should_use_web(intent):
-        state.last_answer = local_reply
-        return jsonify({
-            "mode": "local",
-            "text": local_reply,
-            "is_image_query": False,
-            "sources": [],
-            "images": [],
-        })
-
-    # --- si on doit utiliser le web ---
-    if should_use_web(intent):
-        # reformulation pour Tavily
-        if is_image_query and is_image_followup and state.last_image_question:
-            message_for_query = (
-                "L'utilisateur cherche une image.\n"
-                f"Sujet initial : {state.last_image_question}.\n"
-                f"Nouvelle précision : {user_text}.\n"
-                "Trouve une image qui correspond bien à cette précision."
-            )
-            query = build_web_query(message_for_query, state, intent)
-        else:
-            query = build_web_query(user_text, state, intent)
-
-        if intent == INTENT_RESEARCH:
-            state.last_user_question = user_text
-
-        # mémoriser le mode
-        if is_image_query:
-            state.last_mode = "image"
-            if not is_image_followup:
-                state.last_image_question = user_text
-        else:
-            state.last_mode = "text"
-
-        # appel Tavily via web_search
-        try:
-            result = search_web(query)
-        except Exception as e:
-            result = {
-                "summary": f"Erreur interne en cherchant sur le web : {e}",
-                "sources": [],
-                "images": [],
-            }
-
-        if not isinstance(result, dict):
-            txt = str(result)
-            state.last_answer = txt
-            return jsonify({
-                "mode": "web",
-                "text": txt,
-                "is_image_query": is_image_query,
-                "sources": [],
-                "images": [],
-            })
-
-        summary = result.get("summary", "") or ""
-        sources = result.get("sources") or []
-        images = result.get("images") or []
-
-        state.last_answer = summary
-
-        return jsonify({
-            "mode": "web",
-            "text": summary,
-            "is_image_query": is_image_query,
-            "sources": sources,
-            "images": images,
-        })
-
-    # --- sinon, pas de web et pas de vraie réponse locale ---
-    if local_reply is not None:
-        state.last_answer = local_reply
-        return jsonify({
-            "mode": "local",
-            "text": local_reply,
-            "is_image_query": False,
-            "sources": [],
-            "images": [],
-        })
-
-    fallback = "Je ne suis pas sûr de ce que tu veux dire. Essaye de poser une question plus précise 🙂"
-    state.last_answer = fallback
-    return jsonify({
-        "mode": "local",
-        "text": fallback,
-        "is_image_query": False,
-        "sources": [],
-        "images": [],
-    })
-
-
-if __name__ == "__main__":
-    # installe Flask avant :  py -3.12 -m pip install flask
-    app.run(host="127.0.0.1", port=5000, debug=True)
-
-=======
-# server.py
-from flask import Flask, request, jsonify, send_from_directory
-from brain import (
-    ConversationState,
-    detect_intent,
-    should_use_web,
-    generate_local_reply,
-    build_web_query,
-    INTENT_RESEARCH,
-)
-from web_search import search_web
-import re
-
-app = Flask(__name__, static_folder=".", static_url_path="")
-
-# état global (pour une seule personne, c'est OK)
-state = ConversationState()
-state.knowledge = None
-state.last_mode = None
-state.last_image_question = None
-
-
-@app.route("/")
-def index():
-    return send_from_directory(".", "index.html")
-
-
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    data = request.get_json(force=True)
-    user_text = (data.get("message") or "").strip()
-
-    if not user_text:
-        return jsonify({"error": "empty message"}), 400
-
-    # Quitter (si tu veux plus tard)
-    if user_text.lower() in ("quit", "exit"):
-        return jsonify({"reply": "Fermeture du chat (côté web, à gérer).", "mode": "local"})
-
-    lower_text = user_text.lower()
-
-    # --- détection requête d'image ---
-    image_keywords = ["image", "photo", "drapeau", "logo", "fond d'écran"]
-    base_is_image_query = any(k in lower_text for k in image_keywords)
-
-    is_image_followup = False
-    if (not base_is_image_query) and getattr(state, "last_mode", None) == "image":
-        # phrase courte = précision probable
-        if len(lower_text.split()) <= 15:
-            is_image_followup = True
-
-    is_image_query = base_is_image_query or is_image_followup
-
-    # --- détection d'intent ---
-    intent = detect_intent(user_text, state)
-
-    # --- réponse locale (salut, heure, calcul...) ---
-    local_reply = generate_local_reply(user_text, state, intent)
-    if local_reply is not None and not should_use_web(intent):
-        state.last_answer = local_reply
-        return jsonify({
-            "mode": "local",
-            "text": local_reply,
-            "is_image_query": False,
-            "sources": [],
-            "images": [],
-        })
-
-    # --- si on doit utiliser le web ---
-    if should_use_web(intent):
-        # reformulation pour Tavily
-        if is_image_query and is_image_followup and state.last_image_question:
-            message_for_query = (
-                "L'utilisateur cherche une image.\n"
-                f"Sujet initial : {state.last_image_question}.\n"
-                f"Nouvelle précision : {user_text}.\n"
-                "Trouve une image qui correspond bien à cette précision."
-            )
-            query = build_web_query(message_for_query, state, intent)
-        else:
-            query = build_web_query(user_text, state, intent)
-
-        if intent == INTENT_RESEARCH:
-            state.last_user_question = user_text
-
-        # mémoriser le mode
-        if is_image_query:
-            state.last_mode = "image"
-            if not is_image_followup:
-                state.last_image_question = user_text
-        else:
-            state.last_mode = "text"
-
-        # appel Tavily via web_search
-        try:
-            result = search_web(query)
-        except Exception as e:
-            result = {
-                "summary": f"Erreur interne en cherchant sur le web : {e}",
-                "sources": [],
-                "images": [],
-            }
-
-        if not isinstance(result, dict):
-            txt = str(result)
-            state.last_answer = txt
-            return jsonify({
-                "mode": "web",
-                "text": txt,
-                "is_image_query": is_image_query,
-                "sources": [],
-                "images": [],
-            })
-
-        summary = result.get("summary", "") or ""
-        sources = result.get("sources") or []
-        images = result.get("images") or []
-
-        state.last_answer = summary
-
-        return jsonify({
-            "mode": "web",
-            "text": summary,
-            "is_image_query": is_image_query,
-            "sources": sources,
-            "images": images,
-        })
-
-    # --- sinon, pas de web et pas de vraie réponse locale ---
-    if local_reply is not None:
-        state.last_answer = local_reply
-        return jsonify({
-            "mode": "local",
-            "text": local_reply,
-            "is_image_query": False,
-            "sources": [],
-            "images": [],
-        })
-
-    fallback = "Je ne suis pas sûr de ce que tu veux dire. Essaye de poser une question plus précise 🙂"
-    state.last_answer = fallback
-    return jsonify({
-        "mode": "local",
-        "text": fallback,
-        "is_image_query": False,
-        "sources": [],
-        "images": [],
-    })
-
-
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))  # Pour Render / Railway
-    app.run(host="0.0.0.0", port=port)
+# server.py
+from flask import Flask, Response, request, jsonify, make_response, send_from_directory, stream_with_context
+from web_search import warm_up, cache_stats
+from pipeline import ChatPipeline, Turn
+from sessions import SessionStore
+import image_proxy
+import image_select
+import metrics
+import tracing
+import json
+import os
+import re
+import time
+
+app = Flask(__name__, static_folder=".", static_url_path="")
+
+# une ConversationState par visiteur (cookie de session), plus d'état global partagé
+SESSION_COOKIE = "boty_sid"
+SESSION_IDLE_TIMEOUT = float(os.environ.get("BOTY_SESSION_IDLE", "1800"))
+MAX_SESSIONS = int(os.environ.get("BOTY_MAX_SESSIONS", "10000"))
+
+sessions = SessionStore(idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions=MAX_SESSIONS)
+
+# pré-connexion à Tavily (en arrière-plan) pour que la 1re question soit rapide
+warm_up()
+
+
+@app.route("/")
+def index():
+    return send_from_directory(".", "index.html")
+
+
+@app.route("/api/cache", methods=["GET"])
+def cache_info():
+    # compteurs du cache de recherche (hits / misses / évictions)
+    return jsonify(cache_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    # format texte Prometheus (tours par intent / mode, latences, erreurs Tavily...)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+def _admin_denied():
+    """None si le jeton d'admin (en-tête X-Admin-Token) est bon, sinon la réponse d'erreur."""
+    if not tracing.ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    if not tracing.check_admin(request.headers.get("X-Admin-Token")):
+        return jsonify({"error": "forbidden"}), 403
+    return None
+
+
+@app.route("/api/admin/profile", methods=["GET", "POST"])
+def admin_profile():
+    """POST {"requests": N} : cProfile sur les N prochaines requêtes de chat ; GET : état / dernier rapport."""
+    denied = _admin_denied()
+    if denied is not None:
+        return denied
+    if request.method == "POST":
+        data = request.get_json(silent=True) or {}
+        try:
+            n = int(data.get("requests", 20))
+        except (TypeError, ValueError):
+            return jsonify({"error": "requests doit être un entier"}), 400
+        return jsonify(tracing.profile_next(n))
+    return jsonify(tracing.stats())
+
+
+@app.route("/api/sessions", methods=["GET"])
+def sessions_info():
+    return jsonify(sessions.stats())
+
+
+@app.route("/api/image", methods=["GET"])
+def image():
+    """Miniature d'une image renvoyée par /api/chat (URL signée, voir image_proxy)."""
+    try:
+        url = image_proxy.decode_request(
+            request.args.get("u", ""), request.args.get("s", ""), request.args.get("sig", "")
+        )
+    except image_proxy.ImageError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    size = request.args["s"]
+    headers = image_proxy.cache_headers(image_proxy.etag_for(url, size))
+    if request.headers.get("If-None-Match") == headers["ETag"]:
+        return Response(status=304, headers=headers)
+
+    try:
+        data = image_proxy.get_thumbnail(url, size)
+    except image_proxy.ImageError as e:
+        # erreur mise en cache un peu par le navigateur : pas de nouvel essai à chaque affichage
+        return jsonify({"error": str(e)}), e.status, {"Cache-Control": "public, max-age=300"}
+    return Response(data, mimetype=image_proxy.content_type_of(data), headers=headers)
+
+
+@app.route("/api/image/cache", methods=["GET"])
+def image_cache_info():
+    return jsonify({**image_proxy.cache_stats(), "probes": image_select.stats()})
+
+
+def proxied_images(images: list) -> list[str]:
+    """URLs des images -> URLs du proxy /api/image (miniatures servies par ce serveur)."""
+    return [
+        image_proxy.proxy_url(url)
+        for url in images
+        if isinstance(url, str) and url.startswith(("http://", "https://"))
+    ]
+
+
+def with_thumbs(sources: list) -> list[dict]:
+    """Ajoute "thumb" (miniature proxy) aux sources YouTube ; les dicts d'origine ne sont pas modifiés."""
+    out = []
+    for src in sources:
+        url = src.get("url") or ""
+        if "youtube.com" in url or "youtu.be" in url:
+            thumb = image_proxy.youtube_thumb_url(url)
+            if thumb:
+                src = {**src, "thumb": thumb}
+        out.append(src)
+    return out
+
+
+def present_web(payload: dict) -> dict:
+    """Réponse web envoyée au navigateur : images et miniatures YouTube passent par le proxy."""
+    payload["sources"] = with_thumbs(payload["sources"])
+    payload["images"] = proxied_images(payload["images"])
+    return payload
+
+
+# le même moteur que l'appli Tk, avec les URLs d'images réécrites pour le web
+pipeline = ChatPipeline(present=present_web)
+
+
+@app.route("/api/pipeline", methods=["GET"])
+def pipeline_info():
+    # durée moyenne / max de chaque étape d'un tour (route, intent, search...)
+    return jsonify(pipeline.stats())
+
+
+@app.route("/api/chat", methods=["POST"])
+def chat():
+    t0 = time.perf_counter()
+    with metrics.CHAT_IN_FLIGHT.track(endpoint="chat"), tracing.trace("chat", endpoint="chat") as tr:
+        # _chat() peut renvoyer un tuple (réponse, code) : erreur 400
+        resp = make_response(_chat())
+        if tr is not None:
+            resp.headers["X-Trace-Id"] = tr.id
+    metrics.CHAT_LATENCY.observe(time.perf_counter() - t0, endpoint="chat")
+    return resp
+
+
+def _chat():
+    data = request.get_json(force=True)
+    user_text = (data.get("message") or "").strip()
+
+    if not user_text:
+        return jsonify({"error": "empty message"}), 400
+
+    session = sessions.get(request.cookies.get(SESSION_COOKIE) or data.get("session_id"))
+
+    # un seul tour à la fois par visiteur (les autres visiteurs ne sont pas bloqués)
+    with session.lock:
+        turn = pipeline.run(user_text, session.state)
+
+    with tracing.span("serialize"):
+        resp = jsonify(turn.response)
+    resp.headers["Server-Timing"] = turn.server_timing()
+    resp.set_cookie(SESSION_COOKIE, session.id, max_age=int(SESSION_IDLE_TIMEOUT), httponly=True, samesite="Lax")
+    return resp
+
+
+# ---------- Streaming (Server-Sent Events) ----------
+
+def sse_event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_local_events(turn: Turn) -> list[str]:
+    """Événements SSE d'un tour qui se termine sans recherche web."""
+    response = turn.response
+    text = response.get("text") or response.get("reply") or ""
+    return [
+        sse_event("intent", {"intent": turn.intent, "is_image_query": False}),
+        sse_event("local", {"text": text}),
+        sse_event("done", {"mode": "local"}),
+    ]
+
+
+def stream_web_events(payload: dict) -> list[str]:
+    """Événements SSE de la réponse web (résumé, images, sources), dans l'ordre d'affichage."""
+    return [
+        sse_event("summary", {"text": payload["text"], "is_image_query": payload["is_image_query"]}),
+        sse_event("images", {"images": payload["images"]}),
+        sse_event("sources", {"sources": payload["sources"]}),
+        sse_event("done", {"mode": payload["mode"], "freshness": payload.get("freshness")}),
+    ]
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # nginx : ne pas bufferiser le flux
+}
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Même logique que /api/chat, mais la réponse arrive en plusieurs événements :
+    intent -> (local | searching -> summary -> images -> sources) -> done.
+    Le navigateur affiche quelque chose tout de suite, sans attendre Tavily.
+    """
+    data = request.get_json(force=True)
+    user_text = (data.get("message") or "").strip()
+
+    if not user_text:
+        return jsonify({"error": "empty message"}), 400
+
+    session = sessions.get(request.cookies.get(SESSION_COOKIE) or data.get("session_id"))
+
+    def generate():
+        # mesuré jusqu'au dernier événement envoyé (le flux, pas seulement l'en-tête)
+        t0 = time.perf_counter()
+        metrics.CHAT_IN_FLIGHT.inc(endpoint="stream")
+        try:
+            with tracing.trace("chat", endpoint="stream"):
+                yield from _generate()
+        finally:
+            metrics.CHAT_IN_FLIGHT.dec(endpoint="stream")
+            metrics.CHAT_LATENCY.observe(time.perf_counter() - t0, endpoint="stream")
+
+    def _generate():
+        with session.lock:
+            state = session.state
+            turn = pipeline.start(user_text, state)
+            if turn.response is not None and turn.response["mode"] == "local":
+                yield from stream_local_events(turn)
+                return
+
+            yield sse_event("intent", {"intent": turn.intent, "is_image_query": turn.is_image_query})
+            if turn.response is not None:
+                # déjà connue (knowledge.py) : pas de recherche
+                yield from stream_web_events(turn.response)
+                return
+            yield sse_event("searching", {})
+            payload = pipeline.finish(turn, pipeline.search(turn), state)
+            yield from stream_web_events(payload)
+
+    resp = Response(stream_with_context(generate()), mimetype="text/event-stream", headers=SSE_HEADERS)
+    resp.set_cookie(SESSION_COOKIE, session.id, max_age=int(SESSION_IDLE_TIMEOUT), httponly=True, samesite="Lax")
+    return resp
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))  # Pour Render / Railway
+    app.run(host="0.0.0.0", port=port)
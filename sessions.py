@@ -0,0 +1,107 @@
+# sessions.py
+"""
+Une ConversationState par visiteur (clé = id de session du client).
+
+- un verrou par session : deux messages du même visiteur ne se mélangent pas
+- expiration après une période d'inactivité
+- nombre total de sessions borné (LRU) pour que la mémoire reste bornée
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from brain import ConversationState
+
+_VALID_ID = re.compile(r"[A-Za-z0-9_-]{8,64}")
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and _VALID_ID.fullmatch(session_id) is not None
+
+
+class Session:
+    __slots__ = ("id", "state", "lock", "_alock", "last_seen")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.state = ConversationState()
+        self.lock = threading.Lock()
+        self._alock: asyncio.Lock | None = None
+        self.last_seen = time.monotonic()
+
+    @property
+    def alock(self) -> asyncio.Lock:
+        """Verrou pour le mode asyncio (asgi.py) : on n'y bloque jamais la boucle."""
+        if self._alock is None:
+            self._alock = asyncio.Lock()
+        return self._alock
+
+
+class SessionStore:
+    def __init__(self, idle_timeout: float = 1800, max_sessions: int = 10000):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        # ordre = dernière utilisation (la plus ancienne en tête)
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _purge(self, now: float):
+        """Retire les sessions inactives (à appeler avec self._lock)."""
+        limit = now - self.idle_timeout
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_seen > limit:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def get(self, session_id: Optional[str]) -> Session:
+        """
+        Renvoie la session `session_id`, ou en crée une nouvelle
+        (avec un nouvel id si celui fourni est absent ou invalide).
+        """
+        if not is_valid_session_id(session_id):
+            session_id = new_session_id()
+
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "max_sessions": self.max_sessions,
+            }
@@ -0,0 +1,69 @@
+# singleflight.py
+"""
+Regroupement des appels identiques en cours ("single-flight").
+
+Si plusieurs threads demandent la même clé en même temps, un seul
+(le "leader") exécute réellement la fonction ; les autres attendent
+et reçoivent le même résultat (ou la même exception).
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Optional
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Exécute fn() une seule fois pour tous les appels simultanés sur `key`.
+        Les appels en attente lèvent TimeoutError s'ils attendent plus de `timeout`
+        secondes (le leader, lui, continue et son résultat servira aux suivants).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            raise TimeoutError(f"pas de réponse après {timeout} s")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
@@ -0,0 +1,50 @@
+# tests/conftest.py
+"""
+Fixtures communes : un faux Tavily local (fake_tavily.py) branché sur
+web_search, avec un cache et un disjoncteur neufs pour chaque test.
+
+    python -m pytest -q
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import circuit  # noqa: E402
+import web_search  # noqa: E402
+from fake_tavily import FakeTavily  # noqa: E402
+from search_cache import SearchCache  # noqa: E402
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Faux Tavily ; les recherches de web_search partent vers lui."""
+    with FakeTavily() as server:
+        monkeypatch.setattr(web_search, "TAVILY_ENDPOINT", server.url)
+        monkeypatch.setattr(web_search, "TAVILY_API_KEY", "tvly-test")
+        monkeypatch.setattr(web_search, "cache", SearchCache(ttl=3600, stale_ttl=3600))
+        monkeypatch.setattr(web_search, "breaker", circuit.CircuitBreaker("test", enabled=False))
+        web_search.reset_session()
+        yield server
+        web_search.reset_session()
+
+
+class FakeClock:
+    """Horloge monotone réglée à la main (CircuitBreaker(clock=...))."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
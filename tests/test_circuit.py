@@ -0,0 +1,192 @@
+# tests/test_circuit.py
+"""Disjoncteur (circuit.py) : règles d'ouverture sur une horloge fictive, puis devant un faux Tavily en panne."""
+import threading
+import time
+
+import pytest
+
+import circuit
+import metrics
+import web_search
+from circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def _breaker(clock, **kw) -> CircuitBreaker:
+    options = dict(enabled=True, window=10, min_calls=5, error_rate=0.5, slow_call=1.0, slow_rate=0.8,
+                   consecutive_failures=3, open_for=5, half_open_probes=1, close_after=2, clock=clock)
+    options.update(kw)
+    return CircuitBreaker("test", **options)
+
+
+def _calls(breaker, results, elapsed: float = 0.01):
+    for ok in results:
+        assert breaker.allow()
+        breaker.record(ok, elapsed)
+
+
+def test_consecutive_failures_open_after_successes(clock):
+    breaker = _breaker(clock)
+    # une fenêtre pleine de réussites : le taux d'erreur reste bas, les échecs d'affilée suffisent
+    _calls(breaker, [True] * 20 + [False] * 2)
+    assert breaker.state == CLOSED
+    _calls(breaker, [False])
+    assert breaker.state == OPEN
+
+
+def test_a_success_resets_the_streak(clock):
+    breaker = _breaker(clock)
+    _calls(breaker, [True] * 20 + [False, False, True, False, False, True])
+    assert breaker.state == CLOSED
+    assert breaker.stats()["streak"] == 0
+
+
+def test_error_rate_over_the_window(clock):
+    breaker = _breaker(clock, consecutive_failures=100)
+    _calls(breaker, [True, False, True, False])
+    assert breaker.state == CLOSED  # moins de min_calls appels
+    _calls(breaker, [False])
+    assert breaker.state == OPEN
+
+
+def test_old_calls_leave_the_window(clock):
+    breaker = _breaker(clock, consecutive_failures=100)
+    _calls(breaker, [False] * 4)
+    clock.advance(11)
+    _calls(breaker, [True] * 4 + [False])
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_open(clock):
+    breaker = _breaker(clock)
+    _calls(breaker, [True] * 5, elapsed=2.0)
+    assert breaker.state == OPEN
+
+
+def test_open_rejects_then_half_open_closes(clock):
+    breaker = _breaker(clock)
+    _calls(breaker, [False] * 3)
+    assert not breaker.allow()
+    clock.advance(4.9)
+    assert not breaker.allow()
+    assert breaker.stats()["rejected"] == 2
+
+    clock.advance(0.2)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # un seul essai à la fois
+    assert not breaker.allow()
+    breaker.record(True, 0.01)
+    _calls(breaker, [True])
+    assert breaker.state == CLOSED
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = _breaker(clock)
+    _calls(breaker, [False] * 3)
+    clock.advance(5)
+    _calls(breaker, [False])
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_calls_started_before_opening_are_ignored(clock):
+    breaker = _breaker(clock)
+    _calls(breaker, [False] * 3)
+    breaker.record(False, 0.01)
+    clock.advance(5)
+    assert breaker.allow() and breaker.state == HALF_OPEN
+
+
+def test_disabled_breaker_lets_everything_through(clock):
+    breaker = _breaker(clock, enabled=False)
+    _calls(breaker, [False] * 50)
+    assert breaker.allow()
+
+
+def test_state_gauge_and_transitions(clock):
+    breaker = CircuitBreaker("jauge", window=10, min_calls=5, consecutive_failures=2,
+                             open_for=5, close_after=1, clock=clock)
+    before = metrics.CIRCUIT_TRANSITIONS.value(name="jauge", from_state=CLOSED, to_state=OPEN)
+    _calls(breaker, [False] * 2)
+    assert metrics.CIRCUIT_STATE.value(name="jauge") == 2
+    clock.advance(5)
+    _calls(breaker, [True])
+    assert metrics.CIRCUIT_STATE.value(name="jauge") == 0
+    assert metrics.CIRCUIT_TRANSITIONS.value(name="jauge", from_state=CLOSED, to_state=OPEN) == before + 1
+
+
+# ---------- devant un faux Tavily ----------
+
+CLIENTS = 10
+PER_CLIENT = 4
+OPEN_FOR = 0.5
+
+
+def _load(tag: str) -> dict:
+    """CLIENTS visiteurs en parallèle, PER_CLIENT recherches distinctes chacun ; {fraîcheur: nombre}."""
+    freshness = {}
+    lock = threading.Lock()
+
+    def client(c):
+        for i in range(PER_CLIENT):
+            result = web_search.search_web(f"panne {tag} visiteur {c + 100} question {i + 100}",
+                                           deadline=time.monotonic() + 1.0)
+            with lock:
+                key = result.get("freshness") or "erreur"
+                freshness[key] = freshness.get(key, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(CLIENTS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return freshness
+
+
+@pytest.fixture
+def outage(fake, monkeypatch):
+    """Disjoncteur actif et cache périmé, après du trafic réussi ; puis Tavily répond 503."""
+    monkeypatch.setattr(web_search, "breaker", CircuitBreaker(
+        "test-panne", window=10, min_calls=5, consecutive_failures=5, open_for=OPEN_FOR))
+    web_search.cache.ttl = 0.2
+    fake.latency = 0.02
+    _load("a")
+    time.sleep(0.3)
+    fake.status = 503
+    fake.reset_counters()
+    return fake
+
+
+def test_outage_trips_after_successful_traffic(outage):
+    freshness = _load("a")
+    assert web_search.breaker.state == OPEN
+    # ouvert en quelques échecs d'affilée, pas au bout de la moitié des recherches
+    assert outage.request_count <= CLIENTS * 2
+    # chaque question déjà posée a sa réponse périmée
+    assert freshness == {web_search.STALE: CLIENTS * PER_CLIENT}
+
+
+def test_outage_then_recovery(outage):
+    _load("a")
+    assert web_search.breaker.state == OPEN
+
+    # la panne continue : seuls quelques essais du demi-ouvert partent
+    outage.reset_counters()
+    end = time.monotonic() + OPEN_FOR * 1.5
+    turns = 0
+    while time.monotonic() < end:
+        web_search.search_web(f"en continu {turns + 100}", deadline=time.monotonic() + 1.0)
+        turns += 1
+        time.sleep(0.02)
+    assert outage.request_count <= 3 < turns
+
+    # Tavily revient : fermé après close_after essais réussis
+    outage.status = 200
+    outage.reset_counters()
+    end = time.monotonic() + OPEN_FOR * 4
+    while web_search.breaker.state != circuit.CLOSED and time.monotonic() < end:
+        web_search.search_web(f"retour {turns + 100}", deadline=time.monotonic() + 1.0)
+        turns += 1
+        time.sleep(0.02)
+    assert web_search.breaker.state == circuit.CLOSED
+    assert outage.request_count <= web_search.breaker.close_after + 1
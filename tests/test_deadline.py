@@ -0,0 +1,104 @@
+# tests/test_deadline.py
+"""Budget de temps d'une recherche : réponse périmée à temps, rafraîchissement en fond, erreur sinon."""
+import asyncio
+import time
+
+import pytest
+
+import metrics
+import web_search
+
+# pas de chiffre seul : la clé canonique ignore les mots d'une lettre (querykey)
+QUESTIONS = [f"sujet périmé {i + 100}" for i in range(3)]
+DEADLINE = 0.3
+
+
+def _search(query: str) -> tuple[dict, float]:
+    t0 = time.perf_counter()
+    result = web_search.search_web(query, deadline=time.monotonic() + DEADLINE)
+    return result, time.perf_counter() - t0
+
+
+async def _search_async(query: str) -> tuple[dict, float]:
+    t0 = time.perf_counter()
+    result = await web_search.search_web_async(query, deadline=time.monotonic() + DEADLINE)
+    return result, time.perf_counter() - t0
+
+
+@pytest.fixture
+def expired(fake):
+    """Les QUESTIONS ont une réponse en cache, expirée mais encore servable."""
+    web_search.cache.ttl = 0.2
+    for query in QUESTIONS:
+        web_search.search_web(query)
+    time.sleep(0.3)
+    # les réponses rafraîchies, elles, restent
+    web_search.cache.ttl = 3600
+    fake.reset_counters()
+    return fake
+
+
+def _wait_for_refresh(fake, calls: int, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while fake.request_count < calls or any(web_search.cached_result(q) is None for q in QUESTIONS):
+        assert time.monotonic() < end, "pas de rafraîchissement en fond"
+        time.sleep(0.02)
+
+
+def test_slow_upstream_serves_stale_then_refreshes(expired):
+    expired.latency = DEADLINE * 2
+    for query in QUESTIONS:
+        result, elapsed = _search(query)
+        assert result["freshness"] == web_search.STALE
+        assert elapsed < DEADLINE + 0.2
+
+    _wait_for_refresh(expired, len(QUESTIONS))
+    for query in QUESTIONS:
+        result, _ = _search(query)
+        assert result.get("freshness") != web_search.STALE
+    assert expired.request_count == len(QUESTIONS)
+
+
+def test_slow_upstream_serves_stale_async(expired):
+    expired.latency = DEADLINE * 2
+
+    async def run():
+        try:
+            return [await _search_async(q) for q in QUESTIONS]
+        finally:
+            await asyncio.sleep(expired.latency + 0.2)
+            await web_search.aclose_async_session()
+
+    for result, elapsed in asyncio.run(run()):
+        assert result["freshness"] == web_search.STALE
+        assert elapsed < DEADLINE + 0.2
+    _wait_for_refresh(expired, len(QUESTIONS))
+
+
+def test_upstream_error_serves_stale(expired):
+    expired.status = 500
+    for query in QUESTIONS:
+        result, _ = _search(query)
+        assert result["freshness"] == web_search.STALE
+        assert not result["summary"].startswith("Erreur")
+
+
+def test_nothing_cached_gives_an_error_at_the_deadline(fake):
+    fake.latency = DEADLINE * 3
+    before = metrics.SEARCH_ERRORS.value(kind="timeout", status="")
+    result, elapsed = _search("jamais vu")
+    assert "délai dépassé" in result["summary"]
+    assert result["sources"] == [] and "freshness" not in result
+    assert elapsed < DEADLINE + 0.2
+    # le budget de la requête est dépassé, pas celui de l'appel Tavily
+    assert metrics.SEARCH_ERRORS.value(kind="timeout", status="") == before
+
+
+def test_upstream_timeout_is_counted_once(fake, monkeypatch):
+    fake.latency = 0.5
+    monkeypatch.setattr(web_search, "SEARCH_TIMEOUT", 0.1)
+    web_search.reset_session()
+    before = metrics.SEARCH_ERRORS.value(kind="timeout", status="")
+    result, _ = _search("appel trop long")
+    assert "délai dépassé" in result["summary"]
+    assert metrics.SEARCH_ERRORS.value(kind="timeout", status="") == before + 1
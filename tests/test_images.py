@@ -0,0 +1,159 @@
+# tests/test_images.py
+"""Images : redirections vérifiées (urlguard.py) dans le proxy et les sondes, URLs signées, classement."""
+import asyncio
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+import image_proxy
+import image_select
+import urlguard
+from fake_tavily import FakeTavily
+from image_cache import ImageCache
+from image_select import Probe
+
+
+@pytest.fixture
+def server():
+    with FakeTavily() as fake:
+        yield fake
+
+
+def _base(fake) -> str:
+    return fake.url.rsplit("/", 1)[0]
+
+
+def _redirect(fake, target: str) -> str:
+    return f"{_base(fake)}/redirect?{urlencode({'to': target})}"
+
+
+def _internal(fake) -> str:
+    """Le même serveur sous un autre nom d'hôte (localhost) : une adresse non publique."""
+    return _base(fake).replace("127.0.0.1", "localhost") + "/img/32x32.jpg"
+
+
+# ---------- urlguard ----------
+
+def test_same_host_redirect_is_followed():
+    assert urlguard.check_redirect("http://127.0.0.1:8000/a", "/b?c=1") == "http://127.0.0.1:8000/b?c=1"
+
+
+@pytest.mark.parametrize("location", [
+    "http://localhost/img.jpg",
+    "http://10.0.0.1/img.jpg",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/img.jpg",
+    "ftp://example.org/img.jpg",
+])
+def test_redirect_to_another_host_must_be_public(location):
+    with pytest.raises(urlguard.RedirectError):
+        urlguard.check_redirect("http://images.example.org/a.jpg", location)
+
+
+def test_redirect_check_async():
+    with pytest.raises(urlguard.RedirectError):
+        asyncio.run(urlguard.check_redirect_async("http://images.example.org/a.jpg", "http://127.0.0.1/"))
+    url = asyncio.run(urlguard.check_redirect_async("http://127.0.0.1:8000/a", "b"))
+    assert url == "http://127.0.0.1:8000/b"
+
+
+# ---------- proxy ----------
+
+@pytest.fixture
+def proxy_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_proxy, "cache", ImageCache(str(tmp_path)))
+
+
+def test_signed_urls(server):
+    url = server.image_url(64, 64)
+    proxied = image_proxy.proxy_url(url)
+    params = dict(p.split("=", 1) for p in proxied.split("?", 1)[1].split("&"))
+    assert image_proxy.decode_request(params["u"], params["s"], params["sig"]) == url
+    with pytest.raises(image_proxy.ImageError) as e:
+        image_proxy.decode_request(params["u"], "yt", params["sig"])
+    assert e.value.status == 403
+
+
+def test_proxy_follows_a_same_host_redirect(server, proxy_cache):
+    data = image_proxy.get_thumbnail(_redirect(server, server.image_url(64, 64)))
+    assert image_proxy.content_type_of(data) == "image/jpeg"
+
+
+def test_proxy_refuses_a_redirect_to_an_internal_address(server, proxy_cache):
+    with pytest.raises(image_proxy.ImageError) as e:
+        image_proxy.get_thumbnail(_redirect(server, _internal(server)))
+    assert e.value.status == 502
+    assert server.image_count == 0
+
+
+def test_proxy_stops_after_too_many_redirects(server, proxy_cache):
+    url = server.image_url(64, 64)
+    for _ in range(urlguard.MAX_REDIRECTS + 1):
+        url = _redirect(server, url)
+    with pytest.raises(image_proxy.ImageError) as e:
+        image_proxy.get_thumbnail(url)
+    assert e.value.status == 502
+
+
+def test_image_route(server, proxy_cache):
+    import server as flask_server
+
+    client = flask_server.app.test_client()
+    proxied = image_proxy.proxy_url(server.image_url(64, 64))
+    r = client.get(proxied)
+    assert r.status_code == 200 and r.mimetype == "image/jpeg"
+    assert client.get(proxied, headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+    assert client.get("/api/image?u=aHR0cDovL2V4YW1wbGUub3Jn&s=answer&sig=x").status_code == 403
+    assert client.get(image_proxy.proxy_url(server.image_url(64, 64).replace("/img/", "/nope/"))).status_code == 404
+    assert client.get(image_proxy.proxy_url(_redirect(server, _internal(server)))).status_code == 502
+
+
+# ---------- sondes ----------
+
+@pytest.fixture
+def probes():
+    image_select.cache.clear()
+    yield
+    image_select.cache.clear()
+
+
+def test_probe_redirects(server, probes):
+    same = _redirect(server, server.image_url(64, 64) + "?r=1")
+    internal = _redirect(server, _internal(server))
+    assert image_select.probe(same).outcome == "ok"
+    assert image_select.probe(internal).outcome == "redirect"
+    assert image_select.select_images([internal, same]) == [same]
+
+
+def test_probe_redirects_async(server, probes):
+    same = _redirect(server, server.image_url(64, 64) + "?r=2")
+    internal = _redirect(server, _internal(server))
+
+    async def run():
+        try:
+            return [(await image_select.probe_async(u)).outcome for u in (same, internal)]
+        finally:
+            await image_select.aclose_async_session()
+
+    assert asyncio.run(run()) == ["ok", "redirect"]
+
+
+def test_rank_keeps_unsure_images_last():
+    urls = ["mort", "lent", "pas sondée", "bonne", "lourde"]
+    probes = {
+        "mort": Probe("mort", False, "http", 404),
+        "lent": Probe("lent", False, "timeout"),
+        "bonne": Probe("bonne", True, "ok", 200, 1000),
+        "lourde": Probe("lourde", True, "ok", 200, image_select.IMAGE_HEAVY_BYTES + 1),
+    }
+    assert image_select.rank(urls, probes) == ["bonne", "lourde", "pas sondée", "lent"]
+
+
+def test_slow_images_are_kept_and_deadline_skips_probes(server, probes):
+    slow = [f"{_base(server)}/img/64x64.jpg?delay=3&n={i}" for i in range(3)]
+    assert image_select.select_images(slow) == slow
+    t0 = time.perf_counter()
+    assert image_select.select_images([u + "&fin=1" for u in slow], deadline=time.monotonic()) == \
+        [u + "&fin=1" for u in slow]
+    assert time.perf_counter() - t0 < 0.1
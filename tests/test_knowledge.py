@@ -0,0 +1,93 @@
+# tests/test_knowledge.py
+"""Mémoire locale d'une conversation (knowledge.py) : resservie pour la même question, jamais pour une autre."""
+import pytest
+
+import web_search
+from brain import ConversationState
+from knowledge import KnowledgeIndex
+from pipeline import ChatPipeline
+
+
+def _result(query: str, freshness: str = web_search.FRESH) -> dict:
+    return {"summary": f"résumé : {query}", "sources": [{"title": query, "url": "https://example.org"}],
+            "images": [], "freshness": freshness}
+
+
+# ---------- index seul ----------
+
+def test_same_question_reworded_is_found():
+    index = KnowledgeIndex()
+    index.learn("c'est quoi les volcans", _result("volcans"))
+    match = index.lookup("qu'est-ce que les volcans ?")
+    assert match is not None and match.score == 1.0
+
+
+@pytest.mark.parametrize("first, second", [
+    ("quand est mort napoléon", "où est mort napoléon"),
+    ("quand est mort napoléon", "mort de napoléon"),
+    ("pourquoi le chien mord l'homme", "pourquoi l'homme mord le chien"),
+])
+def test_other_question_on_the_same_subject_is_not_found(first, second):
+    index = KnowledgeIndex()
+    index.learn(first, _result(first))
+    assert index.lookup(second) is None
+
+
+def test_answers_without_sources_are_not_learned():
+    index = KnowledgeIndex()
+    assert index.learn("c'est quoi les volcans", {"summary": "Erreur Tavily 500", "sources": [], "images": []}) is None
+    assert len(index) == 0
+
+
+def test_relearning_replaces_the_entry():
+    index = KnowledgeIndex()
+    index.learn("les volcans", _result("ancien"))
+    index.learn("Les volcans ?", _result("nouveau"))
+    assert len(index) == 1
+    assert index.lookup("les volcans").entry.result["summary"] == "résumé : nouveau"
+
+
+def test_old_entries_expire():
+    index = KnowledgeIndex(max_age=0)
+    index.learn("les volcans", _result("volcans"))
+    assert index.lookup("les volcans") is None
+    assert index.expirations == 1
+
+
+# ---------- dans le pipeline ----------
+# des questions de plus de 6 mots : plus courtes, elles complètent la précédente (brain.py)
+
+NAPOLEON = "en quelle année est mort le célèbre empereur napoléon bonaparte"
+
+
+def _second_turn(first: str, second: str, freshness: str = web_search.FRESH) -> tuple[str, list[str]]:
+    """Mode de réponse du 2e tour d'une conversation, et les requêtes envoyées au web."""
+    queries = []
+
+    def search(query, **kw):
+        queries.append(query)
+        return _result(query, freshness)
+
+    pipe = ChatPipeline(cache=None, search=search, knowledge=True)
+    state = ConversationState()
+    pipe.run(first, state)
+    return pipe.run(second, state).response["mode"], queries
+
+
+def test_pipeline_reuses_a_fresh_answer():
+    mode, queries = _second_turn(NAPOLEON, NAPOLEON.capitalize() + " ?")
+    assert mode == "knowledge"
+    assert len(queries) == 1
+
+
+@pytest.mark.parametrize("first, second, freshness", [
+    (NAPOLEON, "où est mort le célèbre empereur napoléon bonaparte exactement", web_search.FRESH),
+    ("pourquoi est-ce que le chien mord souvent l'homme", "pourquoi est-ce que l'homme mord souvent le chien",
+     web_search.FRESH),
+    # une réponse périmée (Tavily en panne) n'est pas retenue
+    (NAPOLEON, NAPOLEON, web_search.STALE),
+])
+def test_pipeline_goes_to_the_web(first, second, freshness):
+    mode, queries = _second_turn(first, second, freshness)
+    assert mode == "web"
+    assert len(queries) == 2
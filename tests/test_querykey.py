@@ -0,0 +1,75 @@
+# tests/test_querykey.py
+"""Clés de cache (querykey.py) : les variantes d'écriture se rejoignent, les questions différentes jamais."""
+import pytest
+
+import querykey
+
+# questions différentes qui ne doivent jamais partager une clé
+DISTINCT = [
+    ("quand est mort napoléon", "où est mort napoléon"),
+    ("quand est mort napoléon", "pourquoi est mort napoléon"),
+    ("le chien mord l'homme", "l'homme mord le chien"),
+    ("qui a écrit les misérables", "quand a été écrit les misérables"),
+    ("prix du pain à paris", "pari sur le prix du pain"),
+    ("c'est quoi un poison", "c'est quoi un poisson"),
+    ("capitale de l'autriche", "capitale de l'autruche"),
+    ("histoire de la france", "histoire de la trance"),
+    ("qui est Marion Cotillard", "qui est Marlon Cotillard"),
+    ("impôts 2023", "impôts 2024"),
+]
+
+# même question, écrite autrement
+SAME = [
+    ("C'est quoi la photosynthèse ?", "c est quoi la photosynthese"),
+    ("Capitale de la FRANCE", "capitale de la france !!"),
+    ("les châteaux de la Loire", "château de la loire"),
+]
+
+
+@pytest.fixture(autouse=True)
+def _near_index():
+    querykey.reset_near()
+    yield
+    querykey.reset_near()
+
+
+def test_default_mode_is_canonical():
+    assert querykey.CACHE_KEY_MODE == "canonical"
+
+
+@pytest.mark.parametrize("a, b", DISTINCT)
+def test_distinct_questions_never_share_a_key(a, b):
+    assert querykey.cache_query(a) != querykey.cache_query(b)
+
+
+@pytest.mark.parametrize("a, b", SAME)
+def test_spelling_variants_share_a_key(a, b):
+    assert querykey.cache_query(a) == querykey.cache_query(b)
+
+
+def test_words_keep_order_and_interrogatives():
+    assert querykey.words("Où est mort Napoléon ?") == ["ou", "mort", "napoleon"]
+    # "ou" conjonction : un mot vide
+    assert querykey.words("chien ou chat") == ["chien", "chat"]
+
+
+def test_plurals_only_for_known_endings():
+    assert querykey.words("les châteaux") == ["chateau"]
+    assert querykey.words("paris prix") == ["paris", "prix"]
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("photosynthese", "photosyntese", True),
+    ("photosynthese", "photosynthses", False),
+    ("impots 2023", "impots 2024", False),
+    ("quand mort napoleon", "ou mort napoleon", False),
+    ("chien mord homme", "homme mord chien", False),
+])
+def test_same_words(a, b, expected):
+    assert querykey.same_words(a, b) is expected
+
+
+def test_near_mode_merges_a_typo_on_a_long_word():
+    first = querykey.cache_query("c'est quoi la photosynthèse", "near")
+    assert querykey.cache_query("c'est quoi la photosyntèse", "near") == first
+    assert querykey.near_stats()["merged"] == 1
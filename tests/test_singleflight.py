@@ -0,0 +1,118 @@
+# tests/test_singleflight.py
+"""Un seul appel Tavily pour des recherches identiques simultanées (singleflight.py, web_search)."""
+import threading
+import time
+
+import pytest
+
+import metrics
+import web_search
+from singleflight import SingleFlight
+
+QUESTION = "c'est quoi la photosynthèse"
+
+
+def _concurrent(fn, clients: int) -> list:
+    """fn() lancé par `clients` threads au même moment ; leurs résultats."""
+    barrier = threading.Barrier(clients)
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        barrier.wait()
+        result = fn()
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_do_runs_once_for_concurrent_callers():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return "résultat"
+
+    results = _concurrent(lambda: flight.do("clé", slow), 10)
+    assert results == ["résultat"] * 10
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_do_shares_the_leader_error():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("panne")
+
+    def call():
+        try:
+            flight.do("clé", failing)
+        except ValueError as e:
+            return str(e)
+
+    assert _concurrent(call, 5) == ["panne"] * 5
+
+
+def test_do_follower_timeout_leaves_leader_running():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return "fini"
+
+    leader = threading.Thread(target=lambda: flight.do("clé", slow))
+    leader.start()
+    started.wait()
+    with pytest.raises(TimeoutError):
+        flight.do("clé", slow, timeout=0.05)
+    leader.join()
+    assert flight.leaders == 1 and flight.coalesced == 1
+
+
+def test_search_web_shares_one_upstream_call(fake):
+    fake.latency = 0.2
+    results = _concurrent(lambda: web_search.search_web(QUESTION), 20)
+    assert fake.request_count == 1
+    assert len({r["summary"] for r in results}) == 1
+    assert not results[0]["summary"].startswith("Erreur")
+
+
+def test_search_web_upstream_error_reaches_everyone_and_is_not_cached(fake):
+    fake.latency, fake.status = 0.2, 500
+    before = metrics.SEARCH_ERRORS.value(kind="http", status="500")
+    results = _concurrent(lambda: web_search.search_web(QUESTION), 20)
+    assert fake.request_count == 1
+    assert all(r["summary"].startswith("Erreur Tavily 500") for r in results)
+    # une erreur comptée par appel Tavily, pas par requête en attente
+    assert metrics.SEARCH_ERRORS.value(kind="http", status="500") == before + 1
+
+    fake.status = 200
+    assert not web_search.search_web(QUESTION)["summary"].startswith("Erreur")
+    assert fake.request_count == 2
+
+
+def test_search_web_followers_give_up_leader_fills_cache(fake, monkeypatch):
+    fake.latency = 0.5
+    monkeypatch.setattr(web_search, "SINGLEFLIGHT_WAIT", 0.1)
+    before = metrics.SEARCH_ERRORS.value(kind="timeout", status="")
+    results = _concurrent(lambda: web_search.search_web(QUESTION), 10)
+    timeouts = [r for r in results if "délai dépassé" in r["summary"]]
+    assert fake.request_count == 1
+    assert len(timeouts) == len(results) - 1
+    # délai d'attente d'un suiveur : pas un échec de Tavily
+    assert metrics.SEARCH_ERRORS.value(kind="timeout", status="") == before
+
+    assert web_search.cached_result(QUESTION) is not None
+    assert fake.request_count == 1
@@ -0,0 +1,326 @@
+# tracing.py
+"""
+Traces des requêtes de chat (où passe le temps d'un tour lent ?) et
+profilage cProfile à la demande.
+
+Traces : chaque requête /api/chat reçoit un id (en-tête X-Trace-Id) et des
+"spans" (étapes de ChatPipeline, appel HTTP à Tavily, sérialisation...).
+L'échantillonnage se décide à la fin de la requête ("tail sampling") :
+on garde toujours les requêtes lentes (>= BOTY_TRACE_SLOW_MS) ou en erreur,
+et une fraction BOTY_TRACE_SAMPLE des autres. Les traces gardées sont
+ajoutées en JSONL dans BOTY_TRACE_FILE (pas de fichier = traces désactivées).
+
+Profilage : profile_next(n) active cProfile pour les n requêtes suivantes
+(une à la fois), puis écrit les statistiques cumulées dans BOTY_PROFILE_DIR
+(.pstats + résumé texte). Déclenché par /api/admin/profile (BOTY_ADMIN_TOKEN).
+cProfile ne suit que le thread qui traite la requête : les appels Tavily
+(pool de web_search), les sondes d'images (pool de image_select) et les
+rafraîchissements en fond tournent dans d'autres threads et n'apparaissent
+que comme du temps d'attente (Future.result, wait...) ; leur détail est
+dans les spans de la trace (tavily.http, images.probe). Avec asgi.py, une
+seule boucle : le profil compte aussi les autres requêtes servies pendant
+ce temps.
+
+Désactivé, le coût est d'une lecture de variable par requête et d'un
+ContextVar.get() par span.
+
+    with tracing.trace("chat", endpoint="chat") as tr:
+        with tracing.span("serialize"):
+            ...
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Optional
+
+TRACE_FILE = os.environ.get("BOTY_TRACE_FILE") or None
+TRACE_SLOW_MS = float(os.environ.get("BOTY_TRACE_SLOW_MS", "1000"))
+TRACE_SAMPLE = float(os.environ.get("BOTY_TRACE_SAMPLE", "0.01"))
+PROFILE_DIR = os.environ.get("BOTY_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "boty-profiles")
+# pas de jeton = routes d'admin désactivées
+ADMIN_TOKEN = os.environ.get("BOTY_ADMIN_TOKEN") or None
+PROFILE_MAX_REQUESTS = 1000
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("boty_trace", default=None)
+_NOOP = nullcontext()
+
+
+class Trace:
+    __slots__ = ("id", "name", "attrs", "spans", "error", "_t0", "_wall")
+
+    def __init__(self, name: str, attrs: dict):
+        self.id = secrets.token_hex(8)
+        self.name = name
+        self.attrs = attrs
+        self.spans: list[dict] = []
+        self.error: Optional[str] = None
+        self._t0 = time.perf_counter()
+        self._wall = time.time()
+
+    def add(self, name: str, start: float, duration: float, attrs: dict):
+        span = {"name": name, "start_ms": round((start - self._t0) * 1000, 3), "ms": round(duration * 1000, 3)}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "t0")
+
+    def __init__(self, trace: Trace, name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.attrs["error"] = repr(exc)
+        self.trace.add(self.name, self.t0, time.perf_counter() - self.t0, self.attrs)
+        return False
+
+
+def span(name: str, **attrs):
+    """Mesure un bloc `with` dans la trace en cours (rien s'il n'y en a pas)."""
+    trace = _current.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attrs)
+
+
+def record(name: str, start: float, duration: float, **attrs):
+    """Ajoute une étape déjà mesurée (start = time.perf_counter() au début)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, duration, attrs)
+
+
+def set_error(message: str):
+    """Marque la trace en cours comme en erreur (elle sera gardée)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.error = message
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.id if trace is not None else None
+
+
+# ---------- écriture JSONL (échantillonnage en fin de requête) ----------
+
+class _Sink:
+    def __init__(self, path: str, slow_ms: float, sample: float):
+        self.path = path
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self.seen = 0
+        self.kept = 0
+
+    def finish(self, trace: Trace, duration: float):
+        ms = duration * 1000
+        if trace.error is not None:
+            reason = "error"
+        elif ms >= self.slow_ms:
+            reason = "slow"
+        elif random.random() < self.sample:
+            reason = "sample"
+        else:
+            reason = None
+        with self._lock:
+            self.seen += 1
+            if reason is None:
+                return
+            self.kept += 1
+        line = json.dumps({
+            "trace_id": trace.id,
+            "name": trace.name,
+            "ts": round(trace._wall, 3),
+            "ms": round(ms, 3),
+            "kept": reason,
+            "error": trace.error,
+            **trace.attrs,
+            "spans": trace.spans,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_sink: Optional[_Sink] = None
+
+
+def configure(path: Optional[str], slow_ms: float = TRACE_SLOW_MS, sample: float = TRACE_SAMPLE):
+    """(Ré)active les traces vers `path` ; path=None les désactive."""
+    global _sink
+    old, _sink = _sink, (_Sink(path, slow_ms, sample) if path else None)
+    if old is not None:
+        old.close()
+
+
+if TRACE_FILE:
+    configure(TRACE_FILE)
+
+
+# ---------- profilage à la demande ----------
+
+class _Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.active = False
+        self.profiled = 0
+        self._stats: Optional[pstats.Stats] = None
+        self.last_report: Optional[dict] = None
+
+    def start(self, n: int):
+        with self._lock:
+            self.remaining = max(0, min(n, PROFILE_MAX_REQUESTS))
+            self.profiled = 0
+            self._stats = None
+
+    def claim(self) -> Optional[cProfile.Profile]:
+        """Un profileur pour cette requête, ou None (pas demandé, ou une autre requête est profilée)."""
+        with self._lock:
+            if self.remaining <= 0 or self.active:
+                return None
+            self.remaining -= 1
+            self.active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def release(self, profile: cProfile.Profile):
+        profile.disable()
+        with self._lock:
+            self.active = False
+            self.profiled += 1
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            if self.remaining == 0:
+                self._dump()
+
+    def _dump(self):
+        """À appeler avec self._lock : écrit les stats cumulées (.pstats + texte)."""
+        stats, self._stats = self._stats, None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S"))
+        stats.dump_stats(base + ".pstats")
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(40)
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        self.last_report = {
+            "requests": self.profiled,
+            "pstats": base + ".pstats",
+            "text": base + ".txt",
+            # le serveur n'est pas forcément accessible en shell : le résumé est aussi renvoyé par l'API
+            "summary": out.getvalue(),
+        }
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "remaining": self.remaining,
+                "profiled": self.profiled,
+                "last_report": self.last_report,
+            }
+
+
+_profiler = _Profiler()
+
+
+def profile_next(n: int) -> dict:
+    """Active cProfile pour les n prochaines requêtes tracées (seulement dans le thread de la requête)."""
+    _profiler.start(n)
+    return _profiler.status()
+
+
+def profile_status() -> dict:
+    return _profiler.status()
+
+
+def check_admin(token: Optional[str]) -> bool:
+    """Jeton d'admin valide ? (toujours False si BOTY_ADMIN_TOKEN n'est pas défini)"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+# ---------- une requête ----------
+
+class _TraceContext:
+    __slots__ = ("name", "attrs", "trace", "token", "profile", "t0")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self) -> Optional[Trace]:
+        self.trace = Trace(self.name, self.attrs) if _sink is not None else None
+        self.token = _current.set(self.trace) if self.trace is not None else None
+        self.profile = _profiler.claim()
+        self.t0 = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.t0
+        if self.profile is not None:
+            _profiler.release(self.profile)
+        if self.trace is not None:
+            try:
+                _current.reset(self.token)
+            except ValueError:
+                # générateur (flux SSE) terminé depuis un autre contexte
+                _current.set(None)
+            if exc is not None:
+                self.trace.error = repr(exc)
+            sink = _sink
+            if sink is not None:
+                sink.finish(self.trace, duration)
+        return False
+
+
+def trace(name: str, **attrs):
+    """
+    Contexte d'une requête : renvoie la Trace (ou None si les traces sont désactivées).
+    Sans traces ni profilage demandé, c'est un simple nullcontext.
+    """
+    if _sink is None and _profiler.remaining <= 0:
+        return _NOOP
+    return _TraceContext(name, attrs)
+
+
+def stats() -> dict:
+    sink = _sink
+    return {
+        "enabled": sink is not None,
+        "file": sink.path if sink else None,
+        "seen": sink.seen if sink else 0,
+        "kept": sink.kept if sink else 0,
+        "profile": _profiler.status(),
+    }
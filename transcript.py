@@ -0,0 +1,261 @@
+# transcript.py
+"""
+Historique du chat "virtualisé" pour l'appli Tk (main.py).
+
+Les messages sont gardés dans une simple liste (le modèle), à part des widgets.
+Seuls les messages visibles (plus une marge) existent en tant que widgets,
+placés dans le Canvas avec create_window ; les autres ne coûtent qu'une
+hauteur dans un tableau. Quand on fait défiler, les widgets qui sortent
+de la zone sont détruits ou recyclés pour les messages qui entrent.
+
+La hauteur d'un message jamais affiché est estimée, puis corrigée la
+première fois qu'il est affiché (une seule passe de mise en page).
+"""
+from __future__ import annotations
+
+import bisect
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from itertools import count
+from typing import Callable, Optional
+
+_ids = count(1)
+
+
+@dataclass(slots=True)
+class Message:
+    kind: str                       # "user", "bot", "system" ou "web"
+    text: str = ""
+    is_image_query: bool = False
+    sources: list = field(default_factory=list)
+    images: list = field(default_factory=list)
+    id: int = field(default_factory=lambda: next(_ids))
+
+
+class Renderer(ABC):
+    """Ce que la Transcript attend de l'appli : créer / recycler / estimer."""
+
+    @abstractmethod
+    def build(self, message: Message, parent):
+        """Crée le widget (un Frame) d'un message ; parent = le Canvas."""
+
+    def reuse(self, widget, message: Message) -> bool:
+        """Réutilise un widget libre pour `message` ; False si impossible."""
+        return False
+
+    @abstractmethod
+    def estimate_height(self, message: Message) -> int:
+        """Hauteur probable (px) d'un message jamais affiché."""
+
+    def kind_of(self, message: Message) -> Optional[str]:
+        """Les widgets ne sont recyclés qu'entre messages du même genre (None = jamais)."""
+        return message.kind
+
+
+class Transcript:
+    def __init__(self, canvas, renderer: Renderer, overscan_px: int = 600, pool_size: int = 30):
+        self.canvas = canvas
+        self.renderer = renderer
+        self.overscan_px = overscan_px
+        self.pool_size = pool_size
+
+        self.messages: list[Message] = []
+        self._heights: list[int] = []
+        self._measured: list[bool] = []
+        # _offsets[i] = haut du message i ; _offsets[-1] = hauteur totale
+        self._offsets: list[int] = [0]
+        self._dirty_from: Optional[int] = None
+
+        # index du message -> (widget, id de l'item du canvas)
+        self._live: dict[int, tuple[object, int]] = {}
+        self._pool: dict[str, list] = {}
+        self._refresh_job = None
+        self._width = 0
+
+        self.built = 0
+        self.recycled = 0
+        self.on_change: Optional[Callable[[], None]] = None
+
+    # ---------- modèle ----------
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def append(self, message: Message) -> Message:
+        """Ajoute un message ; une seule passe de mise en page (et on suit le bas si on y était)."""
+        at_bottom = self._at_bottom()
+        h = self.renderer.estimate_height(message)
+        self.messages.append(message)
+        self._heights.append(h)
+        self._measured.append(False)
+        self._offsets.append(self._offsets[-1] + h)
+        self.refresh(scroll_to_end=at_bottom)
+        return message
+
+    def _at_bottom(self) -> bool:
+        try:
+            return self.canvas.yview()[1] >= 0.999
+        except Exception:
+            return True
+
+    def _set_height(self, index: int, height: int):
+        if self._heights[index] != height:
+            self._heights[index] = height
+            if self._dirty_from is None or index < self._dirty_from:
+                self._dirty_from = index
+
+    def _fix_offsets(self):
+        start = self._dirty_from
+        if start is None:
+            return
+        self._dirty_from = None
+        offsets = self._offsets
+        heights = self._heights
+        y = offsets[start]
+        for i in range(start, len(heights)):
+            offsets[i] = y
+            y += heights[i]
+        offsets[len(heights)] = y
+        # on ne déplace que les widgets vivants situés après la modification
+        for index, (_, item) in self._live.items():
+            if index >= start:
+                self.canvas.coords(item, 0, offsets[index])
+
+    def mark_stale(self):
+        """
+        La largeur a changé : les messages seront re-mesurés à leur prochain affichage.
+        Les anciennes hauteurs restent comme estimation (bien meilleure qu'un calcul à vide).
+        """
+        self._measured = [False] * len(self.messages)
+
+    def remeasure(self, indexes) -> None:
+        """Re-mesure des messages déjà affichés (après un changement de contenu ou de largeur)."""
+        at_bottom = self._at_bottom()
+        self.canvas.update_idletasks()
+        for index in indexes:
+            live = self._live.get(index)
+            if live is not None:
+                self._set_height(index, live[0].winfo_reqheight())
+                self._measured[index] = True
+        self._fix_offsets()
+        self._update_scrollregion()
+        if at_bottom:
+            self.canvas.yview_moveto(1.0)
+
+    def remeasure_widget(self, widget) -> None:
+        """Re-mesure le message qui contient `widget` (ex. une image qui vient d'arriver)."""
+        while widget is not None and widget.master is not self.canvas:
+            widget = widget.master
+        for index, (live, _) in self._live.items():
+            if live is widget:
+                self.remeasure([index])
+                return
+
+    # ---------- fenêtre visible ----------
+
+    def visible_range(self, margin: Optional[int] = None) -> tuple[int, int]:
+        """Indices [début, fin) des messages à matérialiser (zone visible + marge)."""
+        if margin is None:
+            margin = self.overscan_px
+        top = self.canvas.canvasy(0) - margin
+        bottom = self.canvas.canvasy(0) + self.canvas.winfo_height() + margin
+        first = max(0, bisect.bisect_right(self._offsets, top) - 1)
+        last = min(len(self.messages), bisect.bisect_left(self._offsets, bottom))
+        return first, max(first, last)
+
+    def live_indexes(self) -> list[int]:
+        return sorted(self._live)
+
+    def widget_for(self, index: int):
+        live = self._live.get(index)
+        return live[0] if live else None
+
+    def schedule_refresh(self):
+        """À appeler depuis le scroll : un seul refresh par rafale d'événements."""
+        if self._refresh_job is None:
+            self._refresh_job = self.canvas.after_idle(self._run_scheduled_refresh)
+
+    def _run_scheduled_refresh(self):
+        self._refresh_job = None
+        self.refresh()
+
+    def _release(self, index: int):
+        widget, item = self._live.pop(index)
+        self.canvas.delete(item)
+        kind = self.renderer.kind_of(self.messages[index])
+        pool = self._pool.setdefault(kind, []) if kind is not None else None
+        if pool is not None and len(pool) < self.pool_size:
+            pool.append(widget)
+        else:
+            widget.destroy()
+
+    def _materialize(self, index: int):
+        message = self.messages[index]
+        kind = self.renderer.kind_of(message)
+        pool = self._pool.get(kind) if kind is not None else None
+        widget = None
+        while pool:
+            candidate = pool.pop()
+            if self.renderer.reuse(candidate, message):
+                widget = candidate
+                self.recycled += 1
+                break
+            candidate.destroy()
+        if widget is None:
+            widget = self.renderer.build(message, self.canvas)
+            self.built += 1
+        item = self.canvas.create_window(
+            0, self._offsets[index], window=widget, anchor="nw", width=self._width or self.canvas.winfo_width()
+        )
+        self._live[index] = (widget, item)
+
+    def refresh(self, scroll_to_end: bool = False):
+        """Matérialise la zone visible, libère le reste, corrige les hauteurs mesurées."""
+        self._width = max(self.canvas.winfo_width(), 1)
+        for _ in range(3):  # les hauteurs mesurées peuvent décaler la zone visible
+            if scroll_to_end:
+                self._update_scrollregion()
+                self.canvas.yview_moveto(1.0)
+            first, last = self.visible_range()
+
+            for index in [i for i in self._live if i < first or i >= last]:
+                self._release(index)
+            new = [i for i in range(first, last) if i not in self._live]
+            for index in new:
+                self._materialize(index)
+
+            unmeasured = [i for i in new if not self._measured[i]]
+            if not unmeasured:
+                break
+            # une seule passe de géométrie pour tous les nouveaux widgets
+            self.canvas.update_idletasks()
+            for index in unmeasured:
+                self._set_height(index, self._live[index][0].winfo_reqheight())
+                self._measured[index] = True
+            self._fix_offsets()
+
+        self._fix_offsets()
+        self._update_scrollregion()
+        if scroll_to_end:
+            self.canvas.yview_moveto(1.0)
+        if self.on_change is not None:
+            self.on_change()
+
+    def _update_scrollregion(self):
+        self.canvas.configure(scrollregion=(0, 0, self._width, self._offsets[-1]))
+
+    def resize(self, width: int):
+        """Nouvelle largeur du canvas : les widgets vivants suivent."""
+        self._width = width
+        for _, item in self._live.values():
+            self.canvas.itemconfigure(item, width=width)
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self.messages),
+            "live_widgets": len(self._live),
+            "pooled_widgets": sum(len(p) for p in self._pool.values()),
+            "built": self.built,
+            "recycled": self.recycled,
+            "total_height": self._offsets[-1],
+        }
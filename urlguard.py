@@ -0,0 +1,71 @@
+# urlguard.py
+"""
+Redirections suivies à la main, pour les téléchargements vers des hôtes
+quelconques (proxy d'images, sondes d'images).
+
+Une URL d'image vient de Tavily : on la suit, mais une redirection vers un
+autre hôte n'est suivie que s'il n'a que des adresses publiques. Sinon une
+page pourrait renvoyer le serveur vers son propre réseau (127.0.0.1,
+10.x, métadonnées du cloud...) sans que personne ne voie la réponse.
+
+    url = check_redirect(url, resp.headers["Location"])   # RedirectError si refusée
+"""
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import os
+import socket
+from urllib.parse import urljoin, urlsplit
+
+MAX_REDIRECTS = int(os.environ.get("BOTY_IMAGE_MAX_REDIRECTS", "3"))
+
+# codes HTTP de redirection (avec un en-tête Location)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class RedirectError(Exception):
+    """Redirection invalide, vers une adresse non publique, ou trop de redirections."""
+
+
+def _target(origin: str, location: str) -> tuple[str, str | None, int]:
+    """(URL absolue, hôte à vérifier ou None si c'est le même, port)."""
+    url = urljoin(origin, location)
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise RedirectError("redirection invalide")
+    # même hôte que l'URL de départ : rien de nouveau
+    if parts.hostname == urlsplit(origin).hostname:
+        return url, None, 0
+    return url, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+def _check_addresses(infos) -> None:
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global:
+            raise RedirectError("redirection refusée (adresse non publique)")
+
+
+def check_redirect(origin: str, location: str) -> str:
+    """URL absolue de la redirection `location` reçue pour `origin` ; RedirectError si refusée."""
+    url, host, port = _target(origin, location)
+    if host is not None:
+        try:
+            infos = socket.getaddrinfo(host, port)
+        except OSError as e:
+            raise RedirectError(f"hôte introuvable : {e}")
+        _check_addresses(infos)
+    return url
+
+
+async def check_redirect_async(origin: str, location: str) -> str:
+    """Comme check_redirect, sans bloquer la boucle asyncio (résolution DNS)."""
+    url, host, port = _target(origin, location)
+    if host is not None:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port)
+        except OSError as e:
+            raise RedirectError(f"hôte introuvable : {e}")
+        _check_addresses(infos)
+    return url
@@ -1,85 +1,411 @@
 # web_search.py
+import asyncio
+import contextvars
+import json
+import os
 import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+from urllib.parse import urlsplit
+
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import circuit
+import metrics
+import querykey
+import tracing
+from brain import INTENT_FOLLOWUP_MORE
+from search_cache import SearchCache, make_key
 
 # --------- CONFIG TAVILY ---------
-TAVILY_API_KEY = "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"
-TAVILY_ENDPOINT = "https://api.tavily.com/search"
+TAVILY_API_KEY = os.environ.get("TAVILY_API_KEY", "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")
+TAVILY_ENDPOINT = os.environ.get("TAVILY_ENDPOINT", "https://api.tavily.com/search")
+SEARCH_TIMEOUT = 15
+
+# --------- CACHE DES RÉSULTATS ---------
+# BOTY_CACHE_DB=chemin/vers/cache.sqlite pour garder le cache entre deux lancements
+CACHE_TTL = float(os.environ.get("BOTY_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("BOTY_CACHE_MAX_ENTRIES", "512"))
+CACHE_MAX_BYTES = int(os.environ.get("BOTY_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+CACHE_DB_PATH = os.environ.get("BOTY_CACHE_DB") or None
+# une réponse expirée sert encore de secours (délai dépassé, erreur) pendant ce temps
+CACHE_STALE_TTL = float(os.environ.get("BOTY_CACHE_STALE_TTL", "86400"))
+
+cache = SearchCache(
+    ttl=CACHE_TTL,
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    db_path=CACHE_DB_PATH,
+    stale_ttl=CACHE_STALE_TTL,
+)
+
+
+def _cache_key(query: str, options: dict) -> str:
+    """
+    Clé de cache (et de déduplication des appels en cours) : forme canonique de la
+    requête (querykey.py, BOTY_CACHE_KEYS ; en mode near, rattachée à une requête
+    quasi identique déjà vue).
+    """
+    return make_key(querykey.cache_query(query), options)
+
+
+# --------- REQUÊTES IDENTIQUES EN COURS ---------
+# Un seul appel Tavily par requête identique en cours ; les autres threads
+# attendent son résultat (au plus SINGLEFLIGHT_WAIT secondes).
+SINGLEFLIGHT_WAIT = float(os.environ.get("BOTY_SINGLEFLIGHT_WAIT", str(SEARCH_TIMEOUT * 2)))
+
+# --------- BUDGET DE TEMPS, HEDGE, RÉPONSE PÉRIMÉE ---------
+# Une recherche a un budget (SEARCH_DEADLINE secondes, ou la fin du budget du
+# tour de chat) : passé ce délai, ou si Tavily répond une erreur, on renvoie la
+# dernière réponse connue même expirée (cache.get_stale) ; l'appel continue en
+# fond et rafraîchit le cache. Hedge (BOTY_SEARCH_HEDGE=1) : si Tavily n'a pas
+# répondu après le percentile HEDGE_PERCENTILE des latences récentes, une 2e
+# requête identique part et la première réponse gagne (au plus HEDGE_MAX_RATIO
+# des recherches sont doublées : chaque appel Tavily coûte un crédit).
+SEARCH_DEADLINE = float(os.environ.get("BOTY_SEARCH_DEADLINE", "10"))
+SEARCH_WORKERS = int(os.environ.get("BOTY_SEARCH_WORKERS", "64"))
+HEDGE_ENABLED = os.environ.get("BOTY_SEARCH_HEDGE", "0") != "0"
+HEDGE_PERCENTILE = float(os.environ.get("BOTY_HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.environ.get("BOTY_HEDGE_MIN_DELAY", "0.3"))
+# tant qu'il n'y a pas assez de mesures
+HEDGE_DEFAULT_DELAY = float(os.environ.get("BOTY_HEDGE_DEFAULT_DELAY", "3.0"))
+HEDGE_MAX_RATIO = float(os.environ.get("BOTY_HEDGE_MAX_RATIO", "0.1"))
+_HEDGE_MIN_SAMPLES = 20
+
+# "freshness" des réponses : à jour, doublée (le hedge a répondu le premier), périmée (secours)
+FRESH = "fresh"
+HEDGED = "hedged"
+STALE = "stale"
+
+
+class _LatencyWindow:
+    """Latences des derniers appels Tavily réussis (seuil du hedge)."""
+
+    def __init__(self, size: int = 200):
+        self._values: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if len(values) < _HEDGE_MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+_latencies = _LatencyWindow()
+_hedge_lock = threading.Lock()
+_started = 0
+_hedged = 0
+
+
+def _count_search():
+    global _started
+    with _hedge_lock:
+        _started += 1
+
+
+def _hedge_delay() -> Optional[float]:
+    """Après combien de secondes doubler un appel (None : pas de hedge)."""
+    if not HEDGE_ENABLED:
+        return None
+    p = _latencies.percentile(HEDGE_PERCENTILE)
+    return max(HEDGE_MIN_DELAY, p if p is not None else HEDGE_DEFAULT_DELAY)
+
+
+def _claim_hedge() -> bool:
+    global _hedged
+    with _hedge_lock:
+        if _hedged >= HEDGE_MAX_RATIO * _started:
+            return False
+        _hedged += 1
+    metrics.SEARCH_HEDGES.inc(result="sent")
+    return True
+
+
+def reset_search_stats():
+    """Oublie les latences mesurées et les compteurs de hedge (benchmarks)."""
+    global _started, _hedged
+    _latencies.clear()
+    with _hedge_lock:
+        _started = _hedged = 0
+
+# --------- TRANSPORT HTTP ---------
+# Une seule Session partagée : les connexions TCP/TLS restent ouvertes (keep-alive)
+# et sont réutilisées d'un appel à l'autre, depuis n'importe quel thread
+# (threads Flask, thread run_web_search de l'appli Tk).
+HTTP_POOL_SIZE = int(os.environ.get("BOTY_HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_RETRIES = int(os.environ.get("BOTY_HTTP_CONNECT_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("BOTY_HTTP_BACKOFF", "0.3"))
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def _build_session() -> requests.Session:
+    """Crée la Session avec un pool de connexions dimensionné et des retries sur la connexion."""
+    # On ne rejoue que les erreurs de connexion (DNS, refus, handshake) :
+    # une fois la requête partie, on ne la renvoie pas (read=0, status=0).
+    retry = Retry(
+        total=HTTP_CONNECT_RETRIES,
+        connect=HTTP_CONNECT_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=HTTP_BACKOFF,
+        raise_on_status=False,
+    )
+    # les appels Tavily partent des SEARCH_WORKERS threads de _search_pool : une
+    # connexion gardée par thread, sinon urllib3 en jette et refait un handshake TLS
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=max(HTTP_POOL_SIZE, SEARCH_WORKERS),
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Renvoie la Session HTTP partagée (créée au premier appel, thread-safe)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def reset_session() -> None:
+    """Ferme la Session partagée (elle sera recréée au prochain appel)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def warm_up(background: bool = True) -> None:
+    """
+    Pré-connexion à Tavily : ouvre une connexion (DNS + TCP + TLS) au démarrage
+    pour que la première vraie question ne paie pas ce coût.
+    """
+    parts = urlsplit(TAVILY_ENDPOINT)
+    origin = f"{parts.scheme}://{parts.netloc}/"
+
+    def _connect():
+        try:
+            get_session().head(origin, timeout=5)
+        except Exception:
+            # pas grave : la connexion sera ouverte au premier appel
+            pass
+
+    if background:
+        threading.Thread(target=_connect, daemon=True).start()
+    else:
+        _connect()
+
+
+_WS_RE = re.compile(r"\s+")
 
 
 def _clean(text: str) -> str:
     """Nettoie un peu le texte (espaces multiples, etc.)."""
-    text = re.sub(r"\s+", " ", text)
+    text = _WS_RE.sub(" ", text)
     return text.strip()
 
 
-def search_web(query: str) -> dict:
+class SearchError(Exception):
     """
-    Appelle Tavily directement via HTTP avec un timeout
-    et renvoie un dict :
-    {
-      "summary": "texte résumé",
-      "sources": [{"title": ..., "url": ...}, ...],
-      "images": ["url_image1", "url_image2", ...]
-    }
+    Échec d'un appel Tavily ; le message est le résumé montré à l'utilisateur.
+    kind : "connection", "http" (status = code HTTP), "json", "timeout" (appel
+    Tavily trop long), "circuit" (disjoncteur ouvert, pas d'appel), "cancelled"
+    (appel annulé) ou "config".
     """
 
-    if not TAVILY_API_KEY.strip():
-        return {
-            "summary": "Erreur Tavily : aucune clé API configurée.",
-            "sources": [],
-            "images": [],
-        }
-
-    payload = {
-        "api_key": TAVILY_API_KEY,
-        "query": query,
-        "search_depth": "basic",
-        "include_answer": True,
-        "max_results": 5,
-        "include_images": True,
+    def __init__(self, message: str, kind: str = "connection", status: int | None = None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+
+_TIMEOUT_MESSAGE = "Erreur Tavily (délai dépassé) : la recherche prend trop de temps."
+
+
+def _search_error(message: str, kind: str, status: int | None = None) -> SearchError:
+    """Crée l'erreur et la compte (une fois par appel Tavily raté, pas par requête en attente)."""
+    metrics.SEARCH_ERRORS.inc(kind=kind, status=status or "")
+    tracing.set_error(message)
+    return SearchError(message, kind, status)
+
+
+# --------- DISJONCTEUR ---------
+# Tavily en panne ou qui nous limite : au lieu d'attendre connexion / timeout à
+# chaque tour, les appels échouent tout de suite (réponse en cache, même
+# expirée, sinon message d'erreur) et quelques essais testent le retour.
+breaker = circuit.CircuitBreaker("tavily")
+
+
+def _is_outage(e: SearchError) -> bool:
+    """Erreur qui compte pour le disjoncteur (panne, limite de débit) ; un 400 ou un JSON cassé non."""
+    if e.kind in ("connection", "timeout"):
+        return True
+    return e.kind == "http" and e.status is not None and (e.status == 429 or e.status >= 500)
+
+
+def _circuit_error() -> SearchError:
+    return _search_error(
+        "Erreur Tavily : service indisponible pour le moment, réessaie dans quelques instants.",
+        "circuit",
+    )
+
+
+def _error_result(summary: str) -> dict:
+    return {
+        "summary": summary,
+        "sources": [],
+        "images": [],
     }
 
-    # 1) Appel HTTP avec timeout
+
+# --------- PROFILS DE REQUÊTE ---------
+# On ne demande à Tavily que ce que les interfaces afficheront : les images
+# seulement pour les requêtes d'image (sans les sources), les sources (5 au
+# plus) seulement pour les autres. BOTY_SEARCH_PROFILES=0 : toujours "full".
+SEARCH_PROFILES_ENABLED = os.environ.get("BOTY_SEARCH_PROFILES", "1") != "0"
+
+PROFILE_FULL = "full"  # tout (ancien comportement, appels sans profil)
+PROFILE_TEXT = "text"
+PROFILE_IMAGE = "image"
+PROFILE_FOLLOWUP = "followup"
+
+PROFILES = {
+    PROFILE_FULL: {"include_answer": True, "max_results": 5, "include_images": True},
+    PROFILE_TEXT: {"include_answer": True, "max_results": 5, "include_images": False},
+    # un seul résultat : son texte sert de résumé si Tavily ne donne pas de réponse
+    PROFILE_IMAGE: {"include_answer": True, "max_results": 1, "include_images": True},
+    # "explique plus" : l'utilisateur veut une réponse plus détaillée
+    PROFILE_FOLLOWUP: {"include_answer": "advanced", "max_results": 5, "include_images": False},
+}
+
+
+def request_profile(intent: str | None, is_image_query: bool) -> str:
+    """Profil de requête Tavily d'un tour, d'après son intent et la détection d'image."""
+    if not SEARCH_PROFILES_ENABLED:
+        return PROFILE_FULL
+    if is_image_query:
+        return PROFILE_IMAGE
+    if intent == INTENT_FOLLOWUP_MORE:
+        return PROFILE_FOLLOWUP
+    return PROFILE_TEXT
+
+
+def _build_options(profile: str = PROFILE_FULL) -> dict:
+    """Options du payload Tavily (tout sauf la clé API et la requête)."""
+    return {"search_depth": "basic", **PROFILES[profile]}
+
+
+def _fetch(query: str, options: dict, profile: str = PROFILE_FULL) -> dict:
+    """
+    Appelle Tavily et renvoie le JSON décodé.
+    Lève SearchError (avec le message d'erreur à afficher) si ça échoue,
+    tout de suite si le disjoncteur est ouvert.
+    """
+    if not breaker.allow():
+        raise _circuit_error()
+    t0 = time.perf_counter()
+    ok = False
     try:
-        resp = requests.post(TAVILY_ENDPOINT, json=payload, timeout=15)
+        data = _post(query, options, profile)
+        ok = True
+        return data
+    except SearchError as e:
+        ok = not _is_outage(e)
+        raise
+    finally:
+        breaker.record(ok, time.perf_counter() - t0)
+
+
+def _post(query: str, options: dict, profile: str) -> dict:
+    payload = {"api_key": TAVILY_API_KEY, "query": query, **options}
+
+    # 1) Appel HTTP avec timeout (connexion réutilisée via la Session partagée)
+    t0 = time.perf_counter()
+    try:
+        with metrics.SEARCH_IN_FLIGHT.track():
+            resp = get_session().post(TAVILY_ENDPOINT, json=payload, timeout=SEARCH_TIMEOUT)
+    except requests.Timeout:
+        raise _search_error(_TIMEOUT_MESSAGE, "timeout")
     except Exception as e:
-        return {
-            "summary": f"Erreur Tavily (connexion) : {e}",
-            "sources": [],
-            "images": [],
-        }
+        raise _search_error(f"Erreur Tavily (connexion) : {e}", "connection")
+    finally:
+        elapsed = time.perf_counter() - t0
+        metrics.SEARCH_LATENCY.observe(elapsed, profile=profile)
+        tracing.record("tavily.http", t0, elapsed)
+    metrics.SEARCH_BYTES.inc(len(resp.content), profile=profile)
 
+    with tracing.span("tavily.decode"):
+        return _decode(resp)
+
+
+def _decode(resp) -> dict:
+    """Vérifie le code HTTP et décode le JSON (réponse requests ou aiohttp)."""
     # 2) Code HTTP pas 200
     if resp.status_code != 200:
         try:
             data = resp.json()
         except Exception:
             data = resp.text
-        return {
-            "summary": f"Erreur Tavily {resp.status_code} : {data}",
-            "sources": [],
-            "images": [],
-        }
+        raise _search_error(f"Erreur Tavily {resp.status_code} : {data}", "http", resp.status_code)
 
     # 3) Décodage JSON
     try:
-        data = resp.json()
+        return resp.json()
     except Exception as e:
-        return {
-            "summary": f"Erreur Tavily (JSON) : {e}",
-            "sources": [],
-            "images": [],
-        }
+        raise _search_error(f"Erreur Tavily (JSON) : {e}", "json")
+
 
+def _dedupe_urls(urls: list[str]) -> list[str]:
+    """Sans doublons (ordre gardé) ; deux URLs qui ne diffèrent que par le #fragment sont la même image."""
+    seen = set()
+    out = []
+    for url in urls:
+        url = url.strip()
+        key = url.split("#", 1)[0]
+        if url and key not in seen:
+            seen.add(key)
+            out.append(url)
+    return out
+
+
+def _parse_response(data: dict, profile: str = PROFILE_FULL) -> dict:
+    """Extrait résumé, sources et images de la réponse Tavily (seulement ce que le profil affiche)."""
     answer = data.get("answer")
     results = data.get("results") or []
+    options = PROFILES[profile]
+    with_images = options["include_images"]
 
     sources: list[dict] = []
     images: list[str] = []
 
     # 🔹 images globales (top-level)
-    top_images = data.get("images") or []
+    top_images = (data.get("images") or []) if with_images else []
     for img in top_images:
         if isinstance(img, str):
             images.append(img)
@@ -87,19 +413,21 @@ def search_web(query: str) -> dict:
             images.append(img["url"])
 
     # 🔹 sources + images dans chaque résultat
-    for r in results:
+    for r in results[:options["max_results"]]:
         url = r.get("url")
         title = r.get("title") or url or "Lien"
         if url:
             sources.append({"title": title, "url": url})
 
-        imgs = r.get("images") or []
+        imgs = (r.get("images") or []) if with_images else []
         for img in imgs:
             if isinstance(img, str):
                 images.append(img)
             elif isinstance(img, dict) and "url" in img:
                 images.append(img["url"])
 
+    images = _dedupe_urls(images)
+
     summary = None
     if isinstance(answer, str) and answer.strip():
         summary = _clean(answer)
@@ -121,3 +449,405 @@ def search_web(query: str) -> dict:
         "sources": sources,
         "images": images,
     }
+
+
+# --------- VERSION ASYNCHRONE (asgi.py) ---------
+# Session aiohttp partagée, créée à la demande : aiohttp n'est nécessaire
+# que pour le mode ASGI, pas pour l'appli Tk ni pour Flask.
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("BOTY_ASYNC_MAX_CONNECTIONS", "1000"))
+
+_async_session = None
+
+
+def _get_async_session():
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        import aiohttp
+
+        _async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=SEARCH_TIMEOUT),
+        )
+    return _async_session
+
+
+async def warm_up_async() -> None:
+    """Pré-connexion de la session aiohttp (équivalent asynchrone de warm_up)."""
+    parts = urlsplit(TAVILY_ENDPOINT)
+    try:
+        async with _get_async_session().head(f"{parts.scheme}://{parts.netloc}/"):
+            pass
+    except Exception:
+        pass
+
+
+async def aclose_async_session() -> None:
+    """Ferme la session aiohttp (à appeler à l'arrêt du serveur ASGI)."""
+    global _async_session
+    if _async_session is not None:
+        await _async_session.close()
+        _async_session = None
+
+
+class _AsyncResponse:
+    """Réponse déjà lue, avec la même interface que requests (pour _decode)."""
+
+    def __init__(self, status_code: int, body: bytes):
+        self.status_code = status_code
+        self._body = body
+
+    @property
+    def text(self) -> str:
+        return self._body.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self._body)
+
+
+async def _fetch_async(query: str, options: dict, profile: str = PROFILE_FULL) -> dict:
+    if not breaker.allow():
+        raise _circuit_error()
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        with metrics.SEARCH_IN_FLIGHT.track():
+            data = await _post_async(query, options, profile)
+        ok = True
+        return data
+    except SearchError as e:
+        ok = not _is_outage(e)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        breaker.record(ok, elapsed)
+        metrics.SEARCH_LATENCY.observe(elapsed, profile=profile)
+        tracing.record("tavily.http", t0, elapsed)
+
+
+async def _post_async(query: str, options: dict, profile: str) -> dict:
+    payload = {"api_key": TAVILY_API_KEY, "query": query, **options}
+    session = _get_async_session()
+    last_error = None
+    # mêmes règles que la version synchrone : on ne rejoue que la connexion
+    for attempt in range(HTTP_CONNECT_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(HTTP_BACKOFF * (2 ** (attempt - 1)))
+        try:
+            async with session.post(TAVILY_ENDPOINT, json=payload) as resp:
+                body = await resp.read()
+            metrics.SEARCH_BYTES.inc(len(body), profile=profile)
+            return _decode(_AsyncResponse(resp.status, body))
+        except SearchError:
+            raise
+        except Exception as e:
+            last_error = e
+            if not _is_connect_error(e):
+                break
+    if isinstance(last_error, asyncio.TimeoutError):
+        raise _search_error(_TIMEOUT_MESSAGE, "timeout")
+    raise _search_error(f"Erreur Tavily (connexion) : {last_error}", "connection")
+
+
+def _is_connect_error(e: Exception) -> bool:
+    import aiohttp
+
+    return isinstance(e, aiohttp.ClientConnectorError)
+
+
+class _AsyncSearch:
+    """Version asyncio de _Search (une seule boucle : pas de verrou)."""
+
+    def __init__(self, key: str, query: str, options: dict, profile: str):
+        self.key = key
+        self.query = query
+        self.options = options
+        self.profile = profile
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.attempts = 0
+        self.failures = 0
+        # garde une référence aux tâches en cours (sinon elles peuvent être ramassées)
+        self._tasks: set = set()
+
+    def launch(self):
+        self.attempts += 1
+        task = asyncio.ensure_future(self._attempt(self.attempts))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def hedge(self):
+        if not self.future.done() and self.attempts == 1 and _claim_hedge():
+            self.launch()
+
+    async def _attempt(self, n: int):
+        t0 = time.perf_counter()
+        try:
+            data = await _fetch_async(self.query, self.options, self.profile)
+            with tracing.span("tavily.parse"):
+                result = _parse_response(data, self.profile)
+        except asyncio.CancelledError:
+            # tâche annulée (arrêt de la boucle...) : les requêtes en attente ne doivent pas attendre leur budget
+            self._fail(SearchError("Erreur Tavily : recherche interrompue.", "cancelled"))
+            raise
+        except Exception as e:
+            self._fail(e)
+            return
+        _latencies.add(time.perf_counter() - t0)
+        if self.future.done():
+            return
+        result["freshness"] = FRESH
+        cache.set(self.key, result)
+        self.future.set_result((result, n > 1))
+        if n > 1:
+            metrics.SEARCH_HEDGES.inc(result="won")
+
+    def _fail(self, e: BaseException):
+        """Un essai a échoué ; le dernier en échec transmet l'erreur aux requêtes en attente."""
+        self.failures += 1
+        if self.failures == self.attempts and not self.future.done():
+            self.future.set_exception(e)
+            self.future.exception()  # pas d'avertissement si plus personne n'attend
+
+
+_async_searches: dict[str, _AsyncSearch] = {}
+
+
+def _join_search_async(key: str, query: str, options: dict, profile: str) -> tuple[_AsyncSearch, bool]:
+    search = _async_searches.get(key)
+    # (un appel resté sur une boucle asyncio déjà fermée ne compte pas)
+    if search is not None and search.future.get_loop() is asyncio.get_running_loop():
+        return search, False
+    search = _async_searches[key] = _AsyncSearch(key, query, options, profile)
+    search.future.add_done_callback(lambda _: _async_searches.pop(key, None))
+    _count_search()
+    search.launch()
+    return search, True
+
+
+async def _wait_async(search: _AsyncSearch, leader: bool, deadline: float) -> tuple[dict, bool]:
+    remaining = deadline - time.monotonic()
+    if leader:
+        delay = _hedge_delay()
+        if delay is not None and delay < remaining:
+            try:
+                return await asyncio.wait_for(asyncio.shield(search.future), delay)
+            except asyncio.TimeoutError:
+                search.hedge()
+            remaining = deadline - time.monotonic()
+    else:
+        remaining = min(remaining, SINGLEFLIGHT_WAIT)
+    # shield : abandonner l'attente n'annule pas l'appel (il remplira le cache)
+    return await asyncio.wait_for(asyncio.shield(search.future), max(0.0, remaining))
+
+
+async def search_web_async(query: str, lookup: bool = True, profile: str = PROFILE_FULL,
+                           deadline: Optional[float] = None) -> dict:
+    """Comme search_web, sans bloquer de thread (même cache, même format de retour)."""
+    if not TAVILY_API_KEY.strip():
+        metrics.SEARCH_ERRORS.inc(kind="config", status="")
+        return _error_result("Erreur Tavily : aucune clé API configurée.")
+
+    options = _build_options(profile)
+    key = _cache_key(query, options)
+    if lookup:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if deadline is None:
+        deadline = time.monotonic() + SEARCH_DEADLINE
+    search, leader = _join_search_async(key, query, options, profile)
+    try:
+        result, hedged = await _wait_async(search, leader, deadline)
+    except SearchError as e:
+        return _fallback(key, str(e))
+    except asyncio.TimeoutError:
+        # délai de cette requête, pas un échec de Tavily : compté dans SEARCH_ANSWERS (stale / error)
+        return _fallback(key, _TIMEOUT_MESSAGE)
+    return _answer(result, hedged)
+
+
+def _answer(result: dict, hedged: bool) -> dict:
+    if hedged:
+        metrics.SEARCH_ANSWERS.inc(freshness=HEDGED)
+        return {**result, "freshness": HEDGED}
+    metrics.SEARCH_ANSWERS.inc(freshness=FRESH)
+    return result
+
+
+def _fallback(key: str, summary: str) -> dict:
+    """Pas de réponse à temps (ou une erreur) : la dernière réponse connue, même expirée, sinon l'erreur."""
+    stale = cache.get_stale(key)
+    if stale is not None:
+        metrics.SEARCH_ANSWERS.inc(freshness=STALE)
+        return {**stale, "freshness": STALE}
+    metrics.SEARCH_ANSWERS.inc(freshness="error")
+    return _error_result(summary)
+
+
+def cache_stats() -> dict:
+    """Compteurs du cache (hits / misses / évictions...) pour le dimensionner."""
+    with _hedge_lock:
+        searches = {"started": _started, "hedged": _hedged}
+    p = _latencies.percentile(HEDGE_PERCENTILE)
+    searches["in_flight"] = len(_searches) + len(_async_searches)
+    searches["hedge_after_ms"] = None if not HEDGE_ENABLED else round((_hedge_delay() or 0) * 1000, 1)
+    searches[f"p{HEDGE_PERCENTILE * 100:g}_ms"] = None if p is None else round(p * 1000, 1)
+    return {**cache.stats(), "near_duplicates": querykey.near_stats(), "searches": searches, "circuit": breaker.stats()}
+
+
+def cached_result(query: str, profile: str = PROFILE_FULL) -> dict | None:
+    """Résultat déjà en cache pour `query` (sans appel réseau), ou None."""
+    return cache.get(_cache_key(query, _build_options(profile)))
+
+
+# --------- VERSION BLOQUANTE ---------
+# Les appels Tavily tournent dans un pool de threads : le thread qui attend peut
+# abandonner à la fin de son budget sans couper l'appel (qui remplira le cache).
+
+_search_pool: ThreadPoolExecutor | None = None
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    if _search_pool is None:
+        with _session_lock:
+            if _search_pool is None:
+                _search_pool = ThreadPoolExecutor(SEARCH_WORKERS, thread_name_prefix="tavily")
+    return _search_pool
+
+
+class _Search:
+    """
+    Un appel Tavily partagé par les requêtes identiques en cours (1 tentative,
+    2 si le hedge part). future : (résultat, le hedge a-t-il gagné ?) ou l'erreur
+    de la dernière tentative en échec.
+    """
+
+    def __init__(self, key: str, query: str, options: dict, profile: str):
+        self.key = key
+        self.query = query
+        self.options = options
+        self.profile = profile
+        self.future: Future = Future()
+        self.attempts = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def launch(self):
+        with self._lock:
+            self.attempts += 1
+            n = self.attempts
+        # le contexte (trace en cours) suit l'appel dans le thread du pool
+        _get_search_pool().submit(contextvars.copy_context().run, self._attempt, n)
+
+    def hedge(self):
+        with self._lock:
+            if self.future.done() or self.attempts > 1:
+                return
+        if _claim_hedge():
+            self.launch()
+
+    def _attempt(self, n: int):
+        t0 = time.perf_counter()
+        try:
+            data = _fetch(self.query, self.options, self.profile)
+            with tracing.span("tavily.parse"):
+                result = _parse_response(data, self.profile)
+        except BaseException as e:
+            with self._lock:
+                self.failures += 1
+                if self.failures == self.attempts and not self.future.done():
+                    self.future.set_exception(e)
+            return
+        _latencies.add(time.perf_counter() - t0)
+        result["freshness"] = FRESH
+        with self._lock:
+            if self.future.done():
+                return
+            cache.set(self.key, result)
+            self.future.set_result((result, n > 1))
+        if n > 1:
+            metrics.SEARCH_HEDGES.inc(result="won")
+
+
+_searches: dict[str, _Search] = {}
+_searches_lock = threading.Lock()
+
+
+def _join_search(key: str, query: str, options: dict, profile: str) -> tuple[_Search, bool]:
+    """L'appel en cours pour `key`, ou un nouveau ; True si c'est nous qui l'avons lancé."""
+    with _searches_lock:
+        search = _searches.get(key)
+        if search is not None:
+            return search, False
+        search = _searches[key] = _Search(key, query, options, profile)
+
+    def _forget(_):
+        with _searches_lock:
+            if _searches.get(key) is search:
+                del _searches[key]
+
+    search.future.add_done_callback(_forget)
+    _count_search()
+    search.launch()
+    return search, True
+
+
+def _wait(search: _Search, leader: bool, deadline: float) -> tuple[dict, bool]:
+    """Résultat de l'appel, attendu jusqu'à `deadline` (time.monotonic()) ; seul le leader lance le hedge."""
+    remaining = deadline - time.monotonic()
+    if leader:
+        delay = _hedge_delay()
+        if delay is not None and delay < remaining:
+            try:
+                return search.future.result(timeout=delay)
+            except FutureTimeout:
+                search.hedge()
+            remaining = deadline - time.monotonic()
+    else:
+        remaining = min(remaining, SINGLEFLIGHT_WAIT)
+    return search.future.result(timeout=max(0.0, remaining))
+
+
+def search_web(query: str, lookup: bool = True, profile: str = PROFILE_FULL,
+               deadline: Optional[float] = None) -> dict:
+    """
+    Appelle Tavily directement via HTTP avec un timeout
+    et renvoie un dict :
+    {
+      "summary": "texte résumé",
+      "sources": [{"title": ..., "url": ...}, ...],
+      "images": ["url_image1", "url_image2", ...],
+      "freshness": "fresh" | "hedged" | "stale"   (absent pour une erreur)
+    }
+    Les réponses réussies sont mises en cache (les erreurs jamais), et les
+    requêtes identiques lancées en même temps partagent un seul appel Tavily.
+    lookup=False : le cache a déjà été consulté (cached_result), on ne le relit pas.
+    profile : ce qu'il faut demander à Tavily (PROFILES, voir request_profile) ;
+    chaque profil a ses propres entrées de cache.
+    deadline : instant (time.monotonic()) où il faut répondre, quitte à renvoyer
+    une réponse périmée ; par défaut dans SEARCH_DEADLINE secondes.
+    """
+
+    if not TAVILY_API_KEY.strip():
+        metrics.SEARCH_ERRORS.inc(kind="config", status="")
+        return _error_result("Erreur Tavily : aucune clé API configurée.")
+
+    options = _build_options(profile)
+    key = _cache_key(query, options)
+    if lookup:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if deadline is None:
+        deadline = time.monotonic() + SEARCH_DEADLINE
+    search, leader = _join_search(key, query, options, profile)
+    try:
+        result, hedged = _wait(search, leader, deadline)
+    except SearchError as e:
+        return _fallback(key, str(e))
+    except (TimeoutError, FutureTimeout):
+        # délai de cette requête, pas un échec de Tavily : compté dans SEARCH_ANSWERS (stale / error)
+        return _fallback(key, _TIMEOUT_MESSAGE)
+    return _answer(result, hedged)